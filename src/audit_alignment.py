@@ -4,9 +4,11 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
+from colcache import read_csv_cached
+
 def load_csv(p):
     p = Path(p); assert p.exists(), f"Introuvable: {p}"
-    return pd.read_csv(p)
+    return read_csv_cached(p)
 
 def sign_series(x: pd.Series) -> pd.Series:
     out = np.where(x > 0, 1, np.where(x < 0, -1, 0))
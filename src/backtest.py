@@ -5,14 +5,17 @@ Les coûts sont bornés à 0 pour éviter un rebate lié à des spreads négatif
 """
 
 from pathlib import Path
+from dataclasses import dataclass
 import argparse
 import pandas as pd
 import numpy as np
 from math import sqrt
 
+from colcache import read_csv_cached, write_csv
+
 def _load_csv(path: str) -> pd.DataFrame:
     p = Path(path); assert p.exists(), f"Introuvable: {p}"
-    return pd.read_csv(p)
+    return read_csv_cached(p)
 
 def _pick_signal_col(df_sig: pd.DataFrame) -> str:
     if "signal_candle" in df_sig.columns: return "signal_candle"
@@ -27,10 +30,17 @@ def _merge_align(df_c, df_s, df_m, sig_col, signal_lag):
         out = out.merge(df_m[["t0","mid","spread"]], on="t0", how="left")
     return out
 
-def run_bt(candles_csv, signals_csv, out_csv, horizon, fees_bp=0.5, micro_csv=None, signal_lag=1):
+def run_bt(candles_csv, signals_csv, out_csv, horizon, fees_bp=0.5, micro_csv=None, signal_lag=1,
+           n_boot=1000, seed=0):
     df_c = _load_csv(candles_csv)
     df_s = _load_csv(signals_csv)
     df_m = _load_csv(micro_csv) if micro_csv and Path(micro_csv).exists() else None
+    res, stats = run_bt_df(df_c, df_s, df_m, horizon, fees_bp, signal_lag, n_boot, seed)
+    write_csv(res, out_csv)
+    return stats
+
+def run_bt_df(df_c, df_s, df_m=None, horizon=3, fees_bp=0.5, signal_lag=1, n_boot=1000, seed=0):
+    """Version DataFrame de run_bt: retourne (lignes du backtest, stats)."""
     for c in ("t0","open","close"): assert c in df_c.columns
 
     sig_col = _pick_signal_col(df_s)
@@ -64,8 +74,64 @@ def run_bt(candles_csv, signals_csv, out_csv, horizon, fees_bp=0.5, micro_csv=No
     })
     res["fut_sign"] = np.sign(res["fut_ret"]).astype(int)
     res = res.loc[exit_px.notna()]
-    res.to_csv(out_csv, index=False)
+    return res, bt_stats(res, n_boot, seed=seed)
+
+CI_KEYS = ("hit_rate_lo", "hit_rate_hi", "sharpe_like_lo", "sharpe_like_hi")
+
+def block_bootstrap(ret, n_boot: int = 1000, block: int | None = None, alpha: float = 0.05,
+                    seed: int | None = 0, max_cells: int = 4_000_000) -> dict:
+    """
+    Intervalles de confiance (percentiles) de hit_rate et sharpe_like par bootstrap par
+    blocs mobiles sur les rendements nets des trades, dans l'ordre chronologique.
+    Chaque rééchantillon est une ligne d'une matrice (n_boot x n_blocs) d'indices de
+    début de bloc (`block` trades consécutifs, défaut n^(1/3)); les sommes par bloc
+    viennent de sommes cumulées, sans matérialiser les n_boot x n valeurs.
+    Même graine -> mêmes intervalles.
+    """
+    r = np.asarray(ret, dtype=float)
+    n = len(r)
+    if n < 2 or n_boot <= 0:
+        return dict.fromkeys(CI_KEYS)
+    block = int(min(n, block or max(1, round(n ** (1/3)))))
+    n_blocks = -(-n // block)
+    lens = np.full(n_blocks, block)
+    lens[-1] = n - (n_blocks - 1) * block  # dernier bloc tronqué à n valeurs au total
+    mu = r.mean()
+    c = r - mu  # centré: variance par sommes sans perte de précision
+    cs = np.concatenate([[0.0], np.cumsum(c)])
+    cq = np.concatenate([[0.0], np.cumsum(c * c)])
+    cp = np.concatenate([[0], np.cumsum(r > 0)])
+    rng = np.random.default_rng(seed)
+    hits, sharpes = [], []
+    step = max(1, max_cells // n_blocks)
+    for i in range(0, n_boot, step):
+        m = min(step, n_boot - i)
+        starts = rng.integers(0, n - block + 1, size=(m, n_blocks))
+        ends = starts + lens
+        s1 = (cs[ends] - cs[starts]).sum(axis=1)
+        s2 = (cq[ends] - cq[starts]).sum(axis=1)
+        hits.append((cp[ends] - cp[starts]).sum(axis=1) / n)
+        var = np.maximum(s2 - s1 * s1 / n, 0.0) / (n - 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sharpes.append(np.where(var > 0, (mu + s1 / n) / np.sqrt(var) * np.sqrt(252*24*60), np.nan))
+    q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    hit_lo, hit_hi = np.percentile(np.concatenate(hits), q)
+    sh = np.concatenate(sharpes)
+    sh = sh[~np.isnan(sh)]
+    sh_lo, sh_hi = np.percentile(sh, q) if len(sh) else (None, None)
+    return {
+        "hit_rate_lo": float(hit_lo),
+        "hit_rate_hi": float(hit_hi),
+        "sharpe_like_lo": float(sh_lo) if sh_lo is not None else None,
+        "sharpe_like_hi": float(sh_hi) if sh_hi is not None else None,
+    }
 
+def bt_stats(res: pd.DataFrame, n_boot: int = 1000, block: int | None = None, alpha: float = 0.05,
+             seed: int | None = 0) -> dict:
+    """
+    Stats agrégées des lignes d'un backtest (colonnes signal, ret_net, fut_ret, fut_sign),
+    avec les intervalles bootstrap de block_bootstrap (n_boot=0 pour les omettre).
+    """
     trades = res[res["signal"] != 0]
     n = len(trades)
     hit = (trades["ret_net"] > 0).mean() if n else 0.0
@@ -92,9 +158,128 @@ def run_bt(candles_csv, signals_csv, out_csv, horizon, fees_bp=0.5, micro_csv=No
         "avg_ret": float(avg),
         "sharpe_like": float(sharpe) if sharpe==sharpe else None,
         "dir_hit_rate": float(dir_hit) if dir_hit is not None else None,
+        **block_bootstrap(trades["ret_net"].to_numpy(), n_boot, block, alpha, seed),
         "confusion": {"tp": tp, "tn": tn, "fp": fp, "fn": fn},
     }
 
+@dataclass
+class AlignedBars:
+    """Bougies (+ demi-spread micro) alignées une fois, partagées par tous les signaux évalués."""
+    t0: pd.Series
+    open: np.ndarray
+    close: np.ndarray
+    half_spread: np.ndarray
+
+def align_bars(df_c: pd.DataFrame, df_m: pd.DataFrame | None = None) -> AlignedBars:
+    for c in ("t0","open","close"): assert c in df_c.columns
+    df = df_c[["t0","open","close"]]
+    if df_m is not None:
+        df = df.merge(df_m[["t0","mid","spread"]], on="t0", how="left")
+        half_spread = (pd.to_numeric(df["spread"], errors="coerce") /
+                       pd.to_numeric(df["mid"], errors="coerce") / 2.0).clip(lower=0.0).fillna(0.0)
+    else:
+        half_spread = pd.Series(0.0, index=df.index)
+    return AlignedBars(
+        t0=df["t0"].reset_index(drop=True),
+        open=pd.to_numeric(df["open"], errors="coerce").to_numpy(dtype=float),
+        close=pd.to_numeric(df["close"], errors="coerce").to_numpy(dtype=float),
+        half_spread=half_spread.to_numpy(dtype=float),
+    )
+
+def align_signal(bars: AlignedBars, df_s: pd.DataFrame, sig_col: str | None = None) -> np.ndarray:
+    """Signal (non décalé) sur la grille des bougies, 0 là où il manque."""
+    sig_col = sig_col or _pick_signal_col(df_s)
+    s = pd.DataFrame({"t0": bars.t0}).merge(df_s[["t0", sig_col]], on="t0", how="left")[sig_col]
+    return pd.to_numeric(s, errors="coerce").fillna(0).astype(int).to_numpy()
+
+def bt_grid(bars: AlignedBars, sig, horizons, lags=(1,), fees_bp: float = 0.5,
+            max_cells: int = 4_000_000, n_boot: int = 0, block: int | None = None,
+            alpha: float = 0.05, seed: int | None = 0) -> pd.DataFrame:
+    """
+    Stats de run_bt_df pour toutes les paires (horizon, signal_lag) en une passe.
+    Pour chaque lag, seules les lignes en position sont gardées et les horizons sont
+    traités en matrices (horizons x trades), par blocs de max_cells cellules.
+    Mêmes règles que run_bt_df (à l'arrondi des sommes près). Avec n_boot > 0, ajoute
+    les intervalles bootstrap (CI_KEYS) de chaque cellule.
+    """
+    horizons = np.array(sorted({int(h) for h in horizons}), dtype=np.int64)
+    lags = np.array(sorted({int(l) for l in lags}), dtype=np.int64)
+    assert len(horizons) and horizons.min() >= 1, "horizons doivent etre >= 1"
+    assert len(lags) and lags.min() >= 0, "lags doivent etre >= 0"
+    sig = np.asarray(sig, dtype=np.int64)
+    n = len(bars.close)
+    assert len(sig) == n, "signal non aligné sur les bougies"
+
+    out = []
+    for lag in lags:
+        shifted = np.zeros(n, dtype=np.int64)
+        if lag < n:
+            shifted[lag:] = sig[:n - lag]
+        idx = np.flatnonzero(shifted)
+        s = shifted[idx][None, :]
+        entry = bars.open[idx][None, :]
+        cost = np.abs(s) * (fees_bp * 1e-4 + bars.half_spread[idx][None, :])
+        step = max(1, max_cells // max(len(idx), 1))
+        for j in range(0, len(horizons), step):
+            hs = horizons[j:j + step]
+            ex = idx[None, :] + hs[:, None]
+            exit_px = bars.close[np.minimum(ex, n - 1)] if n else np.zeros(ex.shape)
+            kept = (ex < n) & ~np.isnan(exit_px)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fut = np.where(kept, (exit_px - entry) / entry, 0.0)
+            # open manquant: comme run_bt_df, trade compté avec un rendement net nul (pas de coût)
+            priced = ~np.isnan(fut)
+            fut = np.where(priced, fut, 0.0)
+            net = np.where(kept & priced, s * fut - cost, 0.0)
+
+            cnt = kept.sum(axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                avg = np.where(cnt > 0, net.sum(axis=1) / cnt, 0.0)
+                hit = np.where(cnt > 0, ((net > 0) & kept).sum(axis=1) / cnt, 0.0)
+                dev = np.where(kept, net - avg[:, None], 0.0)
+                std = np.where(cnt > 1, np.sqrt((dev * dev).sum(axis=1) / (cnt - 1)), np.nan)
+                sharpe = np.where(std > 0, avg / std * np.sqrt(252*24*60), np.nan)
+                fut_sign = np.sign(fut)
+                valid = kept & (fut_sign != 0)
+                n_valid = valid.sum(axis=1)
+                dir_hit = np.where(n_valid > 0, ((np.sign(s) == fut_sign) & valid).sum(axis=1) / n_valid, np.nan)
+            part = pd.DataFrame({
+                "horizon": hs,
+                "signal_lag": lag,
+                "n_trades": cnt,
+                "hit_rate": hit,
+                "avg_ret": avg,
+                "sharpe_like": sharpe,
+                "dir_hit_rate": dir_hit,
+                "tp": (kept & (s == 1) & (fut > 0)).sum(axis=1),
+                "tn": (kept & (s == -1) & (fut < 0)).sum(axis=1),
+                "fp": (kept & (s == 1) & (fut <= 0)).sum(axis=1),
+                "fn": (kept & (s == -1) & (fut >= 0)).sum(axis=1),
+            })
+            if n_boot > 0:
+                ci = [block_bootstrap(net[r][kept[r]], n_boot, block, alpha, seed) for r in range(len(hs))]
+                part = part.join(pd.DataFrame(ci, columns=list(CI_KEYS), dtype=float))
+            out.append(part)
+    return pd.concat(out, ignore_index=True)
+
+def run_bt_grid(candles_csv, signals_csv, out_csv, horizons, lags=(1,), fees_bp=0.5, micro_csv=None,
+                n_boot=0, seed=0):
+    """Grille horizon x lag depuis les CSV (une lecture, un alignement)."""
+    df_m = _load_csv(micro_csv) if micro_csv and Path(micro_csv).exists() else None
+    bars = align_bars(_load_csv(candles_csv), df_m)
+    grid = bt_grid(bars, align_signal(bars, _load_csv(signals_csv)), horizons, lags, fees_bp,
+                   n_boot=n_boot, seed=seed)
+    write_csv(grid, out_csv)
+    return grid
+
+def _int_list(spec: str) -> list:
+    """'1-60', '1,3,5' ou un mélange -> liste d'entiers."""
+    vals = []
+    for part in filter(None, (x.strip() for x in spec.split(","))):
+        a, _, b = part.partition("-")
+        vals += list(range(int(a), int(b) + 1)) if b else [int(a)]
+    return vals
+
 def _args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--candles", required=True)
@@ -104,11 +289,24 @@ def _args():
     ap.add_argument("--fees_bp", type=float, default=0.5)
     ap.add_argument("--micro", default=None)
     ap.add_argument("--signal_lag", type=int, default=1)
+    ap.add_argument("--horizons", default=None, help="Grille: horizons, ex. 1-60 (--out reçoit la grille)")
+    ap.add_argument("--lags", default=None, help="Grille: lags, ex. 0-5 (défaut: --signal_lag)")
+    ap.add_argument("--n_boot", type=int, default=None,
+                    help="Rééchantillons bootstrap des IC (défaut: 1000, 0 en mode grille)")
+    ap.add_argument("--seed", type=int, default=0, help="Graine du bootstrap")
     return ap.parse_args()
 
 def main():
     a = _args()
-    stats = run_bt(a.candles, a.signals, a.out, a.h, a.fees_bp, a.micro, a.signal_lag)
+    if a.horizons or a.lags:
+        horizons = _int_list(a.horizons) if a.horizons else [a.h]
+        lags = _int_list(a.lags) if a.lags else [a.signal_lag]
+        grid = run_bt_grid(a.candles, a.signals, a.out, horizons, lags, a.fees_bp, a.micro,
+                           a.n_boot or 0, a.seed)
+        print(grid.to_string(index=False))
+        return
+    n_boot = 1000 if a.n_boot is None else a.n_boot
+    stats = run_bt(a.candles, a.signals, a.out, a.h, a.fees_bp, a.micro, a.signal_lag, n_boot, a.seed)
     print(stats)
 
 if __name__ == "__main__":
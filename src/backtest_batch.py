@@ -0,0 +1,107 @@
+# src/backtest_batch.py
+"""
+Backtest groupé de nombreux signaux sur les mêmes bougies.
+Les bougies (+ micro) sont chargées et alignées une seule fois. Chaque source de
+signal (CSV, DataFrame ou tableau déjà aligné) est ramenée sur cette grille puis
+évaluée par bt_grid, en parallèle sur un pool de processus qui reçoit les bougies
+alignées une fois par processus. Sortie: une table unique, une ligne par
+source x horizon x lag, avec les intervalles bootstrap de hit_rate et sharpe_like.
+
+Exécution:
+  python src/backtest_batch.py --candles data/btc_usd_5s_lbl.csv --micro data/btc_usd_micro_5s.csv \
+      --signals data/btc_usd_5s_sig_*.csv --out data/btc_usd_5s_batch.csv --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest import AlignedBars, _int_list, _load_csv, align_bars, align_signal, bt_grid
+from colcache import write_csv
+
+_BARS: Optional[AlignedBars] = None  # bougies alignées du processus worker
+
+def _init_worker(bars: AlignedBars) -> None:
+    global _BARS
+    _BARS = bars
+
+def _resolve(bars: AlignedBars, source, sig_col: Optional[str]) -> np.ndarray:
+    if isinstance(source, (str, Path)):
+        return align_signal(bars, _load_csv(source), sig_col)
+    if isinstance(source, pd.DataFrame):
+        return align_signal(bars, source, sig_col)
+    sig = np.asarray(source)
+    assert len(sig) == len(bars.close), "signal non aligné sur les bougies"
+    return sig
+
+def _score(name: str, source, horizons, lags, fees_bp: float, sig_col: Optional[str],
+           n_boot: int, seed: Optional[int], bars: Optional[AlignedBars] = None) -> pd.DataFrame:
+    bars = _BARS if bars is None else bars
+    grid = bt_grid(bars, _resolve(bars, source, sig_col), horizons, lags, fees_bp,
+                   n_boot=n_boot, seed=seed)
+    grid.insert(0, "source", name)
+    return grid
+
+def run_batch(bars: AlignedBars, sources: dict, horizons=(3,), lags=(1,), fees_bp: float = 0.5,
+              workers: int = 1, sig_col: Optional[str] = None, n_boot: int = 1000,
+              seed: Optional[int] = 0) -> pd.DataFrame:
+    """
+    sources: {nom: chemin CSV | DataFrame (t0 + signal_*) | tableau aligné sur bars}.
+    Retourne la table consolidée dans l'ordre des sources. Toutes les sources partagent
+    la graine du bootstrap (n_boot=0 pour omettre les intervalles).
+    """
+    assert sources, "Aucune source de signal"
+    names = list(sources)
+    if workers <= 1 or len(names) == 1:
+        parts = [_score(n, sources[n], horizons, lags, fees_bp, sig_col, n_boot, seed, bars) for n in names]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(bars,)) as pool:
+            futs = [pool.submit(_score, n, sources[n], horizons, lags, fees_bp, sig_col, n_boot, seed)
+                    for n in names]
+            parts = [f.result() for f in futs]
+    return pd.concat(parts, ignore_index=True)
+
+def run_batch_csv(candles_csv: str, signal_csvs, out_csv: str, horizons=(3,), lags=(1,),
+                  fees_bp: float = 0.5, micro_csv: Optional[str] = None, workers: int = 1,
+                  sig_col: Optional[str] = None, n_boot: int = 1000, seed: Optional[int] = 0) -> pd.DataFrame:
+    df_m = _load_csv(micro_csv) if micro_csv and Path(micro_csv).exists() else None
+    bars = align_bars(_load_csv(candles_csv), df_m)
+    res = run_batch(bars, {str(p): str(p) for p in signal_csvs}, horizons, lags, fees_bp, workers, sig_col,
+                    n_boot, seed)
+    write_csv(res, out_csv)
+    return res
+
+def _args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--candles", required=True)
+    ap.add_argument("--signals", nargs="+", required=True, help="CSV de signaux (t0 + signal_*)")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--micro", default=None)
+    ap.add_argument("--h", type=int, default=3)
+    ap.add_argument("--signal_lag", type=int, default=1)
+    ap.add_argument("--horizons", default=None, help="ex. 1-60 (défaut: --h)")
+    ap.add_argument("--lags", default=None, help="ex. 0-5 (défaut: --signal_lag)")
+    ap.add_argument("--fees_bp", type=float, default=0.5)
+    ap.add_argument("--sig_col", default=None, help="Colonne de signal (défaut: signal_candle puis signal_micro)")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--n_boot", type=int, default=1000, help="Rééchantillons bootstrap (0: sans IC)")
+    ap.add_argument("--seed", type=int, default=0)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    horizons = _int_list(a.horizons) if a.horizons else [a.h]
+    lags = _int_list(a.lags) if a.lags else [a.signal_lag]
+    res = run_batch_csv(a.candles, a.signals, a.out, horizons, lags, a.fees_bp, a.micro, a.workers, a.sig_col,
+                        a.n_boot, a.seed)
+    print(f"[batch] {len(a.signals)} sources x {len(horizons)} horizons x {len(lags)} lags -> {a.out}")
+    print(res.to_string(index=False, max_rows=40))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# src/bench.py
+"""
+Micro-benchmarks des noyaux vectorisés (données synthétiques, aucune I/O).
+
+Exécution:
+  python src/bench.py ohlcv --n 2000000 --dt 5
+  python src/bench.py patterns --n 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from candles import ohlcv_from_arrays
+from patterns_candles import compute_pattern_indicators, pattern_kernel
+from windows import rolling_mean
+
+def _timeit(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def _synthetic_trades(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ts_ns = 1_700_000_000_000_000_000 + np.cumsum(rng.exponential(0.4e9, n)).astype(np.int64)
+    price = np.round(65000 * np.exp(np.cumsum(rng.normal(0, 2e-5, n))), 1)
+    qty = np.round(rng.exponential(0.05, n), 8)
+    side = rng.choice(np.array(["buy", "sell"]), n)
+    return ts_ns, price, qty, side
+
+def _resample_reference(ts_ns, price, qty, dt_sec):
+    # ancienne implémentation de aggregate_trades_df: six passes resample
+    o = pd.DataFrame({"price": price, "volume": qty},
+                     index=pd.to_datetime(ts_ns, unit="ns", utc=True))
+    rule = f"{dt_sec}s"
+    agg = pd.DataFrame({
+        "open": o["price"].resample(rule).first(),
+        "high": o["price"].resample(rule).max(),
+        "low": o["price"].resample(rule).min(),
+        "close": o["price"].resample(rule).last(),
+        "volume": o["volume"].resample(rule).sum(),
+    })
+    agg["quote_volume"] = (o["price"] * o["volume"]).resample(rule).sum()
+    return agg.dropna(subset=["open", "high", "low", "close"])
+
+def bench_ohlcv(n: int, dt_sec: int) -> None:
+    ts_ns, price, qty, side = _synthetic_trades(n)
+    ref = _resample_reference(ts_ns, price, qty, dt_sec)
+    res = ohlcv_from_arrays(ts_ns, price, qty, dt_sec)
+    for c in ("open", "high", "low", "close", "volume", "quote_volume"):
+        assert np.allclose(ref[c].to_numpy(), res[c], rtol=1e-12), f"Ecart sur {c}"
+
+    t_ref = _timeit(lambda: _resample_reference(ts_ns, price, qty, dt_sec))
+    t_new = _timeit(lambda: ohlcv_from_arrays(ts_ns, price, qty, dt_sec))
+    t_flow = _timeit(lambda: ohlcv_from_arrays(ts_ns, price, qty, dt_sec, side=side))
+    print(f"[bench ohlcv] n={n} dt={dt_sec}s candles={len(ref)}")
+    print(f"  resample x6          : {t_ref*1e3:8.1f} ms")
+    print(f"  ohlcv_from_arrays    : {t_new*1e3:8.1f} ms  (x{t_ref/t_new:.1f})")
+    print(f"  + vwap/n/side volume : {t_flow*1e3:8.1f} ms")
+
+def _synthetic_candles(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = np.round(65000 * np.exp(np.cumsum(rng.normal(0, 1e-3, n))), 1)
+    open_ = np.round(np.concatenate(([close[0]], close[:-1])) * (1 + rng.normal(0, 2e-4, n)), 1)
+    wick = np.round(np.abs(rng.normal(0, 30, (2, n))), 1) * (rng.random((2, n)) < 0.9)
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + wick[0],
+                         "low": np.minimum(open_, close) - wick[1], "close": close})
+
+def _patterns_reference(df: pd.DataFrame) -> pd.DataFrame:
+    # ancienne implémentation de compute_pattern_indicators: trois détecteurs sur Series décalées
+    o, c, h, l = df["open"], df["close"], df["high"], df["low"]
+    body = c - o
+    prev_o, prev_c = o.shift(1), c.shift(1)
+    prevbody = prev_c - prev_o
+    bull = (body > 0) & (prevbody < 0) & (o <= prev_c) & (c >= prev_o)
+    bear = (body < 0) & (prevbody > 0) & (o >= prev_c) & (c <= prev_o)
+    s_engulf = pd.Series(np.where(bull, 1, np.where(bear, -1, 0)), index=df.index, dtype="int8")
+
+    size = (c - o).abs()
+    rng = (h - l).replace(0, np.nan)
+    body_top = pd.concat([o, c], axis=1).max(axis=1)
+    body_bot = pd.concat([o, c], axis=1).min(axis=1)
+    lower_w, upper_w = body_bot - l, h - body_top
+    is_hammer = (lower_w > 2 * size) & (upper_w < size) & (size / rng < 0.4)
+    is_star = (upper_w > 2 * size) & (lower_w < size) & (size / rng < 0.4)
+    s_hammer_like = pd.Series(np.where(is_hammer, 1, np.where(is_star, -1, 0)), index=df.index, dtype="int8")
+
+    inside = (h < h.shift(1)) & (l > l.shift(1))
+    s_inside = pd.Series(np.where(inside, 0, 0), index=df.index, dtype="int8")
+    inside_mask = (h < h.shift(1)) & (l > l.shift(1))
+
+    indicators = pd.DataFrame(index=df.index)
+    primary_signal = (s_engulf + s_hammer_like + s_inside).clip(-1, 1).astype("int8")
+    returns = c.pct_change()
+    abs_ret = returns.abs()
+    rolling_vol = rolling_mean(abs_ret, 20, min_periods=5)
+    dynamic_eps = ((rolling_vol * 0.75)
+                   .fillna(abs_ret.rolling(window=10, min_periods=1).median())
+                   .clip(lower=1e-4, upper=8e-3))
+    returns = returns.fillna(0.0)
+    dynamic_eps = dynamic_eps.fillna(2e-4)
+    mom_signal = np.where(returns > dynamic_eps, 1, np.where(returns < -dynamic_eps, -1, 0)).astype("int8")
+    signal = primary_signal.copy()
+    neutral_mask = signal == 0
+    signal.loc[neutral_mask] = mom_signal[neutral_mask]
+
+    indicators["signal_candle"] = signal.astype("int8")
+    indicators["engulfing"] = s_engulf.astype("int8")
+    indicators["hammer"] = (s_hammer_like == 1).astype("int8")
+    indicators["shooting_star"] = (s_hammer_like == -1).astype("int8")
+    indicators["inside_bar"] = inside_mask.fillna(False).astype("int8")
+    indicators["ret_pct"] = returns.astype("float32")
+    indicators["mom_threshold"] = dynamic_eps.astype("float32")
+    indicators["mom_signal"] = mom_signal.astype("int8")
+    return indicators
+
+def bench_patterns(n: int) -> None:
+    df = _synthetic_candles(n)
+    ref = _patterns_reference(df)
+    pd.testing.assert_frame_equal(compute_pattern_indicators(df), ref)
+    cols = [df[c].to_numpy() for c in ("open", "high", "low", "close")]
+
+    t_ref = _timeit(lambda: _patterns_reference(df))
+    t_new = _timeit(lambda: compute_pattern_indicators(df))
+    t_kernel = _timeit(lambda: pattern_kernel(*cols))
+    t_vol = _timeit(lambda: rolling_mean(ref["ret_pct"], 20, min_periods=5))
+    print(f"[bench patterns] n={n} signaux non nuls={int((ref['signal_candle'] != 0).sum())}")
+    print(f"  détecteurs pandas          : {t_ref*1e3:8.1f} ms")
+    print(f"  compute_pattern_indicators : {t_new*1e3:8.1f} ms  (x{t_ref/t_new:.1f})")
+    print(f"  pattern_kernel (tableaux)  : {t_kernel*1e3:8.1f} ms  (dont vol glissante {t_vol*1e3:.1f} ms)")
+
+def _args():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("ohlcv", help="ohlcv_from_arrays vs resample")
+    b.add_argument("--n", type=int, default=2_000_000)
+    b.add_argument("--dt", type=int, default=5)
+    b = sub.add_parser("patterns", help="pattern_kernel vs détecteurs pandas")
+    b.add_argument("--n", type=int, default=1_000_000)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    if a.cmd == "ohlcv":
+        bench_ohlcv(a.n, a.dt)
+    elif a.cmd == "patterns":
+        bench_patterns(a.n)
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,105 @@ import pandas as pd
 import numpy as np
 from pandas.api.types import is_numeric_dtype
 
-def aggregate_trades_df(df: pd.DataFrame, dt_sec: int) -> pd.DataFrame:
+if __package__:  # importé par le serveur (src.candles) ou lancé en script
+    from .colcache import read_csv_cached
+else:
+    from colcache import read_csv_cached
+
+def _to_utc(ts: pd.Series) -> pd.Series:
+    """ISO strings or numeric epochs (s / ms / ns) -> tz-aware UTC datetimes."""
+    if is_numeric_dtype(ts):
+        ts = ts.astype("int64")
+        unit = "s"
+        if (ts > 1e15).any():
+            unit = "ns"
+        elif (ts > 1e12).any():
+            unit = "ms"
+        return pd.to_datetime(ts, unit=unit, utc=True, errors="coerce")
+    return pd.to_datetime(ts, utc=True, errors="coerce")
+
+CANDLE_COLUMNS = ["t0", "open", "high", "low", "close", "volume", "quote_volume"]
+FLOW_COLUMNS = ["vwap", "n_trades", "buy_volume", "sell_volume", "signed_volume"]
+
+def _side_sign(side) -> np.ndarray:
+    """'buy'/'sell' strings or numeric signs -> int8 array in {-1, 0, 1}."""
+    side = np.asarray(side)
+    if side.dtype.kind in "iuf":
+        return np.sign(np.nan_to_num(side.astype(float))).astype(np.int8)
+    codes, uniques = pd.factorize(side)
+    lut = np.array([1 if str(u).lower().startswith("b") else -1 if str(u).lower().startswith("s") else 0
+                    for u in uniques] + [0], dtype=np.int8)
+    return lut[codes]  # code -1 (manquant) -> dernier element = 0
+
+def ohlcv_from_arrays(ts_ns, price, qty, dt_sec: int, side=None) -> dict:
+    """
+    Single-pass OHLCV kernel on raw arrays.
+
+    Parameters
+    ----------
+    ts_ns : array-like of int64
+        Trade timestamps in epoch nanoseconds.
+    price, qty : array-like of float
+        Trade price and size (finite values).
+    dt_sec : int
+        Candle length in seconds. Buckets are aligned on the epoch.
+    side : array-like, optional
+        'buy'/'sell' (or +1/-1) aggressor side; enables buy/sell volumes.
+
+    Returns
+    -------
+    dict of np.ndarray
+        t0_ns (bucket start), open, high, low, close, volume, quote_volume, vwap,
+        n_trades and, when side is given, buy_volume, sell_volume, signed_volume.
+        Only non-empty buckets are returned.
+    """
+    assert dt_sec >= 1, "dt_sec doit etre >= 1"
+    ts_ns = np.asarray(ts_ns, dtype=np.int64)
+    price = np.asarray(price, dtype=np.float64)
+    qty = np.asarray(qty, dtype=np.float64)
+    sign = _side_sign(side) if side is not None else None
+    if len(ts_ns) and (np.diff(ts_ns) < 0).any():
+        order = np.argsort(ts_ns, kind="stable")
+        ts_ns, price, qty = ts_ns[order], price[order], qty[order]
+        if sign is not None:
+            sign = sign[order]
+
+    step = np.int64(dt_sec) * np.int64(1_000_000_000)
+    bucket = ts_ns // step
+    if not len(bucket):
+        starts = np.zeros(0, dtype=np.int64)
+    else:
+        starts = np.concatenate(([0], np.flatnonzero(bucket[1:] != bucket[:-1]) + 1))
+    ends = np.append(starts[1:], len(bucket)).astype(np.int64)
+
+    out = {"t0_ns": bucket[starts] * step}
+    if not len(starts):
+        for c in CANDLE_COLUMNS[1:] + FLOW_COLUMNS[:2]:
+            out[c] = np.zeros(0)
+        if sign is not None:
+            for c in FLOW_COLUMNS[2:]:
+                out[c] = np.zeros(0)
+        return out
+
+    notional = price * qty
+    out["open"] = price[starts]
+    out["high"] = np.maximum.reduceat(price, starts)
+    out["low"] = np.minimum.reduceat(price, starts)
+    out["close"] = price[ends - 1]
+    out["volume"] = np.add.reduceat(qty, starts)
+    out["quote_volume"] = np.add.reduceat(notional, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["vwap"] = np.where(out["volume"] > 0, out["quote_volume"] / out["volume"], out["close"])
+    out["n_trades"] = ends - starts
+    if sign is not None:
+        out["buy_volume"] = np.add.reduceat(np.where(sign > 0, qty, 0.0), starts)
+        out["sell_volume"] = np.add.reduceat(np.where(sign < 0, qty, 0.0), starts)
+        out["signed_volume"] = out["buy_volume"] - out["sell_volume"]
+    return out
+
+def aggregate_trades_df(df: pd.DataFrame, dt_sec: int, flow: bool = False) -> pd.DataFrame:
     """
-    Aggregate a DataFrame of trades into OHLCV candles.
+    Aggregate a DataFrame of trades into OHLCV candles (thin wrapper on ohlcv_from_arrays).
 
     Parameters
     ----------
@@ -20,6 +116,8 @@ def aggregate_trades_df(df: pd.DataFrame, dt_sec: int) -> pd.DataFrame:
         ISO strings or numeric epochs (s / ms / ns).
     dt_sec : int
         Candle length in seconds.
+    flow : bool
+        Also return vwap, n_trades and, if a `side` column exists, buy/sell/signed volume.
 
     Returns
     -------
@@ -28,86 +126,202 @@ def aggregate_trades_df(df: pd.DataFrame, dt_sec: int) -> pd.DataFrame:
     """
     assert dt_sec >= 1, "dt_sec doit etre >= 1"
     if df.empty:
-        return pd.DataFrame(columns=["t0", "open", "high", "low", "close", "volume", "quote_volume"])
+        return pd.DataFrame(columns=CANDLE_COLUMNS + (FLOW_COLUMNS if flow else []))
 
-    work = df.copy()
-    work.columns = [c.lower() for c in work.columns]
+    ts_ns, price, qty, side = _trade_arrays(df, flow)
+    res = ohlcv_from_arrays(ts_ns, price, qty, dt_sec, side=side)
+    return _candles_frame(res, flow)
 
+def _trade_arrays(df: pd.DataFrame, flow: bool = False):
+    """Columns {timestamp, price, volume[, side]} -> (ts_ns, price, qty, side) without invalid rows."""
+    cols = {c.lower(): c for c in df.columns}
     required = {"timestamp", "price", "volume"}
-    missing = required.difference(work.columns)
+    missing = required.difference(cols)
     assert not missing, f"Colonnes manquantes pour l'aggregation: {missing}"
 
-    ts = work["timestamp"]
-    if is_numeric_dtype(ts):
-        ts = ts.astype("int64")
-        unit = "s"
-        if (ts > 1e15).any():
-            unit = "ns"
-        elif (ts > 1e12).any():
-            unit = "ms"
-        work["timestamp"] = pd.to_datetime(ts, unit=unit, utc=True, errors="coerce")
-    else:
-        work["timestamp"] = pd.to_datetime(ts, utc=True, errors="coerce")
-
-    work["price"] = pd.to_numeric(work["price"], errors="coerce")
-    work["volume"] = pd.to_numeric(work["volume"], errors="coerce")
-
-    work = work.dropna(subset=["timestamp", "price", "volume"]).sort_values("timestamp", kind="stable")
-    if work.empty:
-        return pd.DataFrame(columns=["t0", "open", "high", "low", "close", "volume", "quote_volume"])
+    ts = _to_utc(df[cols["timestamp"]])
+    price = pd.to_numeric(df[cols["price"]], errors="coerce")
+    volume = pd.to_numeric(df[cols["volume"]], errors="coerce")
+    valid = (ts.notna() & price.notna() & volume.notna()).to_numpy()
+    side = df[cols["side"]].to_numpy()[valid] if flow and "side" in cols else None
+    return (
+        ts.dt.as_unit("ns").astype("int64").to_numpy()[valid],
+        price.to_numpy(dtype="float64")[valid],
+        volume.to_numpy(dtype="float64")[valid],
+        side,
+    )
 
-    rule = f"{dt_sec}s"
-    o = work.set_index("timestamp")
-
-    agg = pd.DataFrame({
-        "open": o["price"].resample(rule).first(),
-        "high": o["price"].resample(rule).max(),
-        "low": o["price"].resample(rule).min(),
-        "close": o["price"].resample(rule).last(),
-        "volume": o["volume"].resample(rule).sum(),
-    })
-    agg["quote_volume"] = (o["price"] * o["volume"]).resample(rule).sum()
-    agg = agg.dropna(subset=["open", "high", "low", "close"])
-
-    agg = agg.reset_index().rename(columns={"timestamp": "t0"})
-    agg["t0"] = agg["t0"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+def _candles_frame(res: dict, flow: bool = False) -> pd.DataFrame:
+    res = dict(res)
+    t0_ns = res.pop("t0_ns")
+    if not flow:
+        for c in FLOW_COLUMNS:
+            res.pop(c, None)
+    agg = pd.DataFrame(res)
+    agg.insert(0, "t0", pd.to_datetime(t0_ns, unit="ns", utc=True).strftime("%Y-%m-%dT%H:%M:%SZ"))
     return agg
 
-def build_candles(in_csv: str, out_csv: str, dt_sec: int) -> None:
+def rollup_ohlcv(bars: dict, dt_sec: int) -> dict:
+    """
+    Coarser candles from finer ones (output of ohlcv_from_arrays). dt_sec must be a
+    multiple of the source resolution so that every fine bar falls in one coarse bar.
+    """
     assert dt_sec >= 1, "dt_sec doit etre >= 1"
-    p_in = Path(in_csv)
-    p_out = Path(out_csv)
-    assert p_in.exists(), f"Fichier introuvable : {p_in}"
+    step = np.int64(dt_sec) * np.int64(1_000_000_000)
+    bucket = bars["t0_ns"] // step
+    if not len(bucket):
+        return {k: v[:0] for k, v in bars.items()}
+    starts = np.concatenate(([0], np.flatnonzero(bucket[1:] != bucket[:-1]) + 1))
+    ends = np.append(starts[1:], len(bucket))
 
-    df = pd.read_csv(p_in)
+    out = {"t0_ns": bucket[starts] * step}
+    out["open"] = bars["open"][starts]
+    out["high"] = np.maximum.reduceat(bars["high"], starts)
+    out["low"] = np.minimum.reduceat(bars["low"], starts)
+    out["close"] = bars["close"][ends - 1]
+    for c in ("volume", "quote_volume", "n_trades", "buy_volume", "sell_volume", "signed_volume"):
+        if c in bars:
+            out[c] = np.add.reduceat(bars[c], starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["vwap"] = np.where(out["volume"] > 0, out["quote_volume"] / out["volume"], out["close"])
+    return {k: out[k] for k in bars if k in out}
 
-    cols = {c.lower(): c for c in df.columns}
+def _trade_columns(p_in: Path, flow: bool = False) -> dict:
+    header = pd.read_csv(p_in, nrows=0)
+    cols = {c.lower(): c for c in header.columns}
     assert "timestamp" in cols, "Colonne 'timestamp' manquante"
     assert "price" in cols, "Colonne 'price' manquante"
     vol_col = cols.get("volume") or cols.get("qty")
     assert vol_col, "Colonne 'volume' ou 'qty' manquante"
+    rename = {cols["timestamp"]: "timestamp", cols["price"]: "price", vol_col: "volume"}
+    if flow and "side" in cols:
+        rename[cols["side"]] = "side"
+    return rename
 
-    df = df.rename(columns={
-        cols["timestamp"]: "timestamp",
-        cols["price"]: "price",
-        vol_col: "volume",
-    })
+def iter_candles_chunked(in_csv: str, dt_sec: int, chunksize: int = 1_000_000, flow: bool = False):
+    """
+    Streaming aggregation: reads `chunksize` rows at a time and yields finished candles.
+    Rows of the last (possibly incomplete) bucket of each block are carried over to the
+    next block, so every candle is aggregated from all of its trades in a single pass
+    and the output matches aggregate_trades_df on the full file. Input must be sorted
+    by time across blocks (as written by kraken_ws).
+    """
+    assert dt_sec >= 1, "dt_sec doit etre >= 1"
+    assert chunksize >= 1, "chunksize doit etre >= 1"
+    p_in = Path(in_csv)
+    assert p_in.exists(), f"Fichier introuvable : {p_in}"
+    rename = _trade_columns(p_in, flow)
+    rule = f"{dt_sec}s"
 
-    agg = aggregate_trades_df(df, dt_sec)
+    carry = None
+    last_emitted = None
+    for chunk in pd.read_csv(p_in, usecols=list(rename), chunksize=chunksize):
+        chunk = chunk.rename(columns=rename)
+        chunk["timestamp"] = _to_utc(chunk["timestamp"])
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        bucket = chunk["timestamp"].dt.floor(rule)
+        if bucket.notna().any():
+            assert last_emitted is None or bucket.min() > last_emitted, \
+                "Trades non triés entre blocs: utiliser le mode en mémoire (chunksize=None)"
+            last_bucket = bucket.max()
+            tail = bucket == last_bucket
+            carry = chunk.loc[tail]
+            done = chunk.loc[~tail]
+        else:
+            carry, done = None, chunk
+        if not done.empty:
+            agg = aggregate_trades_df(done, dt_sec, flow)
+            if not agg.empty:
+                last_emitted = bucket.loc[~tail].max()
+                yield agg
+    if carry is not None and not carry.empty:
+        agg = aggregate_trades_df(carry, dt_sec, flow)
+        if not agg.empty:
+            yield agg
 
+def build_candles(in_csv: str, out_csv: str, dt_sec: int, chunksize: int | None = None,
+                  flow: bool = False) -> None:
+    assert dt_sec >= 1, "dt_sec doit etre >= 1"
+    p_in = Path(in_csv)
+    p_out = Path(out_csv)
+    assert p_in.exists(), f"Fichier introuvable : {p_in}"
     p_out.parent.mkdir(parents=True, exist_ok=True)
+
+    if chunksize:
+        # memoire bornee: un bloc + les trades de la derniere bougie en cours
+        header = True
+        with open(p_out, "w", newline="") as f:
+            for agg in iter_candles_chunked(in_csv, dt_sec, chunksize, flow):
+                agg.to_csv(f, index=False, header=header)
+                header = False
+            if header:
+                aggregate_trades_df(pd.DataFrame(), dt_sec, flow).to_csv(f, index=False)
+        return
+
+    rename = _trade_columns(p_in, flow)
+    df = read_csv_cached(p_in, usecols=list(rename)).rename(columns=rename)
+
+    agg = aggregate_trades_df(df, dt_sec, flow)
+
     agg.to_csv(p_out, index=False)
 
+def candles_multi_df(trades: pd.DataFrame, dts, flow: bool = False) -> dict:
+    """
+    In-memory multi-resolution aggregation: {dt_sec: candles DataFrame}.
+    `trades` needs timestamp, price and volume (or qty). The finest resolution is
+    aggregated from the trades; coarser multiples are rolled up from its candles.
+    """
+    dts = sorted({int(dt) for dt in dts})
+    assert dts, "Aucune resolution demandee"
+    assert dts[0] >= 1, "dt_sec doit etre >= 1"
+    cols = {c.lower(): c for c in trades.columns}
+    if "volume" not in cols and "qty" in cols:
+        trades = trades.rename(columns={cols["qty"]: "volume"})
+    ts_ns, price, qty, side = _trade_arrays(trades, flow)
+
+    base_dt = dts[0]
+    base = ohlcv_from_arrays(ts_ns, price, qty, base_dt, side=side)
+    out = {}
+    for dt in dts:
+        if dt == base_dt:
+            res = base
+        elif dt % base_dt == 0:
+            res = rollup_ohlcv(base, dt)
+        else:
+            res = ohlcv_from_arrays(ts_ns, price, qty, dt, side=side)
+        out[dt] = _candles_frame(res, flow)
+    return out
+
+def build_candles_multi(in_csv: str, outs: dict, flow: bool = False) -> None:
+    """
+    Several resolutions from a single parse of the trades CSV.
+    outs: {dt_sec: out_csv}. The finest resolution is aggregated from the trades;
+    coarser ones that are multiples of it are rolled up from the finest candles.
+    """
+    assert outs, "Aucune resolution demandee"
+    p_in = Path(in_csv)
+    assert p_in.exists(), f"Fichier introuvable : {p_in}"
+
+    rename = _trade_columns(p_in, flow)
+    df = read_csv_cached(p_in, usecols=list(rename)).rename(columns=rename)
+    for dt, agg in candles_multi_df(df, outs, flow).items():
+        p_out = Path(outs[dt])
+        p_out.parent.mkdir(parents=True, exist_ok=True)
+        agg.to_csv(p_out, index=False)
+
 def _parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="in_csv", required=True, help="data/*_trades.csv")
     ap.add_argument("--out", dest="out_csv", required=True, help="data/*_candles_XXs.csv")
     ap.add_argument("--dt", dest="dt_sec", type=int, default=60, help="Taille de bougie en secondes")
+    ap.add_argument("--chunksize", type=int, default=None, help="Lecture par blocs de N lignes (memoire constante)")
+    ap.add_argument("--flow", action="store_true", help="Ajoute vwap, n_trades et volumes acheteur/vendeur")
     return ap.parse_args()
 
 def main() -> None:
     args = _parse_args()
-    build_candles(args.in_csv, args.out_csv, args.dt_sec)
+    build_candles(args.in_csv, args.out_csv, args.dt_sec, args.chunksize, args.flow)
 
 if __name__ == "__main__":
     main()
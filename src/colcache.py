@@ -0,0 +1,199 @@
+# src/colcache.py
+"""
+Cache colonnaire des CSV d'entrée.
+Au premier chargement, le CSV est parsé une fois puis converti en colonnes typées
+(data/.colcache/<fichier>/c<i>.npy + meta.json):
+  - colonnes temps (timestamp, t0) -> int64 ns UTC
+  - numériques -> float64 / int64 / bool
+  - texte -> codes int32 + catégories (meta.json)
+Les chargements suivants relisent ces colonnes en mémoire mappée (np.load mmap_mode="r")
+sans parser le CSV. Le cache est invalidé par la taille + mtime du source, avec repli
+sur un hash du contenu quand seul le mtime a changé (fichier réécrit à l'identique).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+TIME_COLS = ("timestamp", "t0")
+CACHE_DIRNAME = ".colcache"
+FORMAT_VERSION = 1
+
+def cache_dir(path) -> Path:
+    p = Path(path)
+    return p.parent / CACHE_DIRNAME / p.name
+
+def _file_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_meta(cdir: Path) -> Optional[dict]:
+    try:
+        with open(cdir / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == FORMAT_VERSION else None
+
+def _is_fresh(src: Path, cdir: Path, meta: Optional[dict]) -> bool:
+    if meta is None:
+        return False
+    st = src.stat()
+    if meta["size"] != st.st_size:
+        return False
+    if meta["mtime_ns"] == st.st_mtime_ns:
+        return True
+    # même taille, mtime différent: on vérifie le contenu avant de reconstruire
+    if _file_hash(src) != meta["hash"]:
+        return False
+    meta["mtime_ns"] = st.st_mtime_ns
+    _write_meta(cdir, meta)
+    return True
+
+def _is_valid(src: Path, cdir: Path, meta: Optional[dict], time_cols: Sequence[str]) -> bool:
+    return _is_fresh(src, cdir, meta) and sorted(meta["time_cols"]) == sorted(time_cols)
+
+def _write_meta(cdir: Path, meta: dict) -> None:
+    # écriture atomique: un lecteur concurrent ne voit jamais un meta.json tronqué
+    tmp = cdir / f"meta.json.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, cdir / "meta.json")
+
+def _build(src: Path, cdir: Path, time_cols: Sequence[str]) -> dict:
+    st = src.stat()
+    df = pd.read_csv(src)
+    tmp = cdir.with_name(cdir.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        meta = _write_columns(src, st, df, tmp, time_cols)
+        return _install(src, tmp, cdir, meta)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _write_columns(src: Path, st: os.stat_result, df: pd.DataFrame, tmp: Path,
+                   time_cols: Sequence[str]) -> dict:
+    cols: List[dict] = []
+    for i, name in enumerate(df.columns):
+        s = df[name]
+        fname = f"c{i}.npy"
+        if name in time_cols and not pd.api.types.is_numeric_dtype(s):
+            ts = pd.to_datetime(s, utc=True, errors="coerce")
+            np.save(tmp / fname, ts.dt.as_unit("ns").astype("int64").to_numpy())
+            cols.append({"name": name, "kind": "time", "file": fname})
+        elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            arr = s.to_numpy()
+            if arr.dtype.kind == "f":
+                arr = arr.astype(np.float64)
+            elif arr.dtype.kind in "iu":
+                arr = arr.astype(np.int64)
+            np.save(tmp / fname, arr)
+            cols.append({"name": name, "kind": "num", "file": fname})
+        else:
+            codes, cats = pd.factorize(s, use_na_sentinel=True)
+            np.save(tmp / fname, codes.astype(np.int32))
+            cols.append({"name": name, "kind": "cat", "file": fname,
+                         "categories": [str(c) for c in cats]})
+    meta = {
+        "version": FORMAT_VERSION,
+        "source": src.name,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "hash": _file_hash(src),
+        "n_rows": int(len(df)),
+        "time_cols": list(time_cols),
+        "columns": cols,
+    }
+    with open(tmp / "meta.json", "w") as f:
+        json.dump(meta, f)
+    return meta
+
+def _install(src: Path, tmp: Path, cdir: Path, meta: dict, attempts: int = 5) -> dict:
+    """
+    Met le cache construit dans tmp à la place de cdir. Plusieurs processus peuvent
+    construire le même cache en parallèle (run_all --workers): si un autre a installé
+    un cache valide entre-temps, on garde le sien et tmp est abandonné.
+    """
+    for _ in range(attempts):
+        current = _read_meta(cdir)
+        if _is_valid(src, cdir, current, meta["time_cols"]):
+            return current
+        shutil.rmtree(cdir, ignore_errors=True)
+        try:
+            os.replace(tmp, cdir)
+            return meta
+        except OSError:
+            continue  # cdir recréé par un autre processus: on revalide le gagnant
+    raise OSError(f"Cache colonnaire impossible à installer: {cdir}")
+
+def read_csv_cached(
+    path,
+    usecols: Optional[Sequence[str]] = None,
+    time_cols: Iterable[str] = TIME_COLS,
+    mmap: bool = True,
+) -> pd.DataFrame:
+    """
+    Équivalent de pd.read_csv(path) avec les colonnes temps déjà converties en
+    datetime64[ns, UTC] (NaT si non parsable) et le texte en catégories.
+    """
+    src = Path(path); assert src.exists(), f"Introuvable: {src}"
+    time_cols = tuple(time_cols)
+    cdir = cache_dir(src)
+    try:
+        return _load(src, cdir, usecols, time_cols, mmap)
+    except FileNotFoundError:
+        # cache remplacé par un autre processus pendant la lecture: on relit le nouveau
+        return _load(src, cdir, usecols, time_cols, mmap)
+
+def _load(src: Path, cdir: Path, usecols: Optional[Sequence[str]], time_cols: Sequence[str],
+          mmap: bool) -> pd.DataFrame:
+    meta = _read_meta(cdir)
+    if not _is_valid(src, cdir, meta, time_cols):
+        meta = _build(src, cdir, time_cols)
+
+    wanted = set(usecols) if usecols is not None else None
+    if wanted is not None:
+        missing = wanted.difference(c["name"] for c in meta["columns"])
+        assert not missing, f"Colonnes manquantes: {missing}"
+    data = {}
+    for c in meta["columns"]:
+        if wanted is not None and c["name"] not in wanted:
+            continue
+        arr = np.load(cdir / c["file"], mmap_mode="r" if mmap else None)
+        if c["kind"] == "time":
+            data[c["name"]] = pd.to_datetime(np.asarray(arr), unit="ns", utc=True)
+        elif c["kind"] == "cat":
+            data[c["name"]] = pd.Categorical.from_codes(np.asarray(arr), categories=c["categories"])
+        else:
+            data[c["name"]] = arr
+    return pd.DataFrame(data, copy=False)
+
+def format_time(s: pd.Series) -> pd.Series:
+    """datetime UTC -> ISO 'Z' (secondes, ou microsecondes si nécessaire), comme les CSV du pipeline."""
+    ts = pd.to_datetime(s, utc=True, errors="coerce")
+    sub_second = (ts.dt.microsecond != 0) | (ts.dt.nanosecond != 0)
+    fmt = "%Y-%m-%dT%H:%M:%S.%fZ" if sub_second.any() else "%Y-%m-%dT%H:%M:%SZ"
+    return ts.dt.strftime(fmt)
+
+def write_csv(df: pd.DataFrame, path, **kwargs) -> None:
+    """to_csv en reformatant les colonnes datetime au format ISO des CSV du pipeline."""
+    out = df
+    dt_cols = [c for c in df.columns if isinstance(df[c].dtype, pd.DatetimeTZDtype)]
+    if dt_cols:
+        out = df.copy()
+        for c in dt_cols:
+            out[c] = format_time(out[c])
+    kwargs.setdefault("index", False)
+    out.to_csv(path, **kwargs)
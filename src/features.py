@@ -1,12 +1,13 @@
 # src/features.py
 from pathlib import Path
 import argparse
-import pandas as pd
 import numpy as np
 
+from colcache import read_csv_cached, write_csv
+
 def build_features(candles_csv: str, out_csv: str) -> None:
     p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
-    df = pd.read_csv(p)
+    df = read_csv_cached(p)
 
     for col in ("open","high","low","close","volume"):
         assert col in df.columns, f"Colonne manquante: {col}"
@@ -36,7 +37,7 @@ def build_features(candles_csv: str, out_csv: str) -> None:
     vol_roll_std = df["volume"].rolling(30).std().replace(0, np.nan)
     df["vol_z"] = (df["volume"] - vol_roll_mean) / vol_roll_std
 
-    df.to_csv(out_csv, index=False)
+    write_csv(df, out_csv)
 
 def _parse_args():
     ap = argparse.ArgumentParser()
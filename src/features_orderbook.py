@@ -10,6 +10,9 @@ import argparse
 import pandas as pd
 import numpy as np
 
+from colcache import read_csv_cached
+from windows import rolling_std
+
 def _ofi(bid_px, bid_qty, ask_px, ask_qty):
     dbp, dap = bid_px.diff(), ask_px.diff()
     dbq, daq = bid_qty.diff(), ask_qty.diff()
@@ -19,10 +22,11 @@ def _ofi(bid_px, bid_qty, ask_px, ask_qty):
             + ((dap > 0).astype(int) * ask_qty.shift(1)) + ((dap == 0).astype(int) * (-daq.clip(upper=0)))
     return (c_bid + c_ask).fillna(0.0)
 
-def build_from_topbook(topbook_csv: str, out_csv: str, resample_sec: int = 1):
+def _load_topbook(topbook_csv: str) -> pd.DataFrame:
     p = Path(topbook_csv); assert p.exists(), f"Introuvable: {p}"
-    df = pd.read_csv(p)
+    return _clean_topbook(read_csv_cached(p))
 
+def _clean_topbook(df: pd.DataFrame) -> pd.DataFrame:
     need = ["timestamp","bid_px","bid_qty","ask_px","ask_qty","mid","spread","bid_depth_qty","ask_depth_qty"]
     for c in need:
         assert c in df.columns, f"Colonne manquante: {c}"
@@ -43,12 +47,38 @@ def build_from_topbook(topbook_csv: str, out_csv: str, resample_sec: int = 1):
     df["ofi"] = _ofi(df["bid_px"], df["bid_qty"], df["ask_px"], df["ask_qty"])
     denom = (df["bid_depth_qty"] + df["ask_depth_qty"]).replace(0, np.nan)
     df["depth_imb"] = ((df["bid_depth_qty"] - df["ask_depth_qty"]) / denom).fillna(0.0)
+    return df[["mid","spread","ofi","depth_imb"]]
 
-    # Agrégation temporelle
+def _resample_last(df: pd.DataFrame, resample_sec: int) -> pd.DataFrame:
+    # Agrégation temporelle (dernier point de chaque fenêtre ]t-dt, t])
     rule = f"{int(resample_sec)}s"
-    agg = df[["mid","spread","ofi","depth_imb"]].resample(rule, label="right", closed="right").last()
+    agg = df.resample(rule, label="right", closed="right").last()
     agg["spread"] = agg["spread"].clip(lower=0.0)
-    agg = agg.ffill()
+    return agg.ffill()
+
+# lignes déjà calculées nécessaires pour prolonger une série (rolling 12, pct_change 3)
+LOOKBACK = 12
+
+def _ema(x: pd.Series, span: int, history: pd.DataFrame | None = None, col: str = "") -> pd.Series:
+    if history is None or not len(history):
+        return x.ewm(span=span, adjust=False).mean()
+    # ewm(adjust=False) ne dépend que de la valeur précédente: repartir de la dernière
+    # EMA écrite prolonge exactement le calcul complet
+    n = len(history)
+    seed = pd.Series([history[col].iloc[-1]])
+    ext = pd.concat([seed, x.iloc[n:]], ignore_index=True).ewm(span=span, adjust=False).mean()
+    return pd.Series(np.concatenate([history[col].to_numpy(), ext.to_numpy()[1:]]), index=x.index)
+
+def _derive_features(base: pd.DataFrame, history: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Features dérivées des barres. `history` (au moins LOOKBACK dernières lignes déjà
+    écrites) prolonge une série existante: seules les barres de `base` sont retournées.
+    """
+    agg = base.copy()
+    n_hist = 0 if history is None else len(history)
+    if n_hist:
+        idx = pd.DatetimeIndex(pd.to_datetime(history["t0"], utc=True), name=base.index.name)
+        agg = pd.concat([history[list(base.columns)].set_axis(idx), agg])
 
     # Enrichissement de features dérivées
     agg["spread_bp"] = ((agg["spread"] / agg["mid"]) * 1e4).replace([np.inf, -np.inf], np.nan).fillna(0.0)
@@ -57,20 +87,63 @@ def build_from_topbook(topbook_csv: str, out_csv: str, resample_sec: int = 1):
 
     span_fast = max(int(3), 1)
     span_slow = max(int(12), span_fast + 1)
-    agg["depth_ema_fast"] = agg["depth_imb"].ewm(span=span_fast, adjust=False).mean().fillna(0.0)
-    agg["depth_ema_slow"] = agg["depth_imb"].ewm(span=span_slow, adjust=False).mean().fillna(0.0)
+    agg["depth_ema_fast"] = _ema(agg["depth_imb"], span_fast, history, "depth_ema_fast").fillna(0.0)
+    agg["depth_ema_slow"] = _ema(agg["depth_imb"], span_slow, history, "depth_ema_slow").fillna(0.0)
     agg["depth_trend"] = (agg["depth_ema_fast"] - agg["depth_ema_slow"]).fillna(0.0)
-    agg["depth_vol"] = agg["depth_imb"].rolling(window=span_slow, min_periods=1).std().fillna(0.0)
+    # écart-types par fenêtre (windows.py): indépendants du début de la série
+    agg["depth_vol"] = rolling_std(agg["depth_imb"], span_slow, min_periods=1).fillna(0.0)
 
-    agg["ofi_ema"] = agg["ofi"].ewm(span=max(span_fast, 2), adjust=False).mean().fillna(0.0)
-    agg["ofi_z"] = (agg["ofi_ema"] / (agg["ofi"].rolling(window=span_slow, min_periods=1).std().replace(0, np.nan))).fillna(0.0)
+    agg["ofi_ema"] = _ema(agg["ofi"], max(span_fast, 2), history, "ofi_ema").fillna(0.0)
+    agg["ofi_z"] = (agg["ofi_ema"] / (rolling_std(agg["ofi"], span_slow, min_periods=1).replace(0, np.nan))).fillna(0.0)
 
     # Sortie finale
-    out = agg.reset_index().rename(columns={"timestamp":"t0"})
+    out = agg.iloc[n_hist:].reset_index().rename(columns={"timestamp":"t0"})
     out["t0"] = out["t0"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return out
+
+def _write(out: pd.DataFrame, out_csv: str) -> None:
     Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(out_csv, index=False)
 
+def micro_features_df(topbook: pd.DataFrame, resample_sec: int = 1) -> pd.DataFrame:
+    """Features micro depuis un DataFrame topbook brut (colonnes de kraken_topbook.csv)."""
+    return _derive_features(_resample_last(_clean_topbook(topbook), resample_sec))
+
+def micro_features_multi_df(topbook: pd.DataFrame, secs) -> dict:
+    """
+    Plusieurs pas depuis un seul nettoyage du topbook: {resample_sec: DataFrame}.
+    Les pas multiples du plus fin sont dérivés des barres fines: le dernier point de
+    ]T-dt, T] est le dernier point de la dernière barre fine de la fenêtre.
+    """
+    secs = sorted({int(s) for s in secs})
+    assert secs, "Aucune resolution demandee"
+    return {sec: _derive_features(base) for sec, base in _multi_bases(_clean_topbook(topbook), secs).items()}
+
+def _multi_bases(ticks: pd.DataFrame, secs) -> dict:
+    """{resample_sec: barres de base} depuis des ticks nettoyés."""
+    secs = sorted({int(s) for s in secs})
+    fine_sec = secs[0]
+    fine = _resample_last(ticks, fine_sec)
+    out = {}
+    for sec in secs:
+        if sec == fine_sec:
+            out[sec] = fine
+        elif sec % fine_sec == 0:
+            out[sec] = _resample_last(fine, sec)
+        else:
+            out[sec] = _resample_last(ticks, sec)
+    return out
+
+def build_from_topbook(topbook_csv: str, out_csv: str, resample_sec: int = 1):
+    ticks = _load_topbook(topbook_csv)
+    _write(_derive_features(_resample_last(ticks, resample_sec)), out_csv)
+
+def build_from_topbook_multi(topbook_csv: str, outs: dict):
+    """Plusieurs pas depuis une seule lecture du topbook. outs: {resample_sec: out_csv}."""
+    p = Path(topbook_csv); assert p.exists(), f"Introuvable: {p}"
+    for sec, out in micro_features_multi_df(read_csv_cached(p), outs).items():
+        _write(out, outs[sec])
+
 def _args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="topbook_csv", required=True)
@@ -0,0 +1,450 @@
+# src/incremental.py
+"""
+Mode incrémental de run_all (--incremental).
+Les CSV bruts (trades, topbook) sont en ajout seul. Un filigrane par entrée retient
+l'offset à partir duquel relire: début de la dernière barre encore ouverte à la
+résolution la plus grossière (ppcm des pas). Chaque sortie garde son nombre de lignes.
+Un rafraîchissement relit les octets ajoutés, recalcule les barres touchées, puis
+chaque étape avec juste le contexte dont elle a besoin:
+  - candles: trades de la dernière barre ouverte
+  - features micro: 2 ticks avant la coupure (OFI, ffill), LOOKBACK barres et
+    dernière EMA écrites
+  - labels: horizon h en avant
+  - patterns: LOOKBACK bougies (vol sur 20 rendements)
+  - signal micro: médiane globale de depth_vol, relue en entier; si elle change
+    le fichier est réécrit
+  - backtests: horizon h + signal_lag; stats recalculées sur le fichier complet
+Les sorties sont tronquées à la première ligne modifiée puis complétées, avec les
+mêmes octets que le pipeline complet (qui relit ses CSV intermédiaires). Un état
+incohérent (paramètres changés, entrée réécrite, sortie modifiée à la main, ticks
+hors ordre) retombe sur le pipeline complet.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import math
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest import bt_stats, run_bt_df
+from colcache import write_csv
+from candles import candles_multi_df
+from features_orderbook import LOOKBACK as MICRO_LOOKBACK, _clean_topbook, _derive_features, _multi_bases
+from patterns_candles import LOOKBACK as PATTERN_LOOKBACK, detect_signals_df
+from signals_micro import build_df as micro_signal_df
+from targets import labels_df
+
+STATE_VERSION = 2  # 2: stats avec intervalles bootstrap
+TIME_COLS = ("timestamp", "t0")
+NS = 1_000_000_000
+SIGNAL_LAG = 1  # run_bt par défaut
+
+# --- lecture / réécriture de fins de CSV ---
+
+def _header(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.readline()
+
+def _read(path, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def data_end(path) -> int:
+    """Fin de la dernière ligne complète (une ligne en cours d'écriture est ignorée)."""
+    pos = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                return pos - step + i + 1
+            pos -= step
+    return 0
+
+def tail_start(path, n: int, end: Optional[int] = None) -> int:
+    """Offset du début des n dernières lignes de données avant `end`."""
+    hdr_end = len(_header(path))
+    pos = os.path.getsize(path) if end is None else end
+    if n <= 0:
+        return pos
+    need = n + 1  # le saut de ligne qui termine la ligne précédente
+    with open(path, "rb") as f:
+        while pos > hdr_end:
+            step = min(1 << 20, pos - hdr_end)
+            f.seek(pos - step)
+            nl = np.flatnonzero(np.frombuffer(f.read(step), dtype=np.uint8) == 10)
+            if len(nl) >= need:
+                return pos - step + int(nl[len(nl) - need]) + 1
+            need -= len(nl)
+            pos -= step
+    return hdr_end
+
+def _parse(header: bytes, body: bytes, exact: bool = False) -> pd.DataFrame:
+    # mêmes conversions que read_csv_cached; exact=True pour relire nos propres
+    # valeurs au bit près (états d'EMA, fenêtres)
+    df = pd.read_csv(io.BytesIO(header + body), float_precision="round_trip" if exact else None)
+    for c in TIME_COLS:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_datetime(df[c], utc=True, errors="coerce").dt.as_unit("ns")
+    return df
+
+def read_rows(path, total: int, start: int, stop: Optional[int] = None, exact: bool = False) -> pd.DataFrame:
+    """Lignes [start, stop) d'un CSV de `total` lignes, sans lire ce qui précède."""
+    end = os.path.getsize(path)
+    a = tail_start(path, total - max(start, 0), end)
+    b = end if stop is None else tail_start(path, total - stop, end)
+    return _parse(_header(path), _read(path, a, b), exact)
+
+def count_rows(path) -> int:
+    n = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            n += chunk.count(b"\n")
+    return max(n - 1, 0)
+
+def rows_before(path, total: int, t_ns: int, inclusive: bool = False) -> int:
+    """Nombre de lignes en tête dont t0 < t_ns (<= si inclusive); fichier trié sur t0."""
+    n = 64
+    while True:
+        tail = read_rows(path, total, total - n)
+        t0 = tail["t0"].dt.as_unit("ns").astype("int64").to_numpy()
+        old = t0 <= t_ns if inclusive else t0 < t_ns
+        if old.any() or n >= total:
+            return total - len(tail) + (int(np.flatnonzero(old)[-1]) + 1 if old.any() else 0)
+        n *= 4
+
+def rewrite_from(path, total: int, keep: int, df: pd.DataFrame) -> int:
+    """Garde les `keep` premières lignes, ajoute df; retourne le nouveau nombre de lignes."""
+    off = tail_start(path, total - keep)
+    with open(path, "r+b") as f:
+        f.truncate(off)
+    write_csv(df, path, mode="a", header=False)
+    return keep + len(df)
+
+# --- filigranes des CSV bruts ---
+
+def _valid_times(df: pd.DataFrame, numeric) -> tuple:
+    ts = df["timestamp"]
+    valid = ts.notna().to_numpy().copy()
+    for c in numeric:
+        valid &= pd.to_numeric(df[c], errors="coerce").notna().to_numpy()
+    return ts.dt.as_unit("ns").astype("int64").to_numpy(), valid
+
+def _scan_mark(path, end: int, numeric, cut_of: Callable[[int], int], strict: bool,
+               before: int) -> Optional[dict]:
+    """
+    cut = cut_of(dernier horodatage valide). Les lignes valides antérieures au cut
+    (< si strict, <= sinon) sont figées; la relecture repart de la `before`-ième
+    dernière d'entre elles (juste après la dernière si before == 0).
+    None si des lignes postérieures au cut précèdent ce point (données hors ordre).
+    """
+    header = _header(path)
+    n = 1024
+    while True:
+        start = tail_start(path, n, end)
+        body = _read(path, start, end)
+        df = _parse(header, body)
+        whole = start <= len(header)
+        ts, valid = _valid_times(df, numeric)
+        if valid.any():
+            cut = cut_of(int(ts[valid].max()))
+            old = valid & ((ts < cut) if strict else (ts <= cut))
+            idx = np.flatnonzero(old)
+            if len(idx) >= max(before, 1) or whole:
+                if before == 0:
+                    j = int(idx[-1]) + 1 if len(idx) else 0
+                else:
+                    j = int(idx[-before]) if len(idx) >= before else 0
+                last_old = int(idx[-1]) if len(idx) else -1
+                if (valid & ~old)[:last_old + 1].any():
+                    return None
+                nl = np.flatnonzero(np.frombuffer(body, dtype=np.uint8) == 10)
+                if len(nl) != len(df):
+                    return None  # lignes vides: offsets non fiables
+                starts = np.concatenate(([0], nl[:-1] + 1))
+                offset = start + (int(starts[j]) if j < len(df) else len(body))
+                return {"end": end, "offset": offset, "cut_ns": cut,
+                        "carry_hash": _digest(_read(path, offset, end)),
+                        "head_hash": _digest(header)}
+        elif whole:
+            return None
+        n *= 4
+
+def trades_mark(path, dts, end: Optional[int] = None) -> Optional[dict]:
+    # bougies [t0, t0+dt): la barre ouverte commence au plancher du dernier trade
+    step = math.lcm(*dts) * NS
+    return _scan_mark(path, data_end(path) if end is None else end, ("price", _qty_col(path)),
+                      lambda t: (t // step) * step, strict=True, before=0)
+
+def topbook_mark(path, secs, end: Optional[int] = None) -> Optional[dict]:
+    # barres ]T-dt, T]: on garde 2 ticks antérieurs au cut (diff de l'OFI et ffill)
+    step = math.lcm(*secs) * NS
+    return _scan_mark(path, data_end(path) if end is None else end, ("bid_px", "ask_px"),
+                      lambda t: ((t - 1) // step) * step, strict=False, before=2)
+
+def _qty_col(path) -> str:
+    cols = {c.lower(): c for c in _header(path).decode().strip().split(",")}
+    return cols.get("volume") or cols.get("qty") or "volume"
+
+def _carry_intact(path, mark: dict) -> bool:
+    """L'entrée a seulement grandi depuis le filigrane (pas de réécriture)."""
+    if os.path.getsize(path) < mark["end"] or _digest(_header(path)) != mark["head_hash"]:
+        return False
+    return _digest(_read(path, mark["offset"], mark["end"])) == mark["carry_hash"]
+
+# --- état ---
+
+class Watermarks:
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        data: dict = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+            except ValueError:
+                data = {}
+        self.data = data if data.get("version") == STATE_VERSION else {}
+
+    def usable(self, params: dict) -> bool:
+        d = self.data
+        if not d or d.get("params") != params:
+            return False
+        # sorties modifiées hors du mode incrémental -> recalcul complet
+        return all(Path(f).exists() and os.path.getsize(f) == rec["size"] for f, rec in d["files"].items())
+
+    def save(self, data: dict) -> None:
+        self.data = dict(data, version=STATE_VERSION)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.data, indent=1))
+        os.replace(tmp, self.path)
+
+def _vol_median(micro_csv: str) -> Optional[float]:
+    # même lecture que signals_micro (read_csv_cached) pour la même médiane
+    vol = pd.read_csv(micro_csv, usecols=["depth_vol"])["depth_vol"]
+    med = pd.to_numeric(vol, errors="coerce").replace(0.0, np.nan).median()
+    return None if pd.isna(med) else float(med)
+
+def _stats(bt_csv: str) -> dict:
+    res = pd.read_csv(bt_csv, usecols=["signal", "ret_net", "fut_ret", "fut_sign"],
+                      float_precision="round_trip")
+    return bt_stats(res)
+
+# --- exécution ---
+
+class Incremental:
+    """
+    p: chemins de build_paths. dts: {"fast": dt, "slow": dt}. Les étapes lisent et
+    écrivent les mêmes fichiers que le pipeline en DAG.
+    """
+
+    def __init__(self, p: dict, trades_csv: str, topbook_csv: str, dts: dict, h: int, eps: float,
+                 tau: float, max_spread_bp: float, fees_bp: float, state_path: str) -> None:
+        self.p = p
+        self.trades_csv = trades_csv
+        self.topbook_csv = topbook_csv
+        # une branche par pas distinct (fast == slow -> mêmes fichiers)
+        self.speeds = {}
+        for speed, dt in dts.items():
+            if dt not in self.speeds.values():
+                self.speeds[speed] = int(dt)
+        self.alias = {s: next(k for k, v in self.speeds.items() if v == int(dt)) for s, dt in dts.items()}
+        self.h, self.eps, self.tau, self.max_spread_bp, self.fees_bp = h, eps, tau, max_spread_bp, fees_bp
+        self.params = {
+            "inputs": [trades_csv, topbook_csv], "dts": dts, "h": h, "eps": eps, "tau": tau,
+            "max_spread_bp": max_spread_bp, "fees_bp": fees_bp, "signal_lag": SIGNAL_LAG,
+            "lookback": [MICRO_LOOKBACK, PATTERN_LOOKBACK],
+        }
+        self.state = Watermarks(state_path)
+
+    def outputs(self, speed: str) -> dict:
+        p = self.p
+        return {
+            "c": p[f"c_{speed}"], "m": p[f"m_{speed}"], "lbl": p[f"c_{speed}_lbl"],
+            "sig_candle": p[f"sig_{speed}_candle"], "sig_micro": p[f"sig_{speed}_micro"],
+            "bt_candle": p[f"bt_{speed}_candle"], "bt_micro": p[f"bt_{speed}_micro"],
+        }
+
+    def run(self, full_run: Callable[[], dict]) -> dict:
+        """Rafraîchit les sorties; full_run() exécute le pipeline complet si besoin."""
+        secs = sorted(self.speeds.values())
+        marks = self.state.data.get("marks", {}) if self.state.usable(self.params) else {}
+        t_mark, b_mark = marks.get("trades"), marks.get("topbook")
+        # resample() aligne les barres micro sur minuit: la coupure doit tomber sur une borne
+        if not (t_mark and b_mark and _carry_intact(self.trades_csv, t_mark)
+                and _carry_intact(self.topbook_csv, b_mark) and 86400 % math.lcm(*secs) == 0):
+            print("[incremental] pas de filigrane exploitable -> pipeline complet")
+            return self._finish(full_run(), rows={}, medians={})
+
+        rows = {f: rec["rows"] for f, rec in self.state.data["files"].items()}
+        keep = self.state.data["keep"]
+        medians = dict(self.state.data["medians"])
+        stats = dict(self.state.data["stats"])
+        changed: Dict[str, int] = {}
+
+        t_end, b_end = data_end(self.trades_csv), data_end(self.topbook_csv)
+        if t_end == t_mark["end"] and b_end == b_mark["end"]:
+            print("[incremental] aucune donnée nouvelle")
+            return {f"bt_{k}_{s}": stats[f"bt_{k}_{self.alias[s]}"]
+                    for s in self.alias for k in ("candle", "micro")}
+
+        ok = True
+        if t_end != t_mark["end"]:
+            ok = self._candles(t_mark, t_end, rows, keep, changed)
+        if ok and b_end != b_mark["end"]:
+            ok = self._micro(b_mark, b_end, rows, keep, changed)
+        if not ok:
+            print("[incremental] données hors ordre ou historique trop court -> pipeline complet")
+            return self._finish(full_run(), rows={}, medians={})
+
+        for speed in self.speeds:
+            o = self.outputs(speed)
+            self._labels(o, rows, changed)
+            self._patterns(o, rows, changed)
+            self._micro_signal(o, speed, rows, changed, medians)
+            for kind in ("candle", "micro"):
+                if self._backtest(o, kind, rows, changed):
+                    stats[f"bt_{kind}_{speed}"] = _stats(o[f"bt_{kind}"])
+        results = {f"bt_{k}_{s}": stats[f"bt_{k}_{s}"] for s in self.speeds for k in ("candle", "micro")}
+        return self._finish(results, rows, medians)
+
+    # -- étapes
+
+    def _candles(self, mark: dict, end: int, rows: dict, keep: dict, changed: dict) -> bool:
+        body = _read(self.trades_csv, mark["offset"], end)
+        trades = _parse(_header(self.trades_csv), body)
+        ts, valid = _valid_times(trades, ("price", _qty_col(self.trades_csv)))
+        if (valid & (ts < mark["cut_ns"])).any():
+            return False
+        print(f"[incremental] candles: {len(trades)} trades relus depuis l'offset {mark['offset']}")
+        frames = candles_multi_df(trades, self.speeds.values())
+        for speed, dt in self.speeds.items():
+            c = self.p[f"c_{speed}"]
+            rows[c] = rewrite_from(c, rows[c], keep[c], frames[dt])
+            changed[c] = keep[c]
+        return True
+
+    def _micro(self, mark: dict, end: int, rows: dict, keep: dict, changed: dict) -> bool:
+        body = _read(self.topbook_csv, mark["offset"], end)
+        raw = _parse(_header(self.topbook_csv), body)
+        ts, valid = _valid_times(raw, ("bid_px", "ask_px"))
+        old = valid & (ts <= mark["cut_ns"])
+        if old.sum() > 2 or (valid & ~old)[:int(np.flatnonzero(old)[-1]) + 1 if old.any() else 0].any():
+            return False
+        bases = _multi_bases(_clean_topbook(raw), self.speeds.values())
+        cut = pd.Timestamp(mark["cut_ns"], unit="ns", tz="UTC")
+        for speed, dt in self.speeds.items():
+            m = self.p[f"m_{speed}"]
+            k = keep[m]
+            if k < MICRO_LOOKBACK:
+                return False
+            base = bases[dt].loc[bases[dt].index > cut]
+            history = read_rows(m, rows[m], k - MICRO_LOOKBACK, k, exact=True)
+            if len(base) and base.index[0] != history["t0"].iloc[-1] + pd.Timedelta(seconds=dt):
+                return False
+            out = _derive_features(base, history) if len(base) else base.iloc[:0]
+            print(f"[incremental] micro {dt}s: {len(out)} barres depuis la ligne {k}")
+            rows[m] = rewrite_from(m, rows[m], k, out)
+            changed[m] = k
+        return True
+
+    def _labels(self, o: dict, rows: dict, changed: dict) -> None:
+        if o["c"] not in changed:
+            return
+        a = max(0, changed[o["c"]] - self.h)
+        out = labels_df(read_rows(o["c"], rows[o["c"]], a), self.h, self.eps)
+        rows[o["lbl"]] = rewrite_from(o["lbl"], rows[o["lbl"]], a, out)
+        changed[o["lbl"]] = a
+
+    def _patterns(self, o: dict, rows: dict, changed: dict) -> None:
+        if o["c"] not in changed:
+            return
+        a = changed[o["c"]]
+        start = max(0, a - PATTERN_LOOKBACK)
+        out = detect_signals_df(read_rows(o["c"], rows[o["c"]], start)).iloc[a - start:]
+        rows[o["sig_candle"]] = rewrite_from(o["sig_candle"], rows[o["sig_candle"]], a, out)
+        changed[o["sig_candle"]] = a
+
+    def _micro_signal(self, o: dict, speed: str, rows: dict, changed: dict, medians: dict) -> None:
+        m, sig = o["m"], o["sig_micro"]
+        if m not in changed:
+            return
+        med = _vol_median(m)
+        # la médiane remplit les depth_vol nuls de toute la série: si elle bouge, le
+        # fichier est réécrit, mais les backtests ne repartent que de la première
+        # ligne dont le signal change
+        a = changed[m] if med == medians.get(speed) else 0
+        medians[speed] = med
+        out = micro_signal_df(read_rows(m, rows[m], a), self.tau, self.max_spread_bp,
+                              vol_fill=np.nan if med is None else med)
+        first = a
+        if a < changed[m]:
+            old = pd.read_csv(sig, usecols=["signal_micro"])["signal_micro"].to_numpy()[:changed[m]]
+            diff = np.flatnonzero(out["signal_micro"].to_numpy()[:len(old)] != old)
+            first = int(diff[0]) if len(diff) else changed[m]
+        rows[sig] = rewrite_from(sig, rows[sig], a, out)
+        changed[sig] = first
+
+    def _backtest(self, o: dict, kind: str, rows: dict, changed: dict) -> bool:
+        lbl, sig, m, bt = o["lbl"], o[f"sig_{kind}"], o["m"], o[f"bt_{kind}"]
+        if not any(f in changed for f in (lbl, sig, m)):
+            return False
+        n_c = rows[lbl]
+        a = rows[bt]
+        if lbl in changed:
+            a = min(a, changed[lbl] - self.h)
+        # signaux/micro indexés par t0: première bougie touchée par leur changement
+        for f in (sig, m):
+            if f in changed and changed[f] < rows[f]:
+                t = read_rows(f, rows[f], changed[f], changed[f] + 1)["t0"].iloc[0]
+                a = min(a, rows_before(lbl, n_c, t.value))
+        a = max(a, 0)
+        start = max(0, a - SIGNAL_LAG)
+        df_c = read_rows(lbl, n_c, start)
+        t0 = df_c["t0"].iloc[0].value if len(df_c) else 0
+        df_s = read_rows(sig, rows[sig], rows_before(sig, rows[sig], t0))
+        df_m = read_rows(m, rows[m], rows_before(m, rows[m], t0))
+        res, _ = run_bt_df(df_c, df_s, df_m, self.h, self.fees_bp, SIGNAL_LAG)
+        rows[bt] = rewrite_from(bt, rows[bt], a, res.iloc[a - start:])
+        print(f"[incremental] bt {kind} {o['c']}: {len(res) - (a - start)} lignes depuis la ligne {a}")
+        return True
+
+    # -- état
+
+    def _finish(self, results: dict, rows: dict, medians: dict) -> dict:
+        secs = sorted(self.speeds.values())
+        t_mark = trades_mark(self.trades_csv, secs)
+        b_mark = topbook_mark(self.topbook_csv, secs)
+        files = {}
+        for speed in self.speeds:
+            for f in self.outputs(speed).values():
+                n = rows[f] if f in rows else count_rows(f)
+                files[f] = {"rows": n, "size": os.path.getsize(f)}
+        keep = {}
+        for speed in self.speeds:
+            c, m = self.p[f"c_{speed}"], self.p[f"m_{speed}"]
+            if t_mark:
+                keep[c] = rows_before(c, files[c]["rows"], t_mark["cut_ns"])
+            if b_mark:
+                keep[m] = rows_before(m, files[m]["rows"], b_mark["cut_ns"], inclusive=True)
+            if speed not in medians:
+                medians[speed] = _vol_median(m)
+        stats = {f"bt_{k}_{s}": results.get(f"bt_{k}_{s}") for s in self.speeds for k in ("candle", "micro")}
+        self.state.save({
+            "params": self.params,
+            "marks": {"trades": t_mark, "topbook": b_mark},
+            "files": files, "keep": keep, "medians": medians, "stats": stats,
+        })
+        return {f"bt_{k}_{s}": stats[f"bt_{k}_{self.alias[s]}"] for s in self.alias for k in ("candle", "micro")}
@@ -3,6 +3,7 @@ from pathlib import Path
 from datetime import datetime, timezone
 import websockets
 from websockets.exceptions import ConnectionClosed, ConnectionClosedError, ConnectionClosedOK
+from l2_recorder import L2Recorder, OffTickPrice
 
 WS_URL = "wss://ws.kraken.com/v2"
 
@@ -38,7 +39,7 @@ def _csv_writer(path, header):
         w.writerow(header)
     return f, w
 
-async def _stream_once(pair, depth, tw, bw, log_every):
+async def _stream_once(pair, depth, tw, bw, log_every, l2w=None):
     bids, asks = {}, {}
     n_trade = 0
     n_book = 0
@@ -87,6 +88,8 @@ async def _stream_once(pair, depth, tw, bw, log_every):
                 elif typ == "update":
                     _apply(bids, payload.get("bids"))
                     _apply(asks, payload.get("asks"))
+                if l2w is not None:
+                    l2w.record(typ, payload.get("timestamp"), payload.get("bids"), payload.get("asks"))
 
                 bid_px, bid_qty = _best(bids, "bid")
                 ask_px, ask_qty = _best(asks, "ask")
@@ -108,25 +111,33 @@ async def _stream_once(pair, depth, tw, bw, log_every):
                 print(f"[ws] trades={n_trade} book_updates={n_book}")
                 last_log = now
 
-async def run_ws(pair, depth, out_trades, out_topbook, log_every=10, max_backoff=60):
+async def run_ws(pair, depth, out_trades, out_topbook, log_every=10, max_backoff=60,
+                 out_l2=None, tick_size=0.1, l2_checkpoint_every=2000):
     # writers en append pour survivre aux reconnexions
     ft, tw = _csv_writer(out_trades,  ["timestamp","symbol","side","price","qty","ord_type","trade_id"])
     fb, bw = _csv_writer(out_topbook, ["timestamp","symbol","bid_px","bid_qty","ask_px","ask_qty","mid","spread","bid_depth_qty","ask_depth_qty"])
+    # carnet complet (snapshot + deltas) optionnel, format binaire l2_recorder
+    l2w = L2Recorder(out_l2, pair, depth=depth, tick_size=tick_size,
+                     checkpoint_every=l2_checkpoint_every) if out_l2 else None
     backoff = 1
     try:
         while True:
             try:
-                await _stream_once(pair, depth, tw, bw, log_every)
+                await _stream_once(pair, depth, tw, bw, log_every, l2w)
             except (ConnectionClosed, ConnectionClosedError, ConnectionClosedOK) as e:
                 print(f"[ws] déconnecté: {type(e).__name__} → reconnexion dans {backoff}s")
             except asyncio.TimeoutError:
                 print(f"[ws] timeout → reconnexion dans {backoff}s")
+            except OffTickPrice:
+                raise  # mauvais --tick_size: se reconnecter n'y changerait rien
             except Exception as e:
                 print(f"[ws] erreur: {e} → reconnexion dans {backoff}s")
             await asyncio.sleep(backoff)
             backoff = min(backoff * 2, max_backoff)  # backoff exponentiel
     finally:
         ft.close(); fb.close()
+        if l2w is not None:
+            l2w.close()
 
 def parse_args():
     ap = argparse.ArgumentParser()
@@ -135,12 +146,17 @@ def parse_args():
     ap.add_argument("--out_trades", type=str, default="data/kraken_trades.csv")
     ap.add_argument("--out_topbook", type=str, default="data/kraken_topbook.csv")
     ap.add_argument("--log_every", type=int, default=10)
+    ap.add_argument("--out_l2", type=str, default=None, help="data/*_l2.bin (carnet complet, optionnel)")
+    ap.add_argument("--tick_size", type=float, default=0.1, help="Pas de prix de la paire pour l'encodage L2 (prix hors grille = erreur)")
+    ap.add_argument("--l2_checkpoint_every", type=int, default=2000, help="Messages entre deux checkpoints L2")
     return ap.parse_args()
 
 def main():
     a = parse_args()
     try:
-        asyncio.run(run_ws(a.pair, a.depth, a.out_trades, a.out_topbook, a.log_every))
+        asyncio.run(run_ws(a.pair, a.depth, a.out_trades, a.out_topbook, a.log_every,
+                           out_l2=a.out_l2, tick_size=a.tick_size,
+                           l2_checkpoint_every=a.l2_checkpoint_every))
     except KeyboardInterrupt:
         print("\n[ws] arrêté")
 
@@ -0,0 +1,314 @@
+# src/l2_recorder.py
+"""
+Enregistrement binaire compact du carnet L2 (snapshot + deltas Kraken).
+
+Format du fichier:
+  entête  : b"L2R1", version, tick_size, qty_scale, depth, symbole
+  blocs   : chaque bloc commence par un checkpoint (carnet complet) suivi des deltas.
+            entête de bloc (magic, n_msgs, n_levels, ts_first, ts_last, taille) puis
+            payload zlib de colonnes numpy:
+              kind[n_msgs] u1, dts[n_msgs] i8 (delta ns), n_bids/n_asks[n_msgs] u4,
+              px[n_levels] i8 (ticks, delta encodés), qty[n_levels] i8 (qty * qty_scale)
+Une quantité nulle dans un delta supprime le niveau.
+"""
+
+from __future__ import annotations
+
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from orderbook_l2 import L2Book
+
+MAGIC = b"L2R1"
+BLOCK_MAGIC = b"L2BK"
+VERSION = 1
+
+KIND_SNAPSHOT = 0    # snapshot envoyé par l'exchange
+KIND_UPDATE = 1      # delta
+KIND_CHECKPOINT = 2  # carnet complet écrit par l'enregistreur
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TICK_TOL = 1e-6  # écart toléré (en ticks) entre prix / tick_size et l'entier le plus proche
+
+_FILE_HDR = struct.Struct("<4sHdqH")
+_BLOCK_HDR = struct.Struct("<4sIIqqI")
+
+class OffTickPrice(ValueError):
+    """Prix qui n'est pas un multiple de tick_size: l'encodage en ticks le déformerait."""
+
+def ts_to_ns(value) -> int:
+    """ISO8601 (ou None → maintenant) vers epoch en nanosecondes."""
+    if not value:
+        return time.time_ns()
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    # en entiers: dt.timestamp() passe par un float et peut perdre une microseconde
+    return (dt - EPOCH) // timedelta(microseconds=1) * 1000
+
+@dataclass
+class L2Header:
+    tick_size: float
+    qty_scale: int
+    depth: int
+    symbol: str
+
+    @property
+    def px_decimals(self) -> int:
+        # nb de décimales pour reconvertir les ticks sans bruit flottant
+        text = f"{self.tick_size:.12f}".rstrip("0")
+        return len(text.split(".")[1]) if "." in text else 0
+
+@dataclass
+class L2Block:
+    offset: int
+    ts_first: int
+    ts_last: int
+    kind: np.ndarray
+    ts: np.ndarray
+    n_bids: np.ndarray
+    n_asks: np.ndarray
+    px: np.ndarray
+    qty: np.ndarray
+
+def _write_header(f: BinaryIO, hdr: L2Header) -> None:
+    sym = hdr.symbol.encode("utf-8")
+    f.write(_FILE_HDR.pack(MAGIC, VERSION, float(hdr.tick_size), int(hdr.qty_scale), int(hdr.depth)))
+    f.write(struct.pack("<B", len(sym)) + sym)
+
+def read_header(f: BinaryIO) -> L2Header:
+    raw = f.read(_FILE_HDR.size)
+    assert len(raw) == _FILE_HDR.size, "Entête L2 tronquée"
+    magic, version, tick, scale, depth = _FILE_HDR.unpack(raw)
+    assert magic == MAGIC, "Fichier L2 invalide"
+    assert version == VERSION, f"Version L2 non supportée: {version}"
+    (n,) = struct.unpack("<B", f.read(1))
+    symbol = f.read(n).decode("utf-8")
+    return L2Header(tick_size=tick, qty_scale=scale, depth=depth, symbol=symbol)
+
+class L2Recorder:
+    """
+    Écrit le snapshot et chaque delta du canal book dans un fichier binaire.
+    Un checkpoint complet ouvre chaque bloc (toutes les `checkpoint_every` messages
+    ou `checkpoint_secs` secondes), ce qui permet de reprendre la lecture n'importe où.
+    tick_size doit être le pas de prix de la paire: un prix hors de la grille lève
+    OffTickPrice au lieu d'être arrondi.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        symbol: str,
+        depth: int = 25,
+        tick_size: float = 0.1,
+        qty_scale: int = 10**8,
+        checkpoint_every: int = 2000,
+        checkpoint_secs: float = 60.0,
+    ) -> None:
+        assert tick_size > 0, "tick_size doit etre > 0"
+        assert checkpoint_every >= 1
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        hdr = L2Header(tick_size=float(tick_size), qty_scale=int(qty_scale), depth=int(depth), symbol=symbol)
+        if p.exists() and p.stat().st_size > 0:
+            # reprise en append: on garde les paramètres d'encodage du fichier
+            with open(p, "rb") as f:
+                hdr = read_header(f)
+            self.f = open(p, "ab")
+        else:
+            self.f = open(p, "wb")
+            _write_header(self.f, hdr)
+            self.f.flush()
+        self.header = hdr
+        self.book = L2Book(depth=hdr.depth)
+        self.checkpoint_every = int(checkpoint_every)
+        self.checkpoint_ns = int(checkpoint_secs * 1e9)
+        self._inv_tick = 1.0 / hdr.tick_size
+        self._has_book = False
+        self._reset_block()
+
+    def _reset_block(self) -> None:
+        self._kind: List[int] = []
+        self._ts: List[int] = []
+        self._nb: List[int] = []
+        self._na: List[int] = []
+        self._px: List[int] = []
+        self._qty: List[int] = []
+
+    def _push(self, kind: int, ts_ns: int, bids, asks) -> None:
+        scale = self.header.qty_scale
+        levels = list(bids) + list(asks)
+        px = [self._ticks(p) for p, _ in levels]  # valide tout avant d'écrire dans le bloc
+        self._px.extend(px)
+        self._qty.extend(int(round(q * scale)) for _, q in levels)
+        self._kind.append(kind)
+        self._ts.append(ts_ns)
+        self._nb.append(len(bids))
+        self._na.append(len(asks))
+
+    def _ticks(self, px: float) -> int:
+        x = px * self._inv_tick
+        t = round(x)
+        if abs(x - t) > _TICK_TOL:
+            raise OffTickPrice(f"Prix {px!r} hors de la grille tick_size={self.header.tick_size!r} "
+                               f"({self.header.symbol}): vérifier --tick_size")
+        return int(t)
+
+    def _push_checkpoint(self, ts_ns: int) -> None:
+        bids = sorted(self.book.bids.items(), reverse=True)
+        asks = sorted(self.book.asks.items())
+        self._push(KIND_CHECKPOINT, ts_ns, bids, asks)
+
+    def record(self, typ: str, ts, bids: Optional[List[dict]], asks: Optional[List[dict]]) -> None:
+        """Enregistre un message book Kraken v2 (typ ∈ {snapshot, update})."""
+        ts_ns = ts_to_ns(ts)
+        bids = bids or []
+        asks = asks or []
+        if typ == "snapshot":
+            self.book.reset_snapshot(bids, asks)
+            self._has_book = True
+            self._push(KIND_SNAPSHOT, ts_ns,
+                       [(float(b["price"]), float(b["qty"])) for b in bids],
+                       [(float(a["price"]), float(a["qty"])) for a in asks])
+        elif typ == "update":
+            if not self._has_book:
+                return  # delta sans snapshot: inutilisable
+            self.book.apply_update(bids, asks)
+            if not self._kind:
+                # début de bloc: checkpoint de l'état après application du delta
+                self._push_checkpoint(ts_ns)
+            else:
+                self._push(KIND_UPDATE, ts_ns,
+                           [(float(b["price"]), float(b["qty"])) for b in bids],
+                           [(float(a["price"]), float(a["qty"])) for a in asks])
+        else:
+            return
+
+        if len(self._kind) >= self.checkpoint_every or ts_ns - self._ts[0] >= self.checkpoint_ns:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._kind:
+            return
+        ts = np.asarray(self._ts, dtype=np.int64)
+        px = np.asarray(self._px, dtype=np.int64)
+        dts = np.diff(ts, prepend=ts[0])
+        dpx = np.diff(px, prepend=0) if len(px) else px
+        payload = b"".join([
+            np.asarray(self._kind, dtype=np.uint8).tobytes(),
+            dts.tobytes(),
+            np.asarray(self._nb, dtype=np.uint32).tobytes(),
+            np.asarray(self._na, dtype=np.uint32).tobytes(),
+            dpx.tobytes(),
+            np.asarray(self._qty, dtype=np.int64).tobytes(),
+        ])
+        comp = zlib.compress(payload, 6)
+        self.f.write(_BLOCK_HDR.pack(BLOCK_MAGIC, len(ts), len(px), int(ts[0]), int(ts[-1]), len(comp)))
+        self.f.write(comp)
+        self.f.flush()
+        self._reset_block()
+
+    def close(self) -> None:
+        self.flush()
+        self.f.close()
+
+def _decode_block(offset: int, hdr_raw: bytes, comp: bytes, hdr: L2Header) -> L2Block:
+    _, n_msgs, n_lv, ts_first, ts_last, _ = _BLOCK_HDR.unpack(hdr_raw)
+    buf = zlib.decompress(comp)
+    pos = 0
+
+    def take(dtype, n):
+        nonlocal pos
+        arr = np.frombuffer(buf, dtype=dtype, count=n, offset=pos)
+        pos += arr.nbytes
+        return arr
+
+    kind = take(np.uint8, n_msgs)
+    ts = np.cumsum(take(np.int64, n_msgs)) + ts_first
+    n_bids = take(np.uint32, n_msgs).astype(np.int64)
+    n_asks = take(np.uint32, n_msgs).astype(np.int64)
+    px = np.round(np.cumsum(take(np.int64, n_lv)) * hdr.tick_size, hdr.px_decimals)
+    qty = take(np.int64, n_lv) / float(hdr.qty_scale)
+    return L2Block(offset=offset, ts_first=ts_first, ts_last=ts_last,
+                   kind=kind, ts=ts, n_bids=n_bids, n_asks=n_asks, px=px, qty=qty)
+
+def read_block(f: BinaryIO, offset: int, hdr: L2Header) -> Optional[L2Block]:
+    f.seek(offset)
+    raw = f.read(_BLOCK_HDR.size)
+    if len(raw) < _BLOCK_HDR.size:
+        return None
+    magic, _, _, _, _, size = _BLOCK_HDR.unpack(raw)
+    assert magic == BLOCK_MAGIC, f"Bloc L2 corrompu à l'offset {offset}"
+    comp = f.read(size)
+    if len(comp) < size:
+        return None  # bloc partiellement écrit (arrêt brutal)
+    return _decode_block(offset, raw, comp, hdr)
+
+def iter_block_headers(path: str) -> Iterator[Tuple[int, int, int, int]]:
+    """(offset, n_msgs, ts_first, ts_last) pour chaque bloc, sans décompression."""
+    with open(path, "rb") as f:
+        read_header(f)
+        while True:
+            offset = f.tell()
+            raw = f.read(_BLOCK_HDR.size)
+            if len(raw) < _BLOCK_HDR.size:
+                return
+            magic, n_msgs, _, ts_first, ts_last, size = _BLOCK_HDR.unpack(raw)
+            assert magic == BLOCK_MAGIC, f"Bloc L2 corrompu à l'offset {offset}"
+            f.seek(size, 1)
+            yield offset, n_msgs, ts_first, ts_last
+
+def iter_messages(block: L2Block) -> Iterator[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """(ts_ns, kind, bid_px, bid_qty, ask_px, ask_qty) pour chaque message du bloc."""
+    ends = np.cumsum(block.n_bids + block.n_asks)
+    start = 0
+    for i in range(len(block.kind)):
+        mid = start + int(block.n_bids[i])
+        end = int(ends[i])
+        yield (int(block.ts[i]), int(block.kind[i]),
+               block.px[start:mid], block.qty[start:mid],
+               block.px[mid:end], block.qty[mid:end])
+        start = end
+
+def apply_message(book: L2Book, kind: int, bid_px, bid_qty, ask_px, ask_qty) -> None:
+    book.set_levels(zip(bid_px.tolist(), bid_qty.tolist()),
+                    zip(ask_px.tolist(), ask_qty.tolist()),
+                    reset=(kind != KIND_UPDATE))
+
+def read_l2(path: str) -> Tuple[L2Header, Iterator[L2Block]]:
+    f = open(path, "rb")
+    hdr = read_header(f)
+
+    def _blocks() -> Iterator[L2Block]:
+        try:
+            while True:
+                blk = read_block(f, f.tell(), hdr)
+                if blk is None:
+                    return
+                yield blk
+        finally:
+            f.close()
+
+    return hdr, _blocks()
+
+def load_book(path: str, until_ns: Optional[int] = None) -> L2Book:
+    """Rejoue le fichier et retourne le carnet à `until_ns` (fin du fichier si None)."""
+    hdr, blocks = read_l2(path)
+    book = L2Book(depth=hdr.depth)
+    for blk in blocks:
+        if until_ns is not None and blk.ts_first > until_ns:
+            break
+        for ts_ns, kind, bp, bq, ap, aq in iter_messages(blk):
+            if until_ns is not None and ts_ns > until_ns:
+                return book
+            apply_message(book, kind, bp, bq, ap, aq)
+    return book
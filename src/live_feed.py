@@ -10,7 +10,7 @@ import threading
 from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Deque, Dict, List, Optional
+from typing import Callable, Deque, Dict, List, Optional
 
 import statistics
 
@@ -66,8 +66,11 @@ class KrakenLiveFeed:
         depth: int = 25,
         history_hours: float = 48.0,
         log_every: float = 30.0,
+        on_trade: Optional[Callable[[float, datetime], None]] = None,
     ) -> None:
         self.pair = pair
+        # called with (price, timestamp) for every trade, on the websocket thread: keep it cheap
+        self.on_trade = on_trade
         self.depth = depth
         self.log_every = log_every
         self.max_age = timedelta(hours=history_hours)
@@ -287,6 +290,11 @@ class KrakenLiveFeed:
         with self._lock:
             self._trades.append(record)
             self._trim_trades_locked()
+        if self.on_trade is not None:
+            try:
+                self.on_trade(record["price"], ts)
+            except Exception as exc:
+                self._status = f"on_trade error: {exc}"
 
     def _trim_trades_locked(self) -> None:
         if not self._trades:
@@ -0,0 +1,224 @@
+# src/montecarlo.py
+"""
+Robustesse Monte Carlo du TradingSimulator.
+Chaque trajectoire synthétique est rejouée avec TradingSimulator.run_batch (sans historique
+par bougie) dans des workers parallèles; sortie: une ligne par trajectoire (équité finale,
+max_drawdown_pct, nombre de trades, ...) et les quantiles de ces distributions.
+
+Sources de trajectoires (--source):
+  bootstrap  rééchantillonnage par blocs des bougies historiques: rendements close/close et
+             open/high/low relatifs à la clôture précédente, tirés par blocs de --block bougies
+             (garde la volatilité locale et l'enchaînement des mèches)
+  generator  marche aléatoire de transactions comme generator.generate_trades (vectorisée,
+             sans CSV), agrégée en bougies de --dt secondes
+
+Signaux (--signals):
+  patterns   recalculés sur chaque trajectoire (pattern_kernel)
+  resample   signal / micro_score / mom_signal historiques tirés avec leur bougie (bootstrap)
+
+Les trajectoires sont déterminées par (seed, numéro): le résultat ne dépend ni du nombre
+de workers ni de la taille des lots.
+
+Exécution:
+  python src/montecarlo.py --candles data/btc_usd_60s_sig_candle.csv --n_paths 10000 \\
+      --block 60 --workers 8 --out data/btc_usd_60s_mc.csv
+  python src/montecarlo.py --source generator --n_paths 2000 --n_trades 86400 --dt 60 --out data/mc_gen.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from candles import ohlcv_from_arrays
+from colcache import read_csv_cached, write_csv
+from patterns_candles import pattern_kernel
+from simulator import TradingSimulator
+from shared_arrays import SHARED, attach, share
+from sweep_sim import load_dataset
+
+SOURCES = ("bootstrap", "generator")
+SIGNALS = ("patterns", "resample")
+BARS = ("rel_open", "rel_high", "rel_low", "rel_close", "signal", "micro_score", "mom_signal")
+METRICS = ("equity", "pnl_pct", "max_drawdown_pct", "n_trades", "n_closed_trades", "win_rate",
+           "profit_factor", "path_return_pct")
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+def load_bars(candles_csv: str, micro_csv: Optional[str] = None,
+              signal_col: str = "signal_candle") -> Dict[str, np.ndarray]:
+    """
+    Bougies historiques prêtes au rééchantillonnage: pour chaque bougie t (à partir de la 2e),
+    open/high/low/close divisés par close[t-1], avec les signaux de t (même fusion que sweep_sim).
+    Les bougies non finies sont écartées. 'start_price' = première clôture.
+    """
+    data = load_dataset(candles_csv, micro_csv, signal_col)
+    df = read_csv_cached(candles_csv)
+    for c in ("open", "high", "low"):
+        assert c in df.columns, f"Colonne manquante: {c}"
+    close = data["close"]
+    prev = close[:-1]
+    rel = {f"rel_{c}": pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)[1:] / prev
+           for c in ("open", "high", "low")}
+    rel["rel_close"] = close[1:] / prev
+    ok = np.logical_and.reduce([np.isfinite(v) & (v > 0) for v in rel.values()])
+    assert ok.sum() > 1, "Pas assez de bougies valides"
+    bars = {name: v[ok] for name, v in rel.items()}
+    for name in ("signal", "micro_score", "mom_signal"):
+        bars[name] = data[name][1:][ok]
+    bars["start_price"] = np.array([close[np.isfinite(close)][0]])
+    return bars
+
+def bootstrap_index(n_src: int, n_bars: int, block: int, seed: int, paths) -> np.ndarray:
+    """(len(paths), n_bars) indices de bougies sources: blocs contigus de longueur block."""
+    block = max(1, min(block, n_src))
+    n_blocks = -(-n_bars // block)
+    starts = np.stack([np.random.default_rng([seed, int(p)]).integers(0, n_src - block + 1, n_blocks)
+                       for p in paths])
+    return (starts[:, :, None] + np.arange(block)).reshape(len(paths), -1)[:, :n_bars]
+
+def bootstrap_paths(bars: Dict[str, np.ndarray], idx: np.ndarray) -> Dict[str, np.ndarray]:
+    """OHLC (P, n) reconstruits depuis les rapports tirés: close cumulé, open/high/low sur close[t-1]."""
+    close = bars["start_price"][0] * np.cumprod(bars["rel_close"][idx], axis=1)
+    prev = np.empty_like(close)
+    prev[:, 0] = bars["start_price"][0]
+    prev[:, 1:] = close[:, :-1]
+    out = {c: prev * bars[f"rel_{c}"][idx] for c in ("open", "high", "low")}
+    out["close"] = close
+    return out
+
+def generator_candles(seed: int, path: int, n_trades: int = 5000, start_price: float = 100.0,
+                      volatility: float = 0.002, avg_volume: int = 50, dt: int = 60) -> Dict[str, np.ndarray]:
+    """
+    Équivalent vectorisé de generator.generate_trades (une transaction par seconde, prix arrondi
+    au centime, volume exponentiel >= 1), agrégé en bougies de dt secondes.
+    """
+    rng = np.random.default_rng([seed, int(path)])
+    price = np.round(start_price * np.cumprod(1 + rng.normal(0, volatility, n_trades)), 2)
+    volume = np.maximum(1, np.floor(rng.exponential(avg_volume, n_trades)))
+    ts_ns = np.arange(n_trades, dtype=np.int64) * 1_000_000_000
+    return ohlcv_from_arrays(ts_ns, price, volume, dt)
+
+def _pattern_signals(ohlc: Dict[str, np.ndarray]):
+    ind = pattern_kernel(ohlc["open"], ohlc["high"], ohlc["low"], ohlc["close"])
+    return ind["signal_candle"], ind["mom_signal"].astype(float)
+
+def _simulate(close, signal, micro_score, mom_signal, base: dict) -> dict:
+    sim = TradingSimulator(**base)
+    sim.run_batch(close, signal, micro_score, mom_signal, record_history=False)
+    summary = sim.summary()
+    summary["path_return_pct"] = (close[-1] / close[0] - 1) * 100 if len(close) else 0.0
+    return {m: summary.get(m) for m in METRICS}
+
+def _run_paths(paths: List[int], params: dict, data: Optional[Dict[str, np.ndarray]] = None) -> List[dict]:
+    data = SHARED if data is None else data
+    base, seed = params["base"], params["seed"]
+    if params["source"] == "bootstrap":
+        idx = bootstrap_index(len(data["rel_close"]), params["n_bars"], params["block"], seed, paths)
+        ohlc = bootstrap_paths(data, idx)
+    rows = []
+    for k, p in enumerate(paths):
+        if params["source"] == "bootstrap":
+            bars = {c: v[k] for c, v in ohlc.items()}
+        else:
+            bars = generator_candles(seed, p, **params["generator"])
+        if params["signals"] == "resample":
+            sig, micro, mom = data["signal"][idx[k]], data["micro_score"][idx[k]], data["mom_signal"][idx[k]]
+        else:
+            (sig, mom), micro = _pattern_signals(bars), None
+        rows.append({"path": p, "n_bars": len(bars["close"]),
+                     **_simulate(bars["close"], sig, micro, mom, base)})
+    return rows
+
+def monte_carlo(n_paths: int, source: str = "bootstrap", bars: Optional[Dict[str, np.ndarray]] = None,
+                n_bars: Optional[int] = None, block: int = 60, signals: str = "patterns",
+                base: Optional[dict] = None, generator: Optional[dict] = None, seed: int = 0,
+                workers: int = 1, chunk: int = 32) -> pd.DataFrame:
+    """
+    Rejoue n_paths trajectoires synthétiques et retourne une ligne par trajectoire
+    (path, n_bars + METRICS), triées par numéro de trajectoire.
+    bootstrap: bars = load_bars(...), n_bars = longueur des trajectoires (défaut: historique).
+    generator: generator = paramètres de generator_candles (n_trades, volatility, dt, ...).
+    """
+    assert n_paths > 0, "n_paths doit être > 0"
+    assert source in SOURCES, f"source inconnue: {source}"
+    assert signals in SIGNALS, f"signals inconnu: {signals}"
+    params = {"source": source, "signals": signals, "seed": seed, "base": dict(base or {}),
+              "generator": dict(generator or {}), "block": block}
+    if source == "bootstrap":
+        assert bars is not None, "bootstrap: bars requis (load_bars)"
+        params["n_bars"] = n_bars or len(bars["rel_close"])
+    else:
+        assert signals == "patterns", "generator: pas de signaux historiques, utiliser signals='patterns'"
+    batches = [list(range(i, min(i + chunk, n_paths))) for i in range(0, n_paths, max(1, chunk))]
+    if workers <= 1 or len(batches) == 1:
+        rows = [r for b in batches for r in _run_paths(b, params, bars)]
+    elif source == "bootstrap":
+        with share(bars, BARS + ("start_price",)) as spec, \
+                ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(spec,)) as pool:
+            rows = [r for part in pool.map(_run_paths, batches, [params] * len(batches)) for r in part]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = [r for part in pool.map(_run_paths, batches, [params] * len(batches), [{}] * len(batches))
+                    for r in part]
+    return pd.DataFrame(rows)
+
+def distribution(res: pd.DataFrame, quantiles=QUANTILES) -> pd.DataFrame:
+    """Quantiles, moyenne et écart-type de chaque métrique (une ligne par statistique)."""
+    cols = [m for m in METRICS if m in res.columns]
+    values = res[cols].apply(pd.to_numeric, errors="coerce")
+    q = values.quantile(list(quantiles))
+    q.index = [f"p{round(x * 100):02d}" for x in quantiles]
+    return pd.concat([q, values.mean().to_frame("mean").T, values.std().to_frame("std").T])
+
+def _args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", default="bootstrap", choices=SOURCES)
+    ap.add_argument("--candles", default=None, help="CSV bougies + signaux (sortie de patterns_candles), bootstrap")
+    ap.add_argument("--micro", default=None, help="CSV signaux micro (optionnel, avec --signals resample)")
+    ap.add_argument("--signal_col", default="signal_candle")
+    ap.add_argument("--signals", default="patterns", choices=SIGNALS)
+    ap.add_argument("--n_paths", type=int, default=1000)
+    ap.add_argument("--n_bars", type=int, default=0, help="Longueur des trajectoires (0: historique)")
+    ap.add_argument("--block", type=int, default=60, help="Taille des blocs rééchantillonnés")
+    ap.add_argument("--n_trades", type=int, default=86400, help="generator: transactions par trajectoire")
+    ap.add_argument("--volatility", type=float, default=0.002)
+    ap.add_argument("--start_price", type=float, default=100.0)
+    ap.add_argument("--dt", type=int, default=60, help="generator: durée des bougies (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--initial_cash", type=float, default=100.0)
+    ap.add_argument("--allow_short", type=int, default=0)
+    ap.add_argument("--fee_bps", type=float, default=5.0)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--out", required=True, help="CSV une ligne par trajectoire")
+    ap.add_argument("--out_quantiles", default=None)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    base = {"initial_cash": a.initial_cash, "allow_short": bool(a.allow_short), "fee_bps": a.fee_bps}
+    bars = None
+    if a.source == "bootstrap":
+        assert a.candles, "--candles requis avec --source bootstrap"
+        assert Path(a.candles).exists(), f"Introuvable: {a.candles}"
+        bars = load_bars(a.candles, a.micro, a.signal_col)
+    gen = {"n_trades": a.n_trades, "start_price": a.start_price, "volatility": a.volatility, "dt": a.dt}
+    res = monte_carlo(a.n_paths, a.source, bars, a.n_bars or None, a.block, a.signals, base, gen,
+                      a.seed, a.workers)
+    write_csv(res, a.out)
+    dist = distribution(res)
+    if a.out_quantiles:
+        write_csv(dist.rename_axis("stat").reset_index(), a.out_quantiles)
+    print(f"[montecarlo] {len(res)} trajectoires ({a.source}, signaux {a.signals}) -> {a.out}")
+    if bars is not None:
+        data = load_dataset(a.candles, a.micro, a.signal_col)
+        ref = _simulate(data["close"], data["signal"], data["micro_score"], data["mom_signal"], base)
+        print("historique: " + ", ".join(f"{k}={v:.4g}" for k, v in ref.items() if v is not None))
+    print(dist.to_string(float_format=lambda x: f"{x:.4g}"))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # src/crypto/orderbook_l2.py
 from __future__ import annotations
-from typing import Dict, Tuple, List, Literal, Optional
+from typing import Dict, Iterable, Tuple, List, Literal, Optional
 from dataclasses import dataclass
 
 Side = Literal["bids", "asks"]
@@ -29,6 +29,15 @@ class L2Book:
         self._gc_zero()
         self._trim()
 
+    def set_levels(self, bids: Iterable[Tuple[float, float]], asks: Iterable[Tuple[float, float]],
+                   reset: bool = False) -> None:
+        # variante sans dicts {price, qty} pour le rejeu des fichiers binaires
+        if reset:
+            self.bids.clear(); self.asks.clear()
+        for px, q in bids: self._set("bids", px, q)
+        for px, q in asks: self._set("asks", px, q)
+        self._trim()
+
     def best(self) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
         bid = max(self.bids.items(), key=lambda x: x[0]) if self.bids else None
         ask = min(self.asks.items(), key=lambda x: x[0]) if self.asks else None
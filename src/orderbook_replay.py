@@ -0,0 +1,165 @@
+# src/orderbook_replay.py
+"""
+Rejeu indexé des fichiers L2 produits par l2_recorder.
+L'index est creux: un point par bloc (offset, ts_first, ts_last). Chaque bloc débute
+par un carnet complet, donc restaurer le carnet à t ne décode qu'un seul bloc et
+n'applique que les deltas postérieurs à son checkpoint.
+
+Exemple (carnet à chaque clôture de bougie):
+  python src/orderbook_replay.py --in data/kraken_l2.bin --candles data/btc_usd_60s.csv --dt 60 --out data/btc_usd_book_60s.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from l2_recorder import L2Block, apply_message, iter_block_headers, iter_messages, read_block, read_header
+from orderbook_l2 import L2Book
+
+class L2Replay:
+    def __init__(self, path: str) -> None:
+        p = Path(path); assert p.exists(), f"Introuvable: {p}"
+        self.path = str(p)
+        self.f = open(p, "rb")
+        self.header = read_header(self.f)
+        idx = list(iter_block_headers(self.path))
+        self.offsets = np.array([r[0] for r in idx], dtype=np.int64)
+        self.ts_first = np.array([r[2] for r in idx], dtype=np.int64)
+        self.ts_last = np.array([r[3] for r in idx], dtype=np.int64)
+        self._cached: Optional[Tuple[int, L2Block]] = None
+
+    def __enter__(self) -> "L2Replay":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.f.close()
+
+    @property
+    def start_ns(self) -> Optional[int]:
+        return int(self.ts_first[0]) if len(self.ts_first) else None
+
+    @property
+    def end_ns(self) -> Optional[int]:
+        return int(self.ts_last[-1]) if len(self.ts_last) else None
+
+    def _block_for(self, ts_ns: int) -> int:
+        # dernier bloc dont le checkpoint est <= ts (-1 si ts précède l'enregistrement)
+        return int(np.searchsorted(self.ts_first, ts_ns, side="right")) - 1
+
+    def _load(self, i: int) -> Optional[L2Block]:
+        if self._cached is not None and self._cached[0] == i:
+            return self._cached[1]
+        blk = read_block(self.f, int(self.offsets[i]), self.header)
+        if blk is not None:
+            self._cached = (i, blk)
+        return blk
+
+    def book_at(self, ts_ns: int) -> L2Book:
+        """Carnet tel qu'il était à ts_ns (vide si ts_ns précède le premier message)."""
+        book = L2Book(depth=self.header.depth)
+        i = self._block_for(ts_ns)
+        if i < 0:
+            return book
+        blk = self._load(i)
+        if blk is None:
+            return book
+        for t, kind, bp, bq, ap, aq in iter_messages(blk):
+            if t > ts_ns:
+                break
+            apply_message(book, kind, bp, bq, ap, aq)
+        return book
+
+    def iter_times(self, times_ns: Iterable[int]) -> Iterator[Tuple[int, L2Book]]:
+        """
+        Parcourt des horodatages croissants en une passe. Les blocs sans point de
+        grille sont sautés via l'index. Le carnet retourné est partagé: le copier
+        s'il doit survivre à l'itération suivante.
+        """
+        book = L2Book(depth=self.header.depth)
+        cur = -1            # bloc courant
+        msgs = None         # itérateur de messages du bloc courant
+        pending = None      # message lu mais pas encore appliqué
+        for ts in times_ns:
+            ts = int(ts)
+            target = self._block_for(ts)
+            if target < 0:
+                yield ts, book
+                continue
+            if target != cur:
+                # saut direct au checkpoint le plus proche
+                cur = target
+                blk = self._load(cur)
+                msgs = iter_messages(blk) if blk is not None else iter(())
+                pending = None
+            while True:
+                if pending is None:
+                    pending = next(msgs, None)
+                    if pending is None:
+                        break
+                if pending[0] > ts:
+                    break
+                _, kind, bp, bq, ap, aq = pending
+                apply_message(book, kind, bp, bq, ap, aq)
+                pending = None
+            yield ts, book
+
+    def iter_grid(self, step_ns: int, start_ns: Optional[int] = None,
+                  end_ns: Optional[int] = None) -> Iterator[Tuple[int, L2Book]]:
+        """Carnet sur une grille régulière [start, end] de pas step_ns."""
+        assert step_ns > 0, "step_ns doit etre > 0"
+        if self.start_ns is None:
+            return iter(())
+        start = self.start_ns if start_ns is None else int(start_ns)
+        end = self.end_ns if end_ns is None else int(end_ns)
+        start = start - (start % step_ns)
+        return self.iter_times(range(start, end + 1, step_ns))
+
+def book_row(book: L2Book, top_n: int = 10) -> dict:
+    bid, ask = book.best()
+    bid_px, bid_qty = bid if bid else (np.nan, np.nan)
+    ask_px, ask_qty = ask if ask else (np.nan, np.nan)
+    return {
+        "bid_px": bid_px, "bid_qty": bid_qty,
+        "ask_px": ask_px, "ask_qty": ask_qty,
+        "mid": (bid_px + ask_px) / 2.0,
+        "spread": ask_px - bid_px,
+        "bid_depth_qty": book.depth_qty("bids", top_n),
+        "ask_depth_qty": book.depth_qty("asks", top_n),
+    }
+
+def book_at_candle_close(l2_path: str, candles_csv: str, out_csv: str, dt_sec: int, top_n: int = 10) -> None:
+    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
+    df = pd.read_csv(p, usecols=["t0"])
+    t0 = pd.to_datetime(df["t0"], utc=True, errors="coerce")
+    close_ns = (t0.dt.as_unit("ns").astype("int64") + int(dt_sec) * 10**9).to_numpy()
+    rows = []
+    with L2Replay(l2_path) as rp:
+        for _, book in rp.iter_times(close_ns):
+            rows.append(book_row(book, top_n))
+    out = pd.concat([df[["t0"]], pd.DataFrame(rows, index=df.index)], axis=1)
+    Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
+    out.to_csv(out_csv, index=False)
+
+def _args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="l2_path", required=True)
+    ap.add_argument("--candles", required=True)
+    ap.add_argument("--out", dest="out_csv", required=True)
+    ap.add_argument("--dt", dest="dt_sec", type=int, default=60)
+    ap.add_argument("--top_n", type=int, default=10)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    book_at_candle_close(a.l2_path, a.candles, a.out_csv, a.dt_sec, a.top_n)
+
+if __name__ == "__main__":
+    main()
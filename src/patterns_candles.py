@@ -1,6 +1,6 @@
 """
 src/patterns_candles.py
-Détecteurs de patterns chandeliers. Retour: CSV avec 'signal_candle' ∈ {-1,0,1}.
+Détecteurs de patterns chandeliers (noyau NumPy en une passe). Retour: CSV avec 'signal_candle' ∈ {-1,0,1}.
 - Engulfing haussier/baissier
 - Hammer / Shooting star
 - Inside bar (neutre)
@@ -10,10 +10,21 @@ from pathlib import Path
 import argparse
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+if __package__:  # importé par le serveur (src.patterns_candles) ou lancé en script
+    from .colcache import read_csv_cached, write_csv
+    from .windows import rolling_mean
+else:
+    from colcache import read_csv_cached, write_csv
+    from windows import rolling_mean
+
+# lignes de contexte nécessaires pour recalculer une fin de série (vol sur 20 rendements)
+LOOKBACK = 20
 
 def compute_pattern_indicators(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Calcule les signaux chandeliers en s'appuyant sur les détecteurs internes.
+    Calcule les signaux chandeliers (noyau pattern_kernel).
     Retourne un DataFrame aligné sur l'index de df avec:
       - signal_candle: synthèse {-1,0,1}
       - engulfing: {-1,0,1}
@@ -24,82 +35,81 @@ def compute_pattern_indicators(df: pd.DataFrame) -> pd.DataFrame:
     required_cols = {"open", "high", "low", "close"}
     missing = required_cols.difference(df.columns)
     assert not missing, f"Colonnes manquantes pour les patterns: {missing}"
+    cols = (df[c].to_numpy(dtype=np.float64) for c in ("open", "high", "low", "close"))
+    return pd.DataFrame(pattern_kernel(*cols), index=df.index)
 
-    s_engulf = _engulfing(df)
-    s_hammer_like = _hammer_like(df)
-    s_inside = _inside_bar(df)
-
-    inside_mask = (
-        (df["high"] < df["high"].shift(1)) &
-        (df["low"] > df["low"].shift(1))
-    )
-
-    indicators = pd.DataFrame(index=df.index)
-
-    primary_signal = (s_engulf + s_hammer_like + s_inside).clip(-1, 1).astype("int8")
-
-    returns = df["close"].pct_change()
-    abs_ret = returns.abs()
-    rolling_vol = abs_ret.rolling(window=20, min_periods=5).mean()
-    dynamic_eps = (
-        (rolling_vol * 0.75)
-        .fillna(abs_ret.rolling(window=10, min_periods=1).median())
-        .clip(lower=1e-4, upper=8e-3)
-    )
-    returns = returns.fillna(0.0)
-    dynamic_eps = dynamic_eps.fillna(2e-4)
-    mom_signal = np.where(returns > dynamic_eps, 1, np.where(returns < -dynamic_eps, -1, 0)).astype("int8")
-
-    signal = primary_signal.copy()
-    neutral_mask = signal == 0
-    signal.loc[neutral_mask] = mom_signal[neutral_mask]
-
-    indicators["signal_candle"] = signal.astype("int8")
-    indicators["engulfing"] = s_engulf.astype("int8")
-    indicators["hammer"] = (s_hammer_like == 1).astype("int8")
-    indicators["shooting_star"] = (s_hammer_like == -1).astype("int8")
-    indicators["inside_bar"] = inside_mask.fillna(False).astype("int8")
-    indicators["ret_pct"] = returns.astype("float32")
-    indicators["mom_threshold"] = dynamic_eps.astype("float32")
-    indicators["mom_signal"] = mom_signal.astype("int8")
-    return indicators
-
-def _engulfing(df: pd.DataFrame) -> pd.Series:
-    o,c,h,l = df["open"], df["close"], df["high"], df["low"]
-    body     = c - o
-    prev_o   = o.shift(1); prev_c = c.shift(1)
-    prevbody = prev_c - prev_o
-
-    bull = (body > 0) & (prevbody < 0) & (o <= prev_c) & (c >= prev_o)
-    bear = (body < 0) & (prevbody > 0) & (o >= prev_c) & (c <= prev_o)
-    return pd.Series(np.where(bull,1,np.where(bear,-1,0)), index=df.index, dtype="int8")
-
-def _hammer_like(df: pd.DataFrame) -> pd.Series:
-    o,c,h,l = df["open"], df["close"], df["high"], df["low"]
-    body      = (c - o).abs()
-    rng       = (h - l).replace(0, np.nan)
-
-    body_top  = pd.concat([o,c], axis=1).max(axis=1)
-    body_bot  = pd.concat([o,c], axis=1).min(axis=1)
-    lower_w   = body_bot - l            # distance du bas du corps au plus bas
-    upper_w   = h - body_top            # distance du plus haut au haut du corps
-
-    is_hammer = (lower_w > 2*body) & (upper_w < body) & (body/rng < 0.4)
-    is_star   = (upper_w > 2*body) & (lower_w < body) & (body/rng < 0.4)
-
-    sig = np.where(is_hammer,1,np.where(is_star,-1,0))
-    return pd.Series(sig, index=df.index, dtype="int8")
-
-def _inside_bar(df: pd.DataFrame) -> pd.Series:
-    hi, lo = df["high"], df["low"]
-    prev_hi, prev_lo = hi.shift(1), lo.shift(1)
-    inside = (hi < prev_hi) & (lo > prev_lo)
-    # neutre → 0
-    return pd.Series(np.where(inside,0,0), index=df.index, dtype="int8")
-
-def detect_signals(candles_csv: str, out_csv: str) -> None:
-    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
-    df = pd.read_csv(p)
+def pattern_kernel(o, h, l, c) -> dict:
+    """
+    Noyau en une passe sur tableaux (aucun DataFrame intermédiaire).
+    Colonnes décalées calculées une seule fois, puis:
+      - engulfing haussier/baissier (corps précédent de signe opposé, englobé)
+      - hammer / shooting star (mèche > 2 corps, corps < 40% du range)
+      - inside bar (neutre: n'entre pas dans la synthèse)
+      - seuil de momentum dynamique: 0.75 x moyenne des |rendements| sur 20
+        (min 5), sinon médiane sur 10, borné à [1e-4, 8e-3]
+    Retourne les colonnes de compute_pattern_indicators (mêmes valeurs, mêmes dtypes).
+    """
+    o, h, l, c = (np.asarray(x, dtype=np.float64) for x in (o, h, l, c))
+    body = c - o
+    prev_body, prev_o, prev_c, prev_h, prev_l = (_shift1(x) for x in (body, o, c, h, l))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bull = (body > 0) & (prev_body < 0) & (o <= prev_c) & (c >= prev_o)
+        bear = (body < 0) & (prev_body > 0) & (o >= prev_c) & (c <= prev_o)
+        engulf = np.where(bull, 1, np.where(bear, -1, 0)).astype(np.int8)
+
+        size = np.abs(body)
+        span = h - l
+        span[span == 0] = np.nan
+        lower_w = np.fmin(o, c) - l  # distance du bas du corps au plus bas
+        upper_w = h - np.fmax(o, c)  # distance du plus haut au haut du corps
+        small = size / span < 0.4
+        is_hammer = (lower_w > 2 * size) & (upper_w < size) & small
+        is_star = (upper_w > 2 * size) & (lower_w < size) & small
+        hammer_like = np.where(is_hammer, 1, np.where(is_star, -1, 0)).astype(np.int8)
+
+        inside = (h < prev_h) & (l > prev_l)
+        returns = c / prev_c - 1
+
+    abs_ret = np.abs(returns)
+    eps = rolling_mean(pd.Series(abs_ret), 20, min_periods=5).to_numpy() * 0.75
+    gaps = np.flatnonzero(np.isnan(eps))
+    if len(gaps):
+        eps[gaps] = _rolling_median_at(abs_ret, 10, gaps)
+    eps = np.clip(eps, 1e-4, 8e-3)
+    eps[np.isnan(eps)] = 2e-4
+    returns[np.isnan(returns)] = 0.0
+    mom_signal = np.where(returns > eps, 1, np.where(returns < -eps, -1, 0)).astype(np.int8)
+
+    primary = np.clip(engulf + hammer_like, -1, 1).astype(np.int8)
+    return {
+        "signal_candle": np.where(primary == 0, mom_signal, primary).astype(np.int8),
+        "engulfing": engulf,
+        "hammer": (hammer_like == 1).astype(np.int8),
+        "shooting_star": (hammer_like == -1).astype(np.int8),
+        "inside_bar": inside.astype(np.int8),
+        "ret_pct": returns.astype(np.float32),
+        "mom_threshold": eps.astype(np.float32),
+        "mom_signal": mom_signal,
+    }
+
+def _shift1(x: np.ndarray) -> np.ndarray:
+    out = np.empty_like(x)
+    out[:1] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+def _rolling_median_at(x: np.ndarray, window: int, idx: np.ndarray) -> np.ndarray:
+    """Médiane glissante (NaN ignorés, min_periods=1) aux seules positions idx, comme pandas."""
+    padded = np.concatenate([np.full(window - 1, np.nan), x])
+    w = np.sort(sliding_window_view(padded, window)[idx], axis=1)  # NaN triés en fin de ligne
+    k = (~np.isnan(w)).sum(axis=1)
+    rows = np.arange(len(idx))
+    hi = w[rows, np.maximum(k // 2, 0)]
+    lo = w[rows, np.maximum((k - 1) // 2, 0)]
+    return np.where(k > 0, np.where(k % 2 == 1, lo, (hi + lo) / 2), np.nan)
+
+def detect_signals_df(df: pd.DataFrame) -> pd.DataFrame:
     for c in ("t0","open","high","low","close"):
         assert c in df.columns, f"Colonne manquante: {c}"
 
@@ -107,7 +117,11 @@ def detect_signals(candles_csv: str, out_csv: str) -> None:
     out = df.copy()
     for col in indicators.columns:
         out[col] = indicators[col].values
-    out.to_csv(out_csv, index=False)
+    return out
+
+def detect_signals(candles_csv: str, out_csv: str) -> None:
+    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
+    write_csv(detect_signals_df(read_csv_cached(p)), out_csv)
 
 def _args():
     ap = argparse.ArgumentParser()
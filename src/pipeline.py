@@ -0,0 +1,217 @@
+# src/pipeline.py
+"""
+Exécuteur de pipeline en DAG avec cache par hash de contenu.
+Chaque étape déclare ses entrées, ses sorties et ses paramètres. Une étape est sautée
+quand le hash (nom + paramètres + contenu des entrées) correspond au manifeste et que
+ses sorties sont intactes. Les dépendances sont déduites des chemins: une étape qui lit
+la sortie d'une autre passe après elle. Les étapes indépendantes peuvent tourner en
+parallèle sur un pool de processus (workers > 1).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from colcache import read_csv_cached
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    # arguments de fn, tous inclus dans le hash de l'étape
+    params: Dict[str, Any] = field(default_factory=dict)
+
+class FileHashes:
+    """Hash de contenu des fichiers, mémorisé par (taille, mtime) pour éviter de relire."""
+
+    def __init__(self, known: Optional[dict] = None) -> None:
+        self.known: Dict[str, dict] = dict(known or {})
+
+    def get(self, path: str) -> Optional[str]:
+        p = Path(path)
+        if not p.exists():
+            return None
+        st = p.stat()
+        rec = self.known.get(str(p))
+        if rec and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+            return rec["hash"]
+        h = hashlib.blake2b(digest_size=16)
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.known[str(p)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+        return digest
+
+def stage_key(stage: Stage, hashes: FileHashes) -> str:
+    payload = {
+        "name": stage.name,
+        "params": stage.params,
+        "inputs": {p: hashes.get(p) for p in stage.inputs},
+        "outputs": sorted(stage.outputs),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def dependencies(stages: List[Stage]) -> Dict[str, set]:
+    """{étape: étapes dont elle lit une sortie}."""
+    producer = {}
+    for st in stages:
+        for out in st.outputs:
+            assert out not in producer, f"Sortie produite deux fois: {out}"
+            producer[out] = st.name
+    return {st.name: {producer[i] for i in st.inputs if i in producer} for st in stages}
+
+def toposort(stages: List[Stage]) -> List[Stage]:
+    """Ordre d'exécution respectant les dépendances fichier (stable vis-à-vis de la liste)."""
+    deps = dependencies(stages)
+    done: List[Stage] = []
+    seen = set()
+    pending = list(stages)
+    while pending:
+        ready = [st for st in pending if deps[st.name] <= seen]
+        assert ready, "Cycle dans le pipeline"
+        for st in ready:
+            done.append(st)
+            seen.add(st.name)
+        pending = [st for st in pending if st.name not in seen]
+    return done
+
+def critical_path(stages: List[Stage], durations: Dict[str, float]) -> tuple:
+    """(longueur, [étapes]) du plus long chemin pondéré par la durée des étapes."""
+    deps = dependencies(stages)
+    best: Dict[str, tuple] = {}
+    for st in toposort(stages):
+        prev = max((best[d] for d in deps[st.name]), key=lambda x: x[0], default=(0.0, []))
+        best[st.name] = (prev[0] + durations.get(st.name, 0.0), prev[1] + [st.name])
+    return max(best.values(), key=lambda x: x[0], default=(0.0, []))
+
+class Manifest:
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        data: dict = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+            except ValueError:
+                data = {}
+        self.stages: Dict[str, dict] = data.get("stages", {})
+        self.hashes = FileHashes(data.get("files"))
+
+    def is_fresh(self, stage: Stage, key: str) -> bool:
+        rec = self.stages.get(stage.name)
+        if not rec or rec.get("key") != key:
+            return False
+        # sorties supprimées ou modifiées à la main -> on relance
+        return all(self.hashes.get(p) == rec["outputs"].get(p) for p in stage.outputs)
+
+    def record(self, stage: Stage, key: str, result: Any) -> None:
+        self.stages[stage.name] = {
+            "key": key,
+            "outputs": {p: self.hashes.get(p) for p in stage.outputs},
+            "result": result,
+        }
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"stages": self.stages, "files": self.hashes.known},
+                                  indent=1, default=str))
+        os.replace(tmp, self.path)
+
+def _timed_call(fn: Callable[..., Any], params: Dict[str, Any]) -> tuple:
+    t = time.perf_counter()
+    res = fn(**params)
+    return res, time.perf_counter() - t
+
+def _warm_cache(paths: Iterable[str]) -> None:
+    # cache colonnaire construit ici, une fois, plutôt qu'en parallèle par chaque lecteur
+    for p in paths:
+        if str(p).endswith(".csv") and Path(p).exists():
+            read_csv_cached(p)
+
+def run_stages(stages: List[Stage], manifest_path: str, force: bool = False,
+               workers: int = 1) -> Dict[str, Any]:
+    """
+    Exécute les étapes du DAG; retourne {nom: résultat (ou résultat caché)}.
+    Avec workers > 1, chaque étape prête part sur un pool de processus dès que ses
+    dépendances sont terminées. Les clés de cache sont calculées dans le processus
+    principal, une fois les entrées écrites, comme le cache colonnaire des CSV d'entrée
+    (les étapes parallèles qui lisent le même CSV ne le reconstruisent pas chacune).
+    """
+    manifest = Manifest(manifest_path)
+    deps = dependencies(stages)
+    order = toposort(stages)
+    results: Dict[str, Any] = {}
+    durations: Dict[str, float] = {}
+    status: Dict[str, str] = {}
+    done: set = set()
+    t_start = time.perf_counter()
+
+    def try_skip(st: Stage) -> Optional[str]:
+        key = stage_key(st, manifest.hashes)
+        if not force and manifest.is_fresh(st, key):
+            print(f"[skip] {st.name} (inchangé)")
+            results[st.name] = manifest.stages[st.name].get("result")
+            durations[st.name] = 0.0
+            status[st.name] = "skip"
+            done.add(st.name)
+            return None
+        return key
+
+    def finish(st: Stage, key: str, res: Any, elapsed: float) -> None:
+        results[st.name] = res
+        durations[st.name] = elapsed
+        status[st.name] = "run"
+        done.add(st.name)
+        manifest.record(st, key, res)
+        manifest.save()
+
+    if workers <= 1:
+        for st in order:
+            key = try_skip(st)
+            if key is not None:
+                res, elapsed = _timed_call(st.fn, st.params)
+                finish(st, key, res, elapsed)
+    else:
+        running: Dict[Any, tuple] = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while len(done) < len(order):
+                launched = {running[f][0].name for f in running}
+                for st in order:
+                    if st.name in done or st.name in launched or not deps[st.name] <= done:
+                        continue
+                    key = try_skip(st)
+                    if key is not None:
+                        _warm_cache(st.inputs)
+                        running[pool.submit(_timed_call, st.fn, st.params)] = (st, key)
+                if len(done) == len(order):
+                    break
+                if not running:
+                    continue  # des étapes sautées ont libéré de nouvelles étapes
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    st, key = running.pop(fut)
+                    try:
+                        res, elapsed = fut.result()
+                    except Exception as e:
+                        raise RuntimeError(f"Étape {st.name} en échec: {e!r}") from e
+                    finish(st, key, res, elapsed)
+
+    wall = time.perf_counter() - t_start
+    cp_len, cp_stages = critical_path(stages, durations)
+    print("\n[pipeline] durée par étape")
+    for st in order:
+        print(f"  {st.name:<22} {status[st.name]:<4} {durations[st.name]:8.2f}s")
+    print(f"  total {wall:.2f}s (somme {sum(durations.values()):.2f}s, workers={max(1, workers)})")
+    print(f"  chemin critique {cp_len:.2f}s: {' -> '.join(cp_stages)}")
+    return results
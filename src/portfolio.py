@@ -0,0 +1,347 @@
+"""
+Multi-asset portfolio simulator: one cash account shared by many pairs.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from simulator import TradeStats
+
+HISTORY_COLUMNS = ("t0", "cash", "equity", "gross_exposure", "n_positions", "n_trades", "drawdown")
+TRADE_COLUMNS = ["t0", "pair", "price", "action", "qty", "cash", "equity", "pnl", "reason"]
+ACTIONS = np.array(["buy", "sell", "short", "buy_to_cover"], dtype=object)
+# exit reason codes (0 = signal flip) in TradingSimulator's priority order
+RISK_LABELS = ("signal_flip", "take_profit", "stop_loss", "trailing_stop", "max_hold")
+# reason by (action code, reason code); entries use 0 = signal, 1 = forced
+REASONS = np.array([
+    ["enter_long_signal", "enter_long_forced", "", "", ""],
+    [f"exit_long_{label}" for label in RISK_LABELS],
+    ["enter_short_signal", "enter_short_forced", "", "", ""],
+    [f"exit_short_{label}" for label in RISK_LABELS],
+], dtype=object)
+
+@dataclass
+class PairRisk:
+    """Risk settings of one pair; 0 or None disables a threshold, as in TradingSimulator."""
+
+    stop_loss_pct: Optional[float] = None
+    take_profit_pct: Optional[float] = None
+    trailing_stop_pct: Optional[float] = None
+    max_holding_period: Optional[int] = None
+    position_scale: float = 1.0
+
+@dataclass
+class PortfolioSimulator:
+    """
+    TradingSimulator rules applied to N pairs at once, one timestamp at a time.
+
+    State is a set of length-N arrays (position, entry price, holding age, trailing
+    high/low), so a step is a fixed number of NumPy operations whatever N is. Per
+    step: risk exits (take profit, stop loss, trailing stop, max hold) override the
+    signals, exits are settled, then the pairs entering share the remaining capacity
+    equally: equity * max_leverage minus the gross notional already held, scaled per
+    pair like ``_position_scale_from_row``. As in the single-pair simulator a cover
+    triggered by a long signal reverses into a long; shorts are only opened flat.
+    NaN prices leave a pair untouched and positions are marked at their last price.
+    """
+
+    pairs: Sequence[str]
+    initial_cash: float = 100.0
+    allow_short: bool = False
+    fee_bps: float = 0.0
+    max_leverage: float = 1.0
+    default_risk: PairRisk = field(default_factory=PairRisk)
+    risk: Dict[str, PairRisk] = field(default_factory=dict)
+    record_positions: bool = True
+
+    def __post_init__(self) -> None:
+        self.pairs = list(self.pairs)
+        if len(set(self.pairs)) != len(self.pairs):
+            raise ValueError("duplicate pairs")
+        unknown = set(self.risk).difference(self.pairs)
+        if unknown:
+            raise ValueError(f"risk settings for unknown pairs: {sorted(unknown)}")
+        try:
+            self.max_leverage = max(1.0, float(self.max_leverage))
+        except (TypeError, ValueError):
+            self.max_leverage = 1.0
+        cfg = [self.risk.get(p, self.default_risk) for p in self.pairs]
+        # disabled thresholds become +inf so their comparisons are never true
+        self._tp = np.array([r.take_profit_pct or np.inf for r in cfg], dtype=float)
+        self._neg_sl = -np.array([r.stop_loss_pct if r.stop_loss_pct and r.stop_loss_pct > 0 else np.inf
+                                  for r in cfg], dtype=float)
+        tr = np.array([r.trailing_stop_pct or 0.0 for r in cfg], dtype=float)
+        self._has_tr = tr > 0
+        self._any_tr = bool(self._has_tr.any())
+        self._tr_down, self._tr_up = 1 - tr, 1 + tr
+        self._max_hold = np.array([r.max_holding_period or np.iinfo(np.int64).max for r in cfg], dtype=np.int64)
+        self._base = np.clip(np.array([r.position_scale for r in cfg], dtype=float), 0.1, 1.0)
+        self._fee_rate = self.fee_bps * 1e-4 if self.fee_bps > 0 else 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        n = len(self.pairs)
+        self.cash = float(self.initial_cash)
+        self.position = np.zeros(n)
+        self.entry_price = np.full(n, np.nan)
+        self.position_age = np.zeros(n, dtype=np.int64)
+        self.mark = np.zeros(n)  # last valid price of each pair (0 until the first one)
+        self._high = np.full(n, np.nan)
+        self._low = np.full(n, np.nan)
+        self._entry_fee = np.zeros(n)
+        self.realized_by_pair = np.zeros(n)
+        self._equity_peak = float(self.initial_cash)
+        self._max_drawdown = 0.0
+        self.trade_stats = TradeStats(20)
+        self._history: Dict[str, List[Any]] = {name: [] for name in HISTORY_COLUMNS}
+        self._positions: List[np.ndarray] = []
+        # one tuple of arrays per step and side: (step, pair index, price, qty, pnl, action, reason code)
+        self._trade_chunks: List[tuple] = []
+        self._n_trades = 0
+
+    # === state ===========================================================
+
+    def equity(self) -> float:
+        return self.cash + float(self.position @ self.mark)
+
+    def gross_exposure(self) -> float:
+        return float(np.abs(self.position) @ self.mark)
+
+    # === processing ======================================================
+
+    def _scale(self, micro: np.ndarray, mom: np.ndarray) -> np.ndarray:
+        raw = np.abs(micro) * 0.7 + np.abs(mom) * 0.3
+        # fmin: a NaN score gives scale 1.0, like min(1.0, nan) in TradingSimulator
+        return np.maximum(self._base * 0.5, np.fmin(1.0, self._base * (0.4 + raw)))
+
+    def step(self, t0: Any, close: Any, signal: Any, micro_score: Any = None, mom_signal: Any = None) -> None:
+        """Process one timestamp: arrays of length N aligned with ``pairs``."""
+        n = len(self.pairs)
+        price = np.asarray(close, dtype=float)
+        micro = np.zeros(n) if micro_score is None else np.asarray(micro_score, dtype=float)
+        mom = np.zeros(n) if mom_signal is None else np.asarray(mom_signal, dtype=float)
+        sig = np.asarray(signal).astype(np.int64)
+        assert price.shape == sig.shape == micro.shape == mom.shape == (n,), "arrays must have one value per pair"
+        valid = price > 0
+        sig = np.where(valid, sig, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self._step(t0, price, valid, sig, bool(sig.any()), self._scale(micro, mom))
+
+    def _step(self, t0: Any, price: np.ndarray, valid: np.ndarray, sig: np.ndarray, any_sig: bool,
+              scale: np.ndarray) -> None:
+        # NumPy calls dominate at this array size: the common path (positions held, no
+        # signal, no stop) is kept to a few dozen of them
+        step_no = len(self._history["t0"])
+        pos, age, entry = self.position, self.position_age, self.entry_price
+        np.copyto(self.mark, price, where=valid)
+        held = valid & (pos != 0)
+        n_trades = n_hit = 0
+        long = None
+
+        if np.count_nonzero(held):
+            long = held & (pos > 0)
+            short = held ^ long
+            age += held
+            np.fmax(self._high, price, out=self._high, where=long)
+            np.fmin(self._low, price, out=self._low, where=short)
+            ret = (price - entry) / entry * np.sign(pos)  # TradingSimulator's ret for either side
+            hit = (ret >= self._tp) | (ret <= self._neg_sl) | (age >= self._max_hold)
+            if self._any_tr:
+                hit |= self._has_tr & np.where(long, price <= self._high * self._tr_down,
+                                               price >= self._low * self._tr_up)
+            hit &= held
+            n_hit = np.count_nonzero(hit)
+            if n_hit:
+                # rare: label the stops in priority order and force the closing signal
+                idx = np.flatnonzero(hit)
+                r, lg = ret[idx], long[idx]
+                trail = self._has_tr[idx] & np.where(lg, price[idx] <= self._high[idx] * self._tr_down[idx],
+                                                     price[idx] >= self._low[idx] * self._tr_up[idx])
+                code = np.zeros(len(pos), dtype=np.int64)
+                code[idx] = np.where(r >= self._tp[idx], 1, np.where(r <= self._neg_sl[idx], 2,
+                                                                     np.where(trail, 3, 4)))
+                sig = sig.copy()
+                sig[idx] = np.where(lg, -1, 1)
+
+            exits = (long & (sig < 0)) | (short & (sig > 0)) if any_sig or n_hit else None
+            if exits is not None and np.count_nonzero(exits):
+                idx = np.flatnonzero(exits)
+                px, qty, was_long = price[idx], np.abs(pos[idx]), long[idx]
+                notional = qty * px
+                fee = notional * self._fee_rate
+                self.cash += float(np.where(was_long, notional - fee, -(notional + fee)).sum())
+                # TradingSimulator's trade pnl starts from the equity after the entry fee
+                pnl = np.where(was_long, px - entry[idx], entry[idx] - px) * qty - fee
+                self.realized_by_pair[idx] += pnl - self._entry_fee[idx]
+                pos[idx] = 0.0
+                entry[idx] = np.nan
+                age[idx] = 0
+                self._high[idx] = np.nan
+                self._low[idx] = np.nan
+                self._entry_fee[idx] = 0.0
+                reason = code[idx] if n_hit else np.zeros(len(idx), dtype=np.int64)
+                self._trade_chunks.append((step_no, idx, px, qty, pnl, np.where(was_long, 1, 3), reason))
+                for p in pnl.tolist():
+                    self.trade_stats.add(p)
+                n_trades += len(idx)
+
+        # entries share what is left of equity * leverage; a closed long does not reverse
+        if (any_sig or n_hit) and self.cash > 0:
+            enter_long = valid & (pos == 0) & (sig > 0)
+            if self.allow_short:
+                was_flat = valid & (pos == 0) if long is None else valid & ~held
+                enters = enter_long | (was_flat & (sig < 0))
+            else:
+                enters = enter_long
+            idx = np.flatnonzero(enters)
+            if len(idx):
+                equity = self.cash + float(pos @ self.mark)
+                remaining = max(0.0, max(equity, 0.0) * self.max_leverage - float(np.abs(pos) @ self.mark))
+                px = price[idx]
+                qty = remaining / len(idx) * scale[idx] / (px * (1 + self._fee_rate))
+                keep = qty > 0
+                if not keep.all():
+                    idx, px, qty = idx[keep], px[keep], qty[keep]
+            if len(idx):
+                is_long = enter_long[idx]
+                notional = qty * px
+                fee = notional * self._fee_rate
+                self.cash += float(np.where(is_long, -(notional + fee), notional - fee).sum())
+                pos[idx] = np.where(is_long, qty, -qty)
+                entry[idx] = px
+                age[idx] = 0
+                self._high[idx] = np.where(is_long, px, np.nan)
+                self._low[idx] = np.where(is_long, np.nan, px)
+                self._entry_fee[idx] = fee
+                forced = code[idx] > 0 if n_hit else np.zeros(len(idx), dtype=bool)
+                self._trade_chunks.append((step_no, idx, px, qty, np.zeros(len(idx)),
+                                           np.where(is_long, 0, 2), forced.astype(np.int64)))
+                n_trades += len(idx)
+
+        gross = float(np.abs(pos) @ self.mark)
+        equity = self.cash + float(pos @ self.mark)
+        if equity > self._equity_peak:
+            self._equity_peak = equity
+        drawdown = (self._equity_peak - equity) / self._equity_peak if self._equity_peak > 0 else 0.0
+        if drawdown > self._max_drawdown:
+            self._max_drawdown = drawdown
+        self._n_trades += n_trades
+
+        h = self._history
+        h["t0"].append(t0)
+        h["cash"].append(self.cash)
+        h["equity"].append(equity)
+        h["gross_exposure"].append(gross)
+        h["n_positions"].append(int(np.count_nonzero(pos)))
+        h["n_trades"].append(n_trades)
+        h["drawdown"].append(drawdown)
+        if self.record_positions:
+            self._positions.append(pos.copy())
+
+    def run(
+        self,
+        close: Any,
+        signal: Any,
+        micro_score: Any = None,
+        mom_signal: Any = None,
+        t0: Any = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Process (T, N) arrays (one column per pair, e.g. from ``align_pairs``) and return
+        (history, trades) for the rows processed by this call.
+        """
+        close = np.asarray(close, dtype=float)
+        n_steps = close.shape[0]
+        assert close.ndim == 2 and close.shape[1] == len(self.pairs), "close must be (T, n_pairs)"
+        signal = np.asarray(signal).astype(np.int64)
+        micro = np.zeros_like(close) if micro_score is None else np.asarray(micro_score, dtype=float)
+        mom = np.zeros_like(close) if mom_signal is None else np.asarray(mom_signal, dtype=float)
+        assert signal.shape == micro.shape == mom.shape == close.shape, "inputs must all be (T, n_pairs)"
+        times = np.arange(n_steps) if t0 is None else np.asarray(t0)
+        # everything that does not depend on the state is computed for all rows at once
+        valid = close > 0
+        signal = np.where(valid, signal, 0)
+        any_sig = (signal != 0).any(axis=1).tolist()
+        scale = self._scale(micro, mom)
+        h0, t_start = len(self._history["t0"]), self._n_trades
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for i in range(n_steps):
+                self._step(times[i], close[i], valid[i], signal[i], any_sig[i], scale[i])
+        return self.history_df().iloc[h0:], self.trades_df().iloc[t_start:]
+
+    # === outputs =========================================================
+
+    def history_df(self) -> pd.DataFrame:
+        df = pd.DataFrame(self._history)
+        if self.record_positions and self._positions:
+            df = pd.concat([df, pd.DataFrame(np.vstack(self._positions), columns=[f"pos_{p}" for p in self.pairs])],
+                           axis=1)
+        return df
+
+    def trades_df(self) -> pd.DataFrame:
+        """Trades in execution order (per step: exits, then entries); cash/equity after the step."""
+        if not self._trade_chunks:
+            return pd.DataFrame(columns=TRADE_COLUMNS)
+        chunks = self._trade_chunks
+        step = np.concatenate([np.full(len(c[1]), c[0]) for c in chunks])
+        pair, price, qty, pnl, action, reason = (np.concatenate([c[k] for c in chunks]) for k in range(1, 7))
+        h = self._history
+        return pd.DataFrame({
+            "t0": np.asarray(h["t0"], dtype=object)[step],
+            "pair": np.asarray(self.pairs, dtype=object)[pair],
+            "price": price,
+            "action": ACTIONS[action],
+            "qty": qty,
+            "cash": np.asarray(h["cash"])[step],
+            "equity": np.asarray(h["equity"])[step],
+            "pnl": pnl,
+            "reason": REASONS[action, reason],
+        })
+
+    def summary(self) -> dict:
+        equity = self.equity()
+        gross = self.gross_exposure()
+        pnl = equity - self.initial_cash
+        return {
+            "initial_cash": self.initial_cash,
+            "equity": equity,
+            "pnl": pnl,
+            "pnl_pct": (pnl / self.initial_cash) * 100 if self.initial_cash else 0.0,
+            "cash": self.cash,
+            "gross_exposure": gross,
+            "leverage_used": gross / equity if equity > 0 else None,
+            "max_drawdown_pct": self._max_drawdown * 100.0,
+            "n_trades": self._n_trades,
+            "n_positions": int(np.count_nonzero(self.position)),
+            "positions": {p: float(q) for p, q in zip(self.pairs, self.position) if q != 0},
+            "realized_by_pair": dict(zip(self.pairs, self.realized_by_pair.tolist())),
+            **self.trade_stats.as_dict(),
+        }
+
+def align_pairs(
+    frames: Dict[str, pd.DataFrame],
+    signal_col: str = "signal_candle",
+) -> Tuple[pd.Series, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    {pair: candles + signals (t0, close, signal_col[, micro_score, mom_signal])} ->
+    (t0, close, signal, micro_score, mom_signal) on the union of timestamps, (T, N) arrays
+    in ``frames`` order. Missing candles are NaN prices (skipped) with signal 0.
+    """
+    assert frames, "no pairs"
+    t0 = pd.Series(sorted(set().union(*(df["t0"] for df in frames.values()))), name="t0")
+    cols: Dict[str, List[np.ndarray]] = {"close": [], "signal": [], "micro_score": [], "mom_signal": []}
+    for pair, df in frames.items():
+        for c in ("t0", "close", signal_col):
+            assert c in df.columns, f"{pair}: missing column {c}"
+        d = df.drop_duplicates("t0", keep="last").set_index("t0").reindex(t0)
+        cols["close"].append(pd.to_numeric(d["close"], errors="coerce").to_numpy(dtype=float))
+        cols["signal"].append(pd.to_numeric(d[signal_col], errors="coerce").fillna(0).to_numpy(dtype=np.int64))
+        for c in ("micro_score", "mom_signal"):
+            values = pd.to_numeric(d[c], errors="coerce").fillna(0.0) if c in d.columns else pd.Series(0.0, index=d.index)
+            cols[c].append(values.to_numpy(dtype=float))
+    return (t0, *(np.column_stack(cols[c]) for c in ("close", "signal", "micro_score", "mom_signal")))
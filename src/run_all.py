@@ -2,7 +2,7 @@
 """
 Pipeline complet:
 1) (optionnel) Stream Kraken pendant N secondes → data/kraken_trades.csv + data/kraken_topbook.csv
-2) Candles (5s, 60s)
+2) Candles (5s, 60s) — une lecture, 60s dérivé du 5s
 3) Labels directionnels
 4) Patterns chandeliers
 5) Features micro (top-of-book)
@@ -12,6 +12,7 @@ Pipeline complet:
 Exécution:
   python src/run_all.py --pair BTC/USD --stream_secs 0
   python src/run_all.py --pair BTC/USD --stream_secs 1800  # 30 min
+  python src/run_all.py --incremental   # rafraîchissement: seulement les lignes ajoutées
 """
 
 from pathlib import Path
@@ -20,12 +21,15 @@ import asyncio
 import sys
 
 # === imports internes ===
-from candles import build_candles
-from targets import make_labels
-from patterns_candles import detect_signals
-from features_orderbook import build_from_topbook
-from signals_micro import build as build_micro_signal
-from backtest import run_bt
+from candles import build_candles_multi, candles_multi_df
+from targets import make_labels, labels_df
+from patterns_candles import detect_signals, detect_signals_df
+from features_orderbook import build_from_topbook_multi, micro_features_multi_df
+from signals_micro import build as build_micro_signal, build_df as build_micro_signal_df
+from backtest import run_bt, run_bt_df
+from colcache import read_csv_cached, write_csv
+from pipeline import Stage, run_stages
+from incremental import Incremental
 
 # Kraken WS client
 try:
@@ -58,9 +62,10 @@ def step_stream(pair: str, depth: int, secs: int,
     except Exception as e:
         print(f"[stream] erreur: {e}")
 
-def step_candles(in_csv: str, out_csv: str, dt: int):
-    print(f"[candles] {in_csv} -> {out_csv} dt={dt}s")
-    build_candles(in_csv, out_csv, dt)
+def step_candles_multi(in_csv: str, outs: dict):
+    # une seule lecture du CSV trades, les pas grossiers dérivés du plus fin
+    print(f"[candles] {in_csv} -> " + ", ".join(f"{v} dt={k}s" for k, v in sorted(outs.items())))
+    build_candles_multi(in_csv, outs)
 
 def step_labels(in_csv: str, out_csv: str, h: int, eps: float):
     print(f"[labels] {in_csv} -> {out_csv} h={h} eps={eps}")
@@ -70,9 +75,9 @@ def step_patterns(in_csv: str, out_csv: str):
     print(f"[patterns] {in_csv} -> {out_csv}")
     detect_signals(in_csv, out_csv)
 
-def step_micro_features(in_csv: str, out_csv: str, dt: int):
-    print(f"[micro] {in_csv} -> {out_csv} dt={dt}s")
-    build_from_topbook(in_csv, out_csv, dt)
+def step_micro_features_multi(in_csv: str, outs: dict):
+    print(f"[micro] {in_csv} -> " + ", ".join(f"{v} dt={k}s" for k, v in sorted(outs.items())))
+    build_from_topbook_multi(in_csv, outs)
 
 def step_micro_signal(in_csv: str, out_csv: str, tau: float, max_spread_bp: float):
     print(f"[signal_micro] {in_csv} -> {out_csv} tau={tau} max_spread_bp={max_spread_bp}")
@@ -83,6 +88,7 @@ def step_backtest(candles_csv: str, signals_csv: str, micro_csv: str,
     print(f"[backtest {tag}] h={h} fees={fees_bp}bp")
     stats = run_bt(candles_csv, signals_csv, out_csv, h, fees_bp, micro_csv)
     print(f"[backtest {tag}] -> {stats}")
+    return stats
 
 def parse_args():
     ap = argparse.ArgumentParser()
@@ -100,8 +106,103 @@ def parse_args():
     ap.add_argument("--max_spread_bp", type=float, default=5.0)
 
     ap.add_argument("--fees_bp", type=float, default=0.5)
+
+    ap.add_argument("--manifest", type=str, default="data/.run_all_manifest.json",
+                    help="Manifeste des étapes déjà calculées (hash entrées + params)")
+    ap.add_argument("--force", action="store_true", help="Recalcule toutes les étapes")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processus pour les étapes indépendantes (branches fast/slow)")
+    ap.add_argument("--in_memory", action="store_true",
+                    help="Enchaîne les étapes en mémoire, sans CSV intermédiaires")
+    ap.add_argument("--persist", type=str, default="bt",
+                    help="Mode mémoire: artefacts à écrire parmi " + ",".join(PERSIST_GROUPS))
+    ap.add_argument("--incremental", action="store_true",
+                    help="Ne traite que les lignes ajoutées aux CSV bruts depuis le dernier passage")
+    ap.add_argument("--watermarks", type=str, default="data/.run_all_watermarks.json",
+                    help="État du mode incrémental (filigranes + nombre de lignes des sorties)")
     return ap.parse_args()
 
+def build_paths(pair: str, dt_fast: int, dt_slow: int) -> dict:
+    base = pair.replace('/','_').lower()
+    p = {
+        "c_fast": f"data/{base}_{dt_fast}s.csv",
+        "c_slow": f"data/{base}_{dt_slow}s.csv",
+        "m_fast": f"data/{base}_micro_{dt_fast}s.csv",
+        "m_slow": f"data/{base}_micro_{dt_slow}s.csv",
+    }
+    for speed in ("fast", "slow"):
+        c = p[f"c_{speed}"]
+        p[f"c_{speed}_lbl"] = c.replace(".csv", "_lbl.csv")
+        p[f"sig_{speed}_candle"] = c.replace(".csv", "_sig_candle.csv")
+        p[f"sig_{speed}_micro"] = c.replace(".csv", "_sig_micro.csv")
+        p[f"bt_{speed}_candle"] = c.replace(".csv", "_bt_candle.csv")
+        p[f"bt_{speed}_micro"] = c.replace(".csv", "_bt_micro.csv")
+    return p
+
+def build_stages(args, p: dict, trades_csv: str, topbook_csv: str) -> list:
+    dts = {"fast": args.dt_fast, "slow": args.dt_slow}
+    stages = [
+        Stage("candles", step_candles_multi,
+              inputs=[trades_csv], outputs=[p["c_fast"], p["c_slow"]],
+              params={"in_csv": trades_csv, "outs": {args.dt_fast: p["c_fast"], args.dt_slow: p["c_slow"]}}),
+        Stage("micro_features", step_micro_features_multi,
+              inputs=[topbook_csv], outputs=[p["m_fast"], p["m_slow"]],
+              params={"in_csv": topbook_csv, "outs": {args.dt_fast: p["m_fast"], args.dt_slow: p["m_slow"]}}),
+    ]
+    for speed, dt in dts.items():
+        c, lbl, m = p[f"c_{speed}"], p[f"c_{speed}_lbl"], p[f"m_{speed}"]
+        sig_c, sig_m = p[f"sig_{speed}_candle"], p[f"sig_{speed}_micro"]
+        stages += [
+            Stage(f"labels_{speed}", step_labels, inputs=[c], outputs=[lbl],
+                  params={"in_csv": c, "out_csv": lbl, "h": args.h, "eps": args.eps}),
+            Stage(f"patterns_{speed}", step_patterns, inputs=[c], outputs=[sig_c],
+                  params={"in_csv": c, "out_csv": sig_c}),
+            Stage(f"signal_micro_{speed}", step_micro_signal, inputs=[m], outputs=[sig_m],
+                  params={"in_csv": m, "out_csv": sig_m, "tau": args.tau, "max_spread_bp": args.max_spread_bp}),
+        ]
+        for kind, sig in (("candle", sig_c), ("micro", sig_m)):
+            out = p[f"bt_{speed}_{kind}"]
+            stages.append(Stage(
+                f"bt_{kind}_{speed}", step_backtest, inputs=[lbl, sig, m], outputs=[out],
+                params={"candles_csv": lbl, "signals_csv": sig, "micro_csv": m, "out_csv": out,
+                        "h": args.h, "fees_bp": args.fees_bp, "tag": f"{kind} {dt}s"}))
+    return stages
+
+PERSIST_GROUPS = ("candles", "labels", "patterns", "micro", "signals", "bt")
+
+def run_in_memory(args, p: dict, trades_csv: str, topbook_csv: str, persist: set) -> dict:
+    """
+    Même pipeline que build_stages, chaîné en DataFrames. Seuls les groupes de
+    `persist` sont écrits sur disque; les stats de backtest sont retournées.
+    """
+    unknown = persist.difference(PERSIST_GROUPS)
+    assert not unknown, f"Artefacts inconnus: {unknown}"
+    dts = {"fast": args.dt_fast, "slow": args.dt_slow}
+    print(f"[memory] candles + micro dt={sorted(set(dts.values()))} persist={sorted(persist)}")
+    candles = candles_multi_df(read_csv_cached(trades_csv), dts.values())
+    micro = micro_features_multi_df(read_csv_cached(topbook_csv), dts.values())
+
+    def save(group: str, df, path: str) -> None:
+        if group in persist:
+            write_csv(df, path)
+
+    results = {}
+    for speed, dt in dts.items():
+        c, m = candles[dt], micro[dt]
+        lbl = labels_df(c, args.h, args.eps)
+        sig_c = detect_signals_df(c)
+        sig_m = build_micro_signal_df(m, args.tau, args.max_spread_bp)
+        save("candles", c, p[f"c_{speed}"])
+        save("micro", m, p[f"m_{speed}"])
+        save("labels", lbl, p[f"c_{speed}_lbl"])
+        save("patterns", sig_c, p[f"sig_{speed}_candle"])
+        save("signals", sig_m, p[f"sig_{speed}_micro"])
+        for kind, sig in (("candle", sig_c), ("micro", sig_m)):
+            res, stats = run_bt_df(lbl, sig, m, args.h, args.fees_bp)
+            save("bt", res, p[f"bt_{speed}_{kind}"])
+            results[f"bt_{kind}_{speed}"] = stats
+    return results
+
 def main():
     args = parse_args()
     ensure_dirs()
@@ -112,53 +213,27 @@ def main():
     # 1) streaming optionnel
     step_stream(args.pair, args.depth, args.stream_secs, trades_csv, topbook_csv)
 
-    # 2) candles
-    c_fast = f"data/{args.pair.replace('/','_').lower()}_{args.dt_fast}s.csv"
-    c_slow = f"data/{args.pair.replace('/','_').lower()}_{args.dt_slow}s.csv"
-    step_candles(trades_csv, c_fast, args.dt_fast)
-    step_candles(trades_csv, c_slow, args.dt_slow)
-
-    # 3) labels
-    c_fast_lbl = c_fast.replace(".csv", "_lbl.csv")
-    c_slow_lbl = c_slow.replace(".csv", "_lbl.csv")
-    step_labels(c_fast, c_fast_lbl, args.h, args.eps)
-    step_labels(c_slow, c_slow_lbl, args.h, args.eps)
-
-    # 4) patterns chandeliers
-    sig_fast_candle = c_fast.replace(".csv", "_sig_candle.csv")
-    sig_slow_candle = c_slow.replace(".csv", "_sig_candle.csv")
-    step_patterns(c_fast, sig_fast_candle)
-    step_patterns(c_slow, sig_slow_candle)
-
-    # 5) features microstructure (alignées au pas)
-    m_fast = f"data/{args.pair.replace('/','_').lower()}_micro_{args.dt_fast}s.csv"
-    m_slow = f"data/{args.pair.replace('/','_').lower()}_micro_{args.dt_slow}s.csv"
-    step_micro_features(topbook_csv, m_fast, args.dt_fast)
-    step_micro_features(topbook_csv, m_slow, args.dt_slow)
-
-    # 6) signal micro
-    sig_fast_micro = c_fast.replace(".csv", "_sig_micro.csv")
-    sig_slow_micro = c_slow.replace(".csv", "_sig_micro.csv")
-    step_micro_signal(m_fast, sig_fast_micro, args.tau, args.max_spread_bp)
-    step_micro_signal(m_slow, sig_slow_micro, args.tau, args.max_spread_bp)
-
-    # 7) backtests
-    bt_fast_candle = c_fast.replace(".csv", "_bt_candle.csv")
-    bt_slow_candle = c_slow.replace(".csv", "_bt_candle.csv")
-    bt_fast_micro  = c_fast.replace(".csv", "_bt_micro.csv")
-    bt_slow_micro  = c_slow.replace(".csv", "_bt_micro.csv")
-
-    step_backtest(c_fast_lbl, sig_fast_candle, m_fast, bt_fast_candle, args.h, args.fees_bp, tag="candle 5s")
-    step_backtest(c_slow_lbl, sig_slow_candle, m_slow, bt_slow_candle, args.h, args.fees_bp, tag="candle 60s")
-    step_backtest(c_fast_lbl, sig_fast_micro,  m_fast, bt_fast_micro,  args.h, args.fees_bp, tag="micro 5s")
-    step_backtest(c_slow_lbl, sig_slow_micro,  m_slow, bt_slow_micro,  args.h, args.fees_bp, tag="micro 60s")
+    # 2..7) étapes en DAG, sautées si entrées et paramètres inchangés
+    p = build_paths(args.pair, args.dt_fast, args.dt_slow)
+    stages = build_stages(args, p, trades_csv, topbook_csv)
+    if args.in_memory:
+        persist = {x.strip() for x in args.persist.split(",") if x.strip()}
+        results = run_in_memory(args, p, trades_csv, topbook_csv, persist)
+    elif args.incremental:
+        inc = Incremental(p, trades_csv, topbook_csv, {"fast": args.dt_fast, "slow": args.dt_slow},
+                          args.h, args.eps, args.tau, args.max_spread_bp, args.fees_bp, args.watermarks)
+        results = inc.run(lambda: run_stages(stages, args.manifest, force=args.force, workers=args.workers))
+    else:
+        results = run_stages(stages, args.manifest, force=args.force, workers=args.workers)
+    for name in ("bt_candle_fast", "bt_candle_slow", "bt_micro_fast", "bt_micro_slow"):
+        print(f"[{name}] {results.get(name)}")
 
     print("\n[done]")
-    print(f"- Candles: {c_fast}, {c_slow}")
-    print(f"- Labels:  {c_fast_lbl}, {c_slow_lbl}")
-    print(f"- Signals: {sig_fast_candle}, {sig_slow_candle}, {sig_fast_micro}, {sig_slow_micro}")
-    print(f"- Micro:   {m_fast}, {m_slow}")
-    print(f"- BT:      {bt_fast_candle}, {bt_slow_candle}, {bt_fast_micro}, {bt_slow_micro}")
+    print(f"- Candles: {p['c_fast']}, {p['c_slow']}")
+    print(f"- Labels:  {p['c_fast_lbl']}, {p['c_slow_lbl']}")
+    print(f"- Signals: {p['sig_fast_candle']}, {p['sig_slow_candle']}, {p['sig_fast_micro']}, {p['sig_slow_micro']}")
+    print(f"- Micro:   {p['m_fast']}, {p['m_slow']}")
+    print(f"- BT:      {p['bt_fast_candle']}, {p['bt_slow_candle']}, {p['bt_fast_micro']}, {p['bt_slow_micro']}")
 
 if __name__ == "__main__":
     main()
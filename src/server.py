@@ -7,14 +7,26 @@ It exposes REST endpoints to:
   - Monitor bot equity and executed trades.
   - Reset or reconfigure the simulator on the fly.
 
+Stops are also checked on every live trade between candles (TickRiskGuard), so
+exits do not wait for the candle close.
+
+The simulator state (account, open position, risk tracking, recent history and
+trades) can be checkpointed periodically together with the newest processed candle and
+restored by the startup hook, so a restart resumes where the bot stopped. Older rows
+spilled to disk are reattached from their segment files, which are kept across
+restarts. It is off unless BOT_CHECKPOINT_PATH names the checkpoint file.
+
 Run with:
   uvicorn src.server:app --reload
+  BOT_CHECKPOINT_PATH=data/server_checkpoint.pkl uvicorn src.server:app
 """
 
 from __future__ import annotations
 
 import asyncio
+import os
 import threading
+import time
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone
 from pathlib import Path
@@ -29,7 +41,13 @@ from pydantic import BaseModel
 from .candles import aggregate_trades_df
 from .live_feed import KrakenLiveFeed
 from .patterns_candles import compute_pattern_indicators
-from .simulator import TradingSimulator
+from .simulator import (
+    TickRiskGuard,
+    TradingSimulator,
+    discard_spill_dir,
+    read_checkpoint,
+    write_checkpoint,
+)
 
 DEFAULT_PAIR = "BTC/USD"
 DEFAULT_CANDLE_SEC = 60
@@ -38,6 +56,11 @@ DEFAULT_ALLOW_SHORT = False
 DEFAULT_FEE_BPS = 5.0
 PROCESS_INTERVAL_SEC = 1
 MAX_PROCESSED_KEYS = 20_000
+# simulator rows kept in memory; older ones are spilled to disk and read back on demand
+DEFAULT_HISTORY_RETENTION = 20_000
+DEFAULT_TRADE_RETENTION = 5_000
+CHECKPOINT_PATH_ENV = "BOT_CHECKPOINT_PATH"  # checkpointing is off when unset
+CHECKPOINT_INTERVAL_SEC = 30
 
 class ConfigPayload(BaseModel):
     pair: Optional[str] = None
@@ -80,6 +103,11 @@ class LiveSimulationState:
         trailing_stop_pct: Optional[float] = 0.01,
         position_scale: float = 1.0,
         max_leverage: float = 1.0,
+        history_retention: Optional[int] = DEFAULT_HISTORY_RETENTION,
+        trade_retention: Optional[int] = DEFAULT_TRADE_RETENTION,
+        spill_dir: Optional[str] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL_SEC,
     ) -> None:
         self.lock = threading.Lock()
         self.process_interval = process_interval
@@ -95,19 +123,21 @@ class LiveSimulationState:
         self.trailing_stop_pct = trailing_stop_pct if trailing_stop_pct and trailing_stop_pct > 0 else None
         self.position_scale = max(0.2, min(2.0, position_scale)) if position_scale else 1.0
         self.max_leverage = max(1.0, float(max_leverage)) if max_leverage else 1.0
-
-        self.feed = KrakenLiveFeed(pair=pair)
-        self.simulator = TradingSimulator(
-            initial_cash=initial_cash,
-            allow_short=allow_short,
-            fee_bps=fee_bps,
-            stop_loss_pct=stop_loss_pct,
-            take_profit_pct=take_profit_pct,
-            trailing_stop_pct=self.trailing_stop_pct,
-            max_holding_period=max_hold_candles,
-            position_scale=self.position_scale,
-            max_leverage=self.max_leverage,
-        )
+        self.history_retention = history_retention
+        self.trade_retention = trade_retention
+        self.spill_dir = spill_dir
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint: Optional[datetime] = None
+        self._checkpoint_lock = threading.Lock()  # one writer at a time (loop vs. API calls)
+        self._last_checkpoint_mono = time.monotonic()
+        # newest candle processed before the restored checkpoint: older keys are skipped
+        self.resume_after: Optional[str] = None
+
+        # restore_checkpoint() (startup hook) swaps in the saved simulator: no disk I/O here
+        self.simulator = self._new_simulator()
+        self.risk_guard = TickRiskGuard()
+        self.risk_guard.arm(self.simulator)
         self.processed_keys: Set[str] = set()
         self.candles_df = pd.DataFrame(columns=["t0", "open", "high", "low", "close", "volume"])
         self.history_df = pd.DataFrame()
@@ -123,6 +153,8 @@ class LiveSimulationState:
         self.price_reference: Optional[float] = None
         self.price_reference_ts: Optional[datetime] = None
         self.latest_market_metrics: Optional[dict] = None
+        # last: the feed thread starts delivering trades to _on_live_trade right away
+        self.feed = KrakenLiveFeed(pair=self.feed_pair, on_trade=self._on_live_trade)
 
     # === background management ===========================================
 
@@ -140,6 +172,9 @@ class LiveSimulationState:
             except asyncio.CancelledError:
                 pass
         self.feed.stop()
+        self.save_checkpoint()
+        if not self.checkpoint_path:
+            self.simulator.close()  # otherwise the checkpoint still references the segments
 
     async def _run_loop(self) -> None:
         try:
@@ -175,7 +210,7 @@ class LiveSimulationState:
         new_keys = []
         for idx, row in candles_df.iterrows():
             key = row["t0"]
-            if key in self.processed_keys:
+            if key in self.processed_keys or (self.resume_after is not None and key <= self.resume_after):
                 continue
             signal = int(row.get("signal_candle", 0))
             combined_signal = signal
@@ -200,7 +235,8 @@ class LiveSimulationState:
             if market_metrics_latest:
                 candles_df.at[idx, "depth_imb_live"] = market_metrics_latest.get("depth_imbalance")
                 candles_df.at[idx, "spread_bp_live"] = market_metrics_latest.get("spread_bp")
-            self.simulator.on_candle(enriched_row, combined_signal)
+            with self.lock:
+                self.risk_guard.on_candle(self.simulator, enriched_row, combined_signal)
             self.processed_keys.add(key)
             new_keys.append(key)
 
@@ -211,16 +247,20 @@ class LiveSimulationState:
                 trim = len(self.processed_keys) - MAX_PROCESSED_KEYS
                 for key in sorted_keys[:trim]:
                     self.processed_keys.discard(key)
+            if time.monotonic() - self._last_checkpoint_mono >= self.checkpoint_interval:
+                self.save_checkpoint()
 
         with self.lock:
             self.candles_df = candles_df
-            self.history_df = self.simulator.history_df()
-            self.trades_df = self.simulator.trades_df()
+            # in-memory rows only: cheap cached views, no disk reads on the live loop
+            self.history_df = self.simulator.history_df(self.history_retention)
+            self.trades_df = self.simulator.trades_df(self.trade_retention)
             self.summary = self.simulator.summary()
             self.summary["feed_status"] = self.feed.status()
             self.summary["feed_running"] = self.feed.is_running()
             self.summary["pair"] = self.feed_pair
             self.summary["candle_sec"] = self.candle_sec
+            self.summary["last_checkpoint"] = self.last_checkpoint.isoformat() if self.last_checkpoint else None
             if self.latest_market_metrics:
                 self.summary["market_latency_ms"] = self.latest_market_metrics.get("latency_ms")
                 self.summary["depth_imbalance"] = self.latest_market_metrics.get("depth_imbalance")
@@ -265,6 +305,26 @@ class LiveSimulationState:
                 last_update=self.last_update,
             )
 
+    def history(self, limit: int) -> pd.DataFrame:
+        """Newest equity points, reading spilled rows from disk when limit reaches them."""
+        return self._read_rows("history", limit)
+
+    def trades(self, limit: int) -> pd.DataFrame:
+        return self._read_rows("trades", limit)
+
+    def _read_rows(self, store: str, limit: int) -> pd.DataFrame:
+        # only the store's index is taken under the lock: spilled rows are read from disk
+        # outside it, so a deep /equity or /bot_trades query never delays a tick exit
+        with self.lock:
+            read = getattr(self.simulator, store).reader(max(0, limit))
+        try:
+            return read()
+        except FileNotFoundError:
+            # simulator replaced (reset, /config) during the read: its segments are gone
+            with self.lock:
+                read = getattr(self.simulator, store).reader(max(0, limit))
+            return read()
+
     def order_book(self, depth: int) -> dict:
         depth = max(1, depth)
         feed_depth = getattr(self.feed, "depth", depth)
@@ -291,6 +351,14 @@ class LiveSimulationState:
         limit = max(1, min(limit, self.simulator.max_debug_entries))
         return self.simulator.logs(limit)
 
+    def _on_live_trade(self, price: float, ts: datetime) -> None:
+        """Feed thread, every trade: lock-free pre-check, the lock only when a stop may hit."""
+        if not self.risk_guard.check(price):
+            return
+        with self.lock:
+            if self.risk_guard.exit(self.simulator, price, ts.isoformat()):
+                self.summary.update(self.simulator.summary())
+
     def _micro_signal_from_metrics(self, metrics: Optional[dict]) -> tuple[int, float]:
         if not metrics:
             return 0, 0.0
@@ -320,7 +388,7 @@ class LiveSimulationState:
         if payload.pair and payload.pair != self.feed_pair:
             self.feed.stop()
             self.feed_pair = payload.pair
-            self.feed = KrakenLiveFeed(pair=self.feed_pair)
+            self.feed = KrakenLiveFeed(pair=self.feed_pair, on_trade=self._on_live_trade)
             restart_feed = True
 
         if payload.candle_sec and payload.candle_sec != self.candle_sec:
@@ -358,25 +426,18 @@ class LiveSimulationState:
             reinit_sim = True
 
         if reinit_sim:
-            self.simulator = TradingSimulator(
-                initial_cash=self.initial_cash,
-                allow_short=self.allow_short,
-                fee_bps=self.fee_bps,
-                stop_loss_pct=self.stop_loss_pct,
-                take_profit_pct=self.take_profit_pct,
-                trailing_stop_pct=self.trailing_stop_pct,
-                max_holding_period=self.max_hold_candles,
-                position_scale=self.position_scale,
-                max_leverage=self.max_leverage,
-            )
+            self._replace_simulator()
             self.processed_keys.clear()
+            self.resume_after = None
+        if reinit_sim or restart_feed:
+            self.save_checkpoint()
 
         if restart_feed and not self.feed.is_running():
             # give the feed a moment to reconnect
             pass
 
-    def reset_simulation(self) -> None:
-        self.simulator = TradingSimulator(
+    def _new_simulator(self) -> TradingSimulator:
+        return TradingSimulator(
             initial_cash=self.initial_cash,
             allow_short=self.allow_short,
             fee_bps=self.fee_bps,
@@ -386,11 +447,122 @@ class LiveSimulationState:
             max_holding_period=self.max_hold_candles,
             position_scale=self.position_scale,
             max_leverage=self.max_leverage,
+            history_retention=self.history_retention,
+            trade_retention=self.trade_retention,
+            spill_dir=self.spill_dir,
         )
+
+    def _replace_simulator(self) -> None:
+        with self.lock:
+            previous, self.simulator = self.simulator, self._new_simulator()
+            self.risk_guard.arm(self.simulator)
+        previous.close()
+
+    def reset_simulation(self) -> None:
+        self._replace_simulator()
         self.processed_keys.clear()
+        self.resume_after = None
+        self.save_checkpoint()
+
+    # === checkpoints =====================================================
+
+    def save_checkpoint(self) -> None:
+        """Write the simulator state and the newest processed candle (no-op without a path)."""
+        if not self.checkpoint_path:
+            return
+        with self.lock:
+            keys = self.processed_keys | ({self.resume_after} if self.resume_after else set())
+            payload = {
+                "server": {
+                    "pair": self.feed_pair,
+                    "candle_sec": self.candle_sec,
+                    "watermark": max(keys) if keys else None,
+                    "saved_at": datetime.now(timezone.utc).isoformat(),
+                    "spill_dir": self.simulator.spill_dir,
+                },
+                "simulator": self.simulator.checkpoint(),
+            }
+        # pickling and disk I/O stay outside the simulator lock; the payload holds copies only
+        with self._checkpoint_lock:
+            self._last_checkpoint_mono = time.monotonic()
+            try:
+                write_checkpoint(self.checkpoint_path, payload)
+            except OSError as exc:
+                with self.lock:
+                    self.summary["checkpoint_error"] = str(exc)
+                return
+            self.last_checkpoint = datetime.now(timezone.utc)
+
+    def restore_checkpoint(self) -> bool:
+        """
+        Resume from checkpoint_path if it holds a checkpoint (before start()). The spill
+        segments of the process that wrote it are reattached, so /equity and /bot_trades
+        still reach rows older than the retention window; its other segments are deleted.
+        """
+        saved = self._read_checkpoint()
+        if saved is None:
+            return False
+        pair = self.feed_pair
+        simulator = self._restore_checkpoint(saved)
+        old_spill_dir = saved["server"].get("spill_dir")
+        if old_spill_dir:
+            discard_spill_dir(old_spill_dir, keep=simulator.spill_paths())
+        with self.lock:
+            previous, self.simulator = self.simulator, simulator
+            self.risk_guard.arm(simulator)
+            self.summary = simulator.summary()
+        previous.close()
+        if self.feed_pair != pair:
+            self.feed.stop()
+            self.feed = KrakenLiveFeed(pair=self.feed_pair, on_trade=self._on_live_trade)
+        return True
+
+    def _read_checkpoint(self) -> Optional[dict]:
+        if not self.checkpoint_path:
+            return None
+        try:
+            return read_checkpoint(self.checkpoint_path)
+        except Exception as exc:
+            # never fall back to a flat simulator: the checkpoint may hold an open position
+            raise RuntimeError(
+                f"Unreadable checkpoint {self.checkpoint_path} ({exc}); "
+                "move it away to start a fresh simulation"
+            ) from exc
+
+    def _apply_saved_config(self, server: dict, config: dict) -> None:
+        """Settings changed through /config before the restart win over the defaults."""
+        self.feed_pair = server["pair"]
+        self.candle_sec = server["candle_sec"]
+        self.initial_cash = config["initial_cash"]
+        self.allow_short = config["allow_short"]
+        self.fee_bps = config["fee_bps"]
+        self.stop_loss_pct = config["stop_loss_pct"]
+        self.take_profit_pct = config["take_profit_pct"]
+        self.max_hold_candles = config["max_holding_period"]
+        self.trailing_stop_pct = config["trailing_stop_pct"]
+        self.position_scale = config["position_scale"]
+        self.max_leverage = config["max_leverage"]
+
+    def _restore_checkpoint(self, saved: dict) -> TradingSimulator:
+        try:
+            self._apply_saved_config(saved["server"], saved["simulator"]["config"])
+            simulator = TradingSimulator.from_checkpoint(
+                saved["simulator"],
+                history_retention=self.history_retention,
+                trade_retention=self.trade_retention,
+                spill_dir=self.spill_dir,
+            )
+        except Exception as exc:
+            raise RuntimeError(
+                f"Cannot restore checkpoint {self.checkpoint_path} ({exc}); "
+                "move it away to start a fresh simulation"
+            ) from exc
+        self.resume_after = saved["server"]["watermark"]
+        self.last_checkpoint = datetime.fromisoformat(saved["server"]["saved_at"])
+        return simulator
 
 app = FastAPI(title="Live BTC Bot Simulator", version="1.0")
-STATE = LiveSimulationState()
+STATE = LiveSimulationState(checkpoint_path=os.environ.get(CHECKPOINT_PATH_ENV) or None)
 
 FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend"
 STATIC_BUILD_DIR = FRONTEND_DIR / "dist"
@@ -403,6 +575,7 @@ else:
 
 @app.on_event("startup")
 async def _startup() -> None:
+    STATE.restore_checkpoint()
     STATE.start()
 
 @app.on_event("shutdown")
@@ -452,8 +625,7 @@ def get_candles(limit: int = 200):
 
 @app.get("/equity")
 def get_equity(limit: int = 500):
-    snap = STATE.snapshot()
-    history = snap.history.tail(limit)
+    history = STATE.history(limit)
     return {
         "limit": limit,
         "count": len(history),
@@ -471,8 +643,7 @@ def get_orderbook(depth: int = 15):
 
 @app.get("/bot_trades")
 def get_bot_trades(limit: int = 100):
-    snap = STATE.snapshot()
-    trades = snap.trades.tail(limit)
+    trades = STATE.trades(limit)
     return {
         "limit": limit,
         "count": len(trades),
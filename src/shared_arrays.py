@@ -0,0 +1,42 @@
+# src/shared_arrays.py
+"""
+Tableaux NumPy en mémoire partagée pour les pools de processus (sweep_sim, montecarlo).
+Le processus principal copie les tableaux une seule fois (share); chaque worker s'y
+attache sans copie depuis l'initializer du pool (attach) et les lit dans SHARED, en
+lecture seule.
+"""
+
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+SHARED: Dict[str, np.ndarray] = {}  # tableaux du worker (vues sur la mémoire partagée)
+_SHM: List[shared_memory.SharedMemory] = []
+
+@contextmanager
+def share(data: Dict[str, np.ndarray], names: Iterable[str]) -> Iterator[dict]:
+    """Copie data[name] pour chaque nom et donne la spec à passer à attach; libère tout en sortie."""
+    handles, spec = [], {}
+    try:
+        for name in names:
+            arr = np.ascontiguousarray(data[name])
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            handles.append(shm)
+            np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[:] = arr
+            spec[name] = (shm.name, arr.shape, arr.dtype.str)
+        yield spec
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+
+def attach(spec: dict) -> None:
+    """Initializer du pool: expose les tableaux de share dans SHARED."""
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHM.append(shm)
+        arr = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        SHARED[name] = arr
@@ -12,20 +12,20 @@ import argparse
 import pandas as pd
 import numpy as np
 
-def build(
-    micro_csv: str,
-    out_csv: str,
-    tau: float = 0.2,
-    max_spread_bp: float = 5.0,
-    invert: int = 0,
+from colcache import read_csv_cached, write_csv
+
+def micro_parts(
+    df: pd.DataFrame,
     use_ofi: int = 0,
     w_imb: float = 1.0,
     w_ofi: float = 1.0,
-):
-    p = Path(micro_csv)
-    assert p.exists(), f"Introuvable: {p}"
-    df = pd.read_csv(p)
-
+) -> tuple:
+    """
+    Composantes du score micro qui ne dépendent pas du remplacement des depth_vol nuls.
+    Retourne (parts {nom: ndarray}, spread_bp, mode enrichi ou non); combine_parts en
+    fait le score. Permet de ne lire les features qu'une fois quand seul vol_fill change
+    (walk-forward: une valeur par fold).
+    """
     # Vérifications de colonnes
     for c in ("t0", "mid", "spread", "depth_imb"):
         assert c in df.columns, f"Colonne manquante: {c}"
@@ -38,28 +38,84 @@ def build(
     enriched_cols = {"depth_trend","depth_vol","ofi_z","mid_ret_3","depth_ema_fast"}
     has_enriched = enriched_cols.issubset(df.columns)
 
+    def _num(c):
+        return pd.to_numeric(df[c], errors="coerce")
+
     if has_enriched:
-        depth_vol = pd.to_numeric(df["depth_vol"], errors="coerce").replace(0.0, np.nan)
-        depth_trend = pd.to_numeric(df["depth_trend"], errors="coerce").fillna(0.0)
-        depth_fast = pd.to_numeric(df["depth_ema_fast"], errors="coerce").fillna(0.0)
-        ofi_z = pd.to_numeric(df["ofi_z"], errors="coerce").clip(-5, 5).fillna(0.0)
-        mid_ret = pd.to_numeric(df["mid_ret_3"], errors="coerce").fillna(0.0)
-        depth_scale = depth_vol.fillna(depth_vol.median())
-        depth_scale = depth_scale.clip(lower=1e-6)
-        depth_signal = (depth_trend / depth_scale).clip(-5, 5)
-        score = (
-            1.6 * depth_signal.fillna(0.0) +
-            1.0 * ofi_z +
-            0.6 * (mid_ret * 100).clip(-5, 5) +
-            0.4 * depth_fast.clip(-1, 1)
-        )
+        parts = {
+            "depth_vol": _num("depth_vol").replace(0.0, np.nan),
+            "depth_trend": _num("depth_trend").fillna(0.0),
+            "ofi": _num("ofi_z").clip(-5, 5).fillna(0.0),
+            "mid": (_num("mid_ret_3").fillna(0.0) * 100).clip(-5, 5),
+            "fast": _num("depth_ema_fast").fillna(0.0).clip(-1, 1),
+        }
     else:
         # Construction d’un score directionnel classique
         if use_ofi and "ofi" in df.columns:
-            df["ofi"] = pd.to_numeric(df["ofi"], errors="coerce").fillna(0)
-            score = w_imb * df["depth_imb"].fillna(0) + w_ofi * np.tanh(df["ofi"])
+            ofi = _num("ofi").fillna(0)
+            score = w_imb * df["depth_imb"].fillna(0) + w_ofi * np.tanh(ofi)
         else:
             score = df["depth_imb"].fillna(0)
+        parts = {"score": score}
+    parts = {k: v.to_numpy(dtype=float) for k, v in parts.items()}
+    return parts, spread_bp.to_numpy(dtype=float), has_enriched
+
+def vol_median(depth_vol: np.ndarray) -> float:
+    """Médiane des depth_vol renseignés (NaN s'il n'y en a aucun)."""
+    v = depth_vol[~np.isnan(depth_vol)]
+    return float(np.median(v)) if len(v) else np.nan
+
+def combine_parts(parts: dict, vol_fill: float | None = None) -> np.ndarray:
+    """
+    Score micro des composantes de micro_parts. vol_fill: valeur de remplacement des
+    depth_vol nuls (défaut: leur médiane).
+    """
+    if "score" in parts:
+        return parts["score"]
+    if vol_fill is None:
+        vol_fill = vol_median(parts["depth_vol"])
+    depth_scale = np.where(np.isnan(parts["depth_vol"]), vol_fill, parts["depth_vol"])
+    depth_scale = np.clip(depth_scale, 1e-6, None)
+    depth_signal = np.clip(parts["depth_trend"] / depth_scale, -5, 5)
+    return (
+        1.6 * np.nan_to_num(depth_signal, nan=0.0) +
+        1.0 * parts["ofi"] +
+        0.6 * parts["mid"] +
+        0.4 * parts["fast"]
+    )
+
+def micro_score(
+    df: pd.DataFrame,
+    use_ofi: int = 0,
+    w_imb: float = 1.0,
+    w_ofi: float = 1.0,
+    vol_fill: float | None = None,
+) -> tuple:
+    """
+    Score directionnel et spread en bp des features micro, avant seuillage.
+    Retourne (score, spread_bp, mode enrichi ou non); ne dépend ni de tau ni de
+    max_spread_bp, ce qui permet de le calculer une fois pour toute une grille.
+    """
+    parts, spread_bp, has_enriched = micro_parts(df, use_ofi, w_imb, w_ofi)
+    score = pd.Series(combine_parts(parts, vol_fill), index=df.index)
+    return score, pd.Series(spread_bp, index=df.index), has_enriched
+
+def build_df(
+    df: pd.DataFrame,
+    tau: float = 0.2,
+    max_spread_bp: float = 5.0,
+    invert: int = 0,
+    use_ofi: int = 0,
+    w_imb: float = 1.0,
+    w_ofi: float = 1.0,
+    vol_fill: float | None = None,
+) -> pd.DataFrame:
+    """
+    Features micro -> DataFrame t0, signal_micro (+ score_micro en mode enrichi).
+    vol_fill: valeur de remplacement des depth_vol nuls (défaut: médiane de df); à
+    fournir quand df n'est qu'une fin de série.
+    """
+    score, spread_bp, has_enriched = micro_score(df, use_ofi, w_imb, w_ofi, vol_fill)
 
     # Seuils symétriques
     cond_buy  = (score >  tau) & (spread_bp < max_spread_bp)
@@ -77,11 +133,26 @@ def build(
     out["signal_micro"] = signal.astype(int)
     if has_enriched:
         out["score_micro"] = score.round(6)
-    out.to_csv(out_csv, index=False)
+    return out
+
+def build(
+    micro_csv: str,
+    out_csv: str,
+    tau: float = 0.2,
+    max_spread_bp: float = 5.0,
+    invert: int = 0,
+    use_ofi: int = 0,
+    w_imb: float = 1.0,
+    w_ofi: float = 1.0,
+):
+    p = Path(micro_csv)
+    assert p.exists(), f"Introuvable: {p}"
+    out = build_df(read_csv_cached(p), tau, max_spread_bp, invert, use_ofi, w_imb, w_ofi)
+    write_csv(out, out_csv)
 
-    n_sig = (signal != 0).sum()
+    n_sig = (out["signal_micro"] != 0).sum()
     msg = f"[signals_micro] {n_sig} signaux generes"
-    if has_enriched:
+    if "score_micro" in out.columns:
         msg += " (mode enrichi)"
     print(f"{msg} -> {out_csv}")
 
@@ -4,13 +4,23 @@ Simple portfolio simulator that consumes candle + signal streams.
 
 from __future__ import annotations
 
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from bisect import bisect_right
 from collections import deque
-from dataclasses import dataclass, field
-from typing import Any, Deque, Dict, List, Optional, Tuple
+from itertools import islice
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
-@dataclass
+@dataclass(slots=True)
 class TradeEvent:
     t0: str
     price: float
@@ -23,7 +33,7 @@ class TradeEvent:
     reason: Optional[str] = None
     meta: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class EquityPoint:
     t0: str
     price: float
@@ -38,6 +48,659 @@ class EquityPoint:
     risk_event: Optional[str]
     position_age: int
 
+class ColumnStore:
+    """
+    Append-only columnar storage for simulator records.
+
+    Each field of ``record_type`` lives in its own growable NumPy array (capacity doubles
+    when full), so an append is amortised O(1) and a row costs a few machine words
+    instead of a dataclass instance. ``frame()`` returns a DataFrame of read-only views
+    over the in-memory rows, cached until the next append. Indexing and iteration yield
+    ``record_type`` instances for callers that expect the dataclasses.
+    Columns listed in ``lazy`` store raw values that are converted by their function
+    the first time any reader touches the rows; the functions must pass already
+    converted values through unchanged.
+
+    With ``retain`` set, at most ``2 * retain`` rows stay in memory: when full, all but
+    the newest ``retain`` rows are pickled as one chunk appended to the segment file
+    ``spill_path``. Lengths, indexing, ``frame()`` and ``column()`` read through both
+    tiers; only queries reaching past the in-memory rows touch the disk.
+
+    ``rows()`` copies out the newest rows and ``load()`` puts them back into an empty
+    store under the same global row numbers. Given the ``segments()`` of the store that
+    wrote them, ``load()`` reattaches its segment file so older rows stay readable;
+    otherwise rows older than the loaded ones count in ``len()`` but can no longer be read.
+
+    ``reader()`` splits ``frame()`` for callers that share the store across threads:
+    only taking the reader needs their lock, the disk reads happen when it is called.
+    """
+
+    def __init__(
+        self,
+        record_type: type,
+        dtypes: Dict[str, Any],
+        capacity: int = 1024,
+        lazy: Optional[Dict[str, Callable[[Any], Any]]] = None,
+        retain: Optional[int] = None,
+        spill_path: Optional[str] = None,
+    ) -> None:
+        self.record_type = record_type
+        self.lazy = dict(lazy or {})
+        self._resolved = 0
+        self.names = [f.name for f in fields(record_type)]
+        self.dtypes = {name: np.dtype(dtypes.get(name, object)) for name in self.names}
+        self.retain = max(1, int(retain)) if retain else None
+        self.spill_path = Path(spill_path) if spill_path else None
+        if self.retain is not None and self.spill_path is None:
+            raise ValueError("spill_path is required when retain is set")
+        self._capacity = max(1, int(capacity))
+        if self.retain is not None:
+            self._capacity = 2 * self.retain
+        self._cols = {name: np.empty(self._capacity, dtype=dt) for name, dt in self.dtypes.items()}
+        self._size = 0  # rows in memory
+        self._spilled = 0  # rows in the segment file (plus those dropped before a load)
+        self._base = 0  # rows dropped before a load(): counted, never readable
+        self._chunks: List[Tuple[int, int, int]] = []  # (first row, byte offset, byte length)
+        self._chunk_cache: Optional[Tuple[int, Dict[str, np.ndarray]]] = None
+        self._frame: Optional[pd.DataFrame] = None
+
+    def __len__(self) -> int:
+        return self._spilled + self._size
+
+    @property
+    def spilled(self) -> int:
+        return self._spilled
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        for name, col in self._cols.items():
+            grown = np.empty(self._capacity, dtype=col.dtype)
+            grown[:self._size] = col[:self._size]
+            self._cols[name] = grown
+
+    def _spill(self) -> None:
+        assert self.retain is not None and self.spill_path is not None
+        k = self._size - self.retain
+        chunk = {name: col[:k] for name, col in self._cols.items()}
+        data = pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "ab" if self._chunks else "wb") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        self._chunks.append((self._spilled, offset, len(data)))
+        # fresh arrays: frames already handed out keep viewing the old ones
+        for name, col in self._cols.items():
+            kept = np.empty(self._capacity, dtype=col.dtype)
+            kept[:self.retain] = col[k:self._size]
+            self._cols[name] = kept
+        self._spilled += k
+        self._size = self.retain
+        self._resolved = max(0, self._resolved - k)
+
+    def append(self, **values: Any) -> None:
+        if self._size == self._capacity:
+            if self.retain is not None:
+                self._spill()
+            else:
+                self._grow()
+        i = self._size
+        for name, col in self._cols.items():
+            col[i] = values.get(name)
+        self._size = i + 1
+        self._frame = None
+
+    def discard(self) -> None:
+        """Drop the segment file (the store must not be used afterwards)."""
+        if self._chunks and self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+        self._chunks = []
+        self._chunk_cache = None
+
+    def rows(self, last: Optional[int] = None) -> Tuple[int, Dict[str, np.ndarray]]:
+        """(global row number of the first row, column copies) of the newest ``last`` rows."""
+        frame = self.frame(last)
+        return len(self) - len(frame), {name: frame[name].to_numpy().copy() for name in self.names}
+
+    def segments(self) -> Optional[Tuple[str, int, int, List[Tuple[int, int, int]]]]:
+        """
+        (segment file, first readable row, rows spilled, chunk index), or None when
+        nothing was spilled. Pair it with ``rows(len(store) - store.spilled)``.
+        """
+        if not self._chunks or self.spill_path is None:
+            return None
+        return str(self.spill_path), self._base, self._spilled, list(self._chunks)
+
+    def _attach(self, segments: Optional[tuple], start: int) -> bool:
+        if segments is None or self.retain is None:
+            return False
+        path, base, spilled, chunks = segments
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        _, offset, length = chunks[-1]
+        # the loaded rows must start where the chunks end, and the chunks still be on disk
+        if spilled != start or size < offset + length:
+            return False
+        self.spill_path, self._chunks, self._base = Path(path), list(chunks), int(base)
+        return True
+
+    def load(self, start: int, columns: Dict[str, np.ndarray], segments: Optional[tuple] = None) -> None:
+        """
+        Fill an empty store with rows numbered from ``start`` (output of ``rows()``);
+        ``segments`` (output of ``segments()``) reattaches the rows spilled before them.
+        """
+        if len(self):
+            raise ValueError("load() needs an empty store")
+        n = len(columns[self.names[0]]) if self.names else 0
+        attached = self._attach(segments, int(start))
+        skip = n - self.retain if self.retain is not None and n > self.retain and not attached else 0
+        while self._capacity < n - skip:
+            self._grow()
+        for name, col in self._cols.items():
+            col[:n - skip] = columns[name][skip:]
+        self._size = self._resolved = n - skip
+        self._spilled = int(start) + skip
+        if not attached:
+            self._base = self._spilled
+        self._frame = None
+
+    def _resolve(self) -> None:
+        if self._resolved == self._size:
+            return
+        for name, render in self.lazy.items():
+            col = self._cols[name]
+            for i in range(self._resolved, self._size):
+                col[i] = render(col[i])
+        self._resolved = self._size
+
+    def _load_chunk(self, k: int, chunks: Optional[List[Tuple[int, int, int]]] = None) -> Dict[str, np.ndarray]:
+        if self._chunk_cache is not None and self._chunk_cache[0] == k:
+            return self._chunk_cache[1]
+        assert self.spill_path is not None
+        _, offset, length = (self._chunks if chunks is None else chunks)[k]
+        with open(self.spill_path, "rb") as f:
+            f.seek(offset)
+            chunk = pickle.loads(f.read(length))
+        for name, render in self.lazy.items():
+            col = chunk[name]
+            for i in range(len(col)):
+                col[i] = render(col[i])
+        for col in chunk.values():
+            col.flags.writeable = False
+        self._chunk_cache = (k, chunk)
+        return chunk
+
+    def _disk_columns(self, start: int, chunks: Optional[List[Tuple[int, int, int]]] = None) -> Dict[str, np.ndarray]:
+        """Spilled rows [start, spilled) as one array per column (of ``chunks``, default all)."""
+        chunks = self._chunks if chunks is None else chunks
+        first = max(0, bisect_right([c[0] for c in chunks], start) - 1)
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in self.names}
+        for k in range(first, len(chunks)):
+            chunk = self._load_chunk(k, chunks)
+            skip = max(0, start - chunks[k][0])
+            for name in self.names:
+                parts[name].append(chunk[name][skip:])
+        return {name: np.concatenate(p) if p else np.empty(0, dtype=self.dtypes[name])
+                for name, p in parts.items()}
+
+    def _memory_view(self, name: str) -> np.ndarray:
+        view = self._cols[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def column(self, name: str) -> np.ndarray:
+        if name in self.lazy:
+            self._resolve()
+        if self._spilled:
+            return np.concatenate([self._disk_columns(0)[name], self._memory_view(name)])
+        return self._memory_view(name)
+
+    def last(self, name: str) -> Any:
+        """Value of ``name`` in the newest row (in memory whenever the store is not empty)."""
+        if not self._size:
+            return None
+        if name in self.lazy:
+            self._resolve()
+        value = self._cols[name][self._size - 1]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def _record(self, i: int) -> Any:
+        if i < self._base:
+            raise IndexError("record dropped before the store was loaded")
+        if i < self._spilled:
+            k = bisect_right([c[0] for c in self._chunks], i) - 1
+            chunk, j = self._load_chunk(k), i - self._chunks[k][0]
+        else:
+            self._resolve()
+            chunk, j = self._cols, i - self._spilled
+        return self.record_type(**{name: chunk[name][j].item() if chunk[name].dtype != object else chunk[name][j]
+                                   for name in self.names})
+
+    def __getitem__(self, idx: Any) -> Any:
+        total = len(self)
+        if isinstance(idx, slice):
+            return [self._record(i) for i in range(*idx.indices(total)) if i >= self._base]
+        i = idx + total if idx < 0 else idx
+        if not self._base <= i < total:
+            raise IndexError("record index out of range")
+        return self._record(i)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (self._record(i) for i in range(self._base, len(self)))
+
+    def frame(self, last: Optional[int] = None) -> pd.DataFrame:
+        """All rows, or the newest ``last`` ones; the index is the global row number."""
+        return self.reader(last)()
+
+    def reader(self, last: Optional[int] = None) -> Callable[[], pd.DataFrame]:
+        """
+        ``frame(last)`` in two steps. This call only takes the in-memory views and a copy
+        of the chunk index; the returned function reads the spilled rows from disk and
+        may run after later appends (their rows are not included).
+        """
+        if self._frame is None:
+            self._resolve()
+            self._frame = pd.DataFrame(
+                {name: self._memory_view(name) for name in self.names},
+                index=pd.RangeIndex(self._spilled, self._spilled + self._size),
+                copy=False,
+            )
+        memory, total = self._frame, len(self)
+        start = self._base if last is None else max(self._base, total - int(last))
+        if start >= self._spilled:
+            out = memory if start == self._spilled else memory.iloc[start - self._spilled:]
+            return lambda: out
+        chunks = list(self._chunks)
+
+        def read() -> pd.DataFrame:
+            disk = self._disk_columns(start, chunks)
+            return pd.DataFrame(
+                {name: np.concatenate([disk[name], memory[name].to_numpy()]) for name in self.names},
+                index=pd.RangeIndex(start, total),
+            )
+
+        return read
+
+CLOSING_ACTIONS = ("sell", "buy_to_cover")
+
+# row fields read by the trade context, in TradeContext.values order
+CONTEXT_KEYS = (
+    "micro_score", "signal_micro_live", "signal_micro", "signal_candle", "mom_signal",
+    "depth_imb_live", "depth_imbalance", "spread_bp_live", "spread_bp",
+    "volatility", "ret_pct", "score_micro",
+)
+
+class TradeContext:
+    """
+    Raw numbers behind a trade's context string and meta dict.
+
+    Captured at trade time without any formatting; ``render()`` builds the pipe-joined
+    string and the meta dict on first use and caches them.
+    """
+
+    __slots__ = (
+        "reason", "signal", "forced_signal", "risk_event", "qty", "position_before",
+        "position_after", "price", "equity_after", "cash_after", "values", "pnl", "_rendered",
+    )
+
+    def __init__(
+        self,
+        reason: str,
+        signal: int,
+        forced_signal: Optional[int],
+        risk_event: Optional[str],
+        qty: float,
+        position_before: float,
+        position_after: float,
+        price: float,
+        equity_after: float,
+        cash_after: float,
+        values: Tuple[Any, ...],
+        pnl: float = 0.0,
+    ) -> None:
+        self.reason = reason
+        self.signal = signal
+        self.forced_signal = forced_signal
+        self.risk_event = risk_event
+        self.qty = qty
+        self.position_before = position_before
+        self.position_after = position_after
+        self.price = price
+        self.equity_after = equity_after
+        self.cash_after = cash_after
+        self.values = values
+        self.pnl = pnl
+        self._rendered: Optional[Tuple[str, Dict[str, Any]]] = None
+
+    def render(self) -> Tuple[str, Dict[str, Any]]:
+        if self._rendered is None:
+            self._rendered = self._render()
+        return self._rendered
+
+    def _render(self) -> Tuple[str, Dict[str, Any]]:
+        safe_number = TradingSimulator._safe_number
+        safe_int = TradingSimulator._safe_int
+        fmt_qty = TradingSimulator._fmt_qty
+        (micro_value, micro_live, micro_sig_value, candle_value, mom_value, depth_live,
+         depth_value, spread_live, spread_value, vol_value, ret_value, score_value) = self.values
+
+        parts = [f"reason={self.reason}", f"signal={self.signal}"]
+        if self.forced_signal is not None:
+            parts.append(f"forced={self.forced_signal}")
+        if self.risk_event:
+            parts.append(f"risk={self.risk_event}")
+        parts.append(f"qty={fmt_qty(self.qty)}")
+        parts.append(f"pos={fmt_qty(self.position_after)}")
+
+        meta: Dict[str, Any] = {
+            "reason": self.reason,
+            "signal": self.signal,
+            "forced_signal": self.forced_signal,
+            "risk_event": self.risk_event,
+            "qty": self.qty,
+            "position_before": self.position_before,
+            "position_after": self.position_after,
+            "price": self.price,
+            "equity_after": self.equity_after,
+            "cash_after": self.cash_after,
+        }
+
+        micro_score = safe_number(micro_value)
+        if micro_score is not None:
+            parts.append(f"micro={micro_score:+.3f}")
+            meta["micro_score"] = micro_score
+
+        if micro_live is None or pd.isna(micro_live):
+            micro_live = micro_sig_value
+        micro_signal = safe_int(micro_live)
+        if micro_signal is not None:
+            parts.append(f"micro_sig={micro_signal}")
+            meta["signal_micro"] = micro_signal
+
+        candle_signal = safe_int(candle_value)
+        if candle_signal is not None:
+            meta["signal_candle"] = candle_signal
+
+        mom_signal = safe_int(mom_value)
+        if mom_signal is not None:
+            parts.append(f"mom={mom_signal}")
+            meta["mom_signal"] = mom_signal
+
+        if depth_live is None or pd.isna(depth_live):
+            depth_live = depth_value
+        depth = safe_number(depth_live)
+        if depth is not None:
+            parts.append(f"depth={depth:+.3f}")
+            meta["depth_imbalance"] = depth
+
+        if spread_live is None or pd.isna(spread_live):
+            spread_live = spread_value
+        spread = safe_number(spread_live)
+        if spread is not None:
+            parts.append(f"spread_bp={spread:.2f}")
+            meta["spread_bp"] = spread
+
+        volatility = safe_number(vol_value)
+        if volatility is not None:
+            meta["volatility"] = volatility
+
+        ret_pct = safe_number(ret_value)
+        if ret_pct is not None:
+            meta["ret_pct"] = ret_pct
+
+        score_micro = safe_number(score_value)
+        if score_micro is not None:
+            meta["score_micro"] = score_micro
+
+        meta["pnl"] = self.pnl
+        return " | ".join(parts), meta
+
+class TradeLogEntry:
+    """debug_logs record of a trade; the dict (with the rendered meta) is built on read."""
+
+    __slots__ = ("t0", "price", "action", "qty", "pnl", "reason", "context")
+
+    def __init__(
+        self,
+        t0: str,
+        price: float,
+        action: str,
+        qty: float,
+        pnl: float,
+        reason: Optional[str],
+        context: Optional[TradeContext],
+    ) -> None:
+        self.t0 = t0
+        self.price = price
+        self.action = action
+        self.qty = qty
+        self.pnl = pnl
+        self.reason = reason
+        self.context = context
+
+    def as_dict(self) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {
+            "kind": "trade",
+            "t0": self.t0,
+            "price": self.price,
+            "action": self.action,
+            "qty": self.qty,
+            "pnl": self.pnl,
+            "reason": self.reason,
+        }
+        if self.context is not None:
+            entry.update(self.context.render()[1])
+        return entry
+
+def _context_text(value: Any) -> Any:
+    return value.render()[0] if isinstance(value, TradeContext) else value
+
+def _context_meta(value: Any) -> Any:
+    return value.render()[1] if isinstance(value, TradeContext) else value
+
+class TradeStats:
+    """
+    Running statistics of closing trades, updated in O(1) per trade.
+
+    The last ``window`` PnLs sit in a fixed ring; totals, gross profit/loss and
+    win/loss streaks are plain accumulators, so reading them never scans the trades.
+    A trade counts as a win when its PnL is strictly positive.
+    """
+
+    def __init__(self, window: int = 20) -> None:
+        self.recent: Deque[float] = deque(maxlen=max(1, int(window)))
+        self.count = 0
+        self.wins = 0
+        self.pnl_sum = 0.0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.streak = 0  # > 0: consecutive wins, < 0: consecutive losses
+        self.max_win_streak = 0
+        self.max_loss_streak = 0
+
+    def add(self, pnl: float) -> None:
+        self.recent.append(pnl)
+        self.count += 1
+        self.pnl_sum += pnl
+        if pnl > 0:
+            self.wins += 1
+            self.gross_profit += pnl
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.max_win_streak = max(self.max_win_streak, self.streak)
+        else:
+            self.gross_loss -= pnl
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.max_loss_streak = max(self.max_loss_streak, -self.streak)
+
+    def as_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {
+                "hit_rate_last_20": None, "pnl_last_20": None, "avg_trade_pnl": None,
+                "n_closed_trades": 0, "win_rate": None, "profit_factor": None,
+                "win_streak": 0, "loss_streak": 0, "max_win_streak": 0, "max_loss_streak": 0,
+            }
+        recent = self.recent
+        return {
+            "hit_rate_last_20": sum(1 for p in recent if p > 0) / len(recent),
+            "pnl_last_20": float(sum(recent)),
+            "avg_trade_pnl": self.pnl_sum / self.count,
+            "n_closed_trades": self.count,
+            "win_rate": self.wins / self.count,
+            "profit_factor": self.gross_profit / self.gross_loss if self.gross_loss > 0 else None,
+            "win_streak": max(self.streak, 0),
+            "loss_streak": max(-self.streak, 0),
+            "max_win_streak": self.max_win_streak,
+            "max_loss_streak": self.max_loss_streak,
+        }
+
+class TickRiskGuard:
+    """
+    Lock-free pre-check of live trades for TradingSimulator.on_tick.
+
+    ``arm()`` turns the open position into plain exit prices once per candle, so
+    ``check()`` costs a few float comparisons per trade and never touches the
+    simulator; it only tracks the trailing extreme. When it reports a breach, the
+    caller takes its lock and runs ``exit()``, which hands the extreme over and lets
+    on_tick decide with the simulator's own state. Candles go through ``on_candle()``
+    so tick extremes reach the candle-level trailing stop as well.
+
+    The armed state is one list swapped in whole by ``arm()`` and never mutated by it:
+    ``check()`` reads the reference once and only updates the extreme of that list, so
+    a tick racing a re-arm can only write into the list being discarded.
+    """
+
+    __slots__ = ("_armed",)
+
+    def __init__(self) -> None:
+        # [position, entry, is_long, take-profit price, stop price, trailing pct, extreme] or None when flat
+        self._armed: Optional[list] = None
+
+    def arm(self, sim: "TradingSimulator") -> None:
+        pos, entry = sim.position, sim.avg_entry_price
+        if pos == 0 or entry in (None, 0.0):
+            self._armed = None
+            return
+        long = pos > 0
+        tp = sim.take_profit_pct or None
+        sl = sim.stop_loss_pct if sim.stop_loss_pct and sim.stop_loss_pct > 0 else None
+        # thresholds nudged by 1e-12 towards the entry: rounding never hides a stop on_tick would take
+        if long:
+            tp_px = entry * (1 + tp) * (1 - 1e-12) if tp else None
+            sl_px = entry * (1 - sl) * (1 + 1e-12) if sl else None
+            extreme = sim._entry_high
+        else:
+            tp_px = entry * (1 - tp) * (1 + 1e-12) if tp else None
+            sl_px = entry * (1 + sl) * (1 - 1e-12) if sl else None
+            extreme = sim._entry_low
+        self._armed = [pos, entry, long, tp_px, sl_px, sim.trailing_stop_pct or None, extreme]
+
+    def check(self, price: float) -> bool:
+        """True when ``price`` may hit a stop (the simulator has the final word)."""
+        armed = self._armed  # single read: everything below uses this snapshot
+        if armed is None or not price > 0:
+            return False
+        _, _, long, tp_px, sl_px, trail, extreme = armed
+        if long:
+            if (tp_px is not None and price >= tp_px) or (sl_px is not None and price <= sl_px):
+                return True
+            if trail is not None:
+                if extreme is None or price > extreme:
+                    armed[6] = price
+                elif price <= extreme * (1 - trail):
+                    return True
+        else:
+            if (tp_px is not None and price <= tp_px) or (sl_px is not None and price >= sl_px):
+                return True
+            if trail is not None:
+                if extreme is None or price < extreme:
+                    armed[6] = price
+                elif price >= extreme * (1 + trail):
+                    return True
+        return False
+
+    def _sync(self, sim: "TradingSimulator") -> None:
+        armed = self._armed
+        if armed is None:
+            return
+        pos, entry, long, extreme = armed[0], armed[1], armed[2], armed[6]
+        if extreme is None or (pos, entry) != (sim.position, sim.avg_entry_price):
+            return
+        if long:
+            sim._entry_high = extreme if sim._entry_high is None else max(sim._entry_high, extreme)
+        else:
+            sim._entry_low = extreme if sim._entry_low is None else min(sim._entry_low, extreme)
+
+    def exit(self, sim: "TradingSimulator", price: float, t0: Any = None) -> Optional[str]:
+        """Run on_tick after a positive check (under the caller's lock); re-arms."""
+        self._sync(sim)
+        label = sim.on_tick(price, t0)
+        self.arm(sim)
+        return label
+
+    def on_candle(self, sim: "TradingSimulator", row: pd.Series, signal: int) -> None:
+        self._sync(sim)
+        sim.on_candle(row, signal)
+        self.arm(sim)
+
+HISTORY_DTYPES = {
+    "price": np.float64, "signal": np.int64, "position": np.float64, "cash": np.float64,
+    "equity": np.float64, "unrealized": np.float64, "realized": np.float64,
+    "drawdown": np.float64, "position_age": np.int64,
+}
+TRADE_DTYPES = {
+    "price": np.float64, "qty": np.float64, "cash": np.float64, "equity": np.float64, "pnl": np.float64,
+}
+
+CHECKPOINT_VERSION = 1
+SPILL_DIR_PREFIX = "simulator_spill_"  # temporary spill dirs created when spill_dir is unset
+# constructor arguments saved in a checkpoint; storage options stay with the process
+CHECKPOINT_CONFIG = (
+    "initial_cash", "allow_short", "fee_bps", "stop_loss_pct", "take_profit_pct", "trailing_stop_pct",
+    "max_holding_period", "position_scale", "max_leverage", "max_debug_entries",
+)
+# account and risk-tracking attributes restored as-is
+CHECKPOINT_STATE = (
+    "cash", "position", "avg_entry_price", "position_age", "_last_price", "_equity_peak",
+    "_max_drawdown", "_entry_high", "_entry_low", "_open_trade_equity", "_tick_exit",
+)
+
+def write_checkpoint(path: Any, payload: Dict[str, Any]) -> None:
+    """Pickle ``payload`` through a temporary file renamed over ``path``: never half written."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_checkpoint(path: Any) -> Optional[Dict[str, Any]]:
+    """Payload saved by write_checkpoint, or None when there is no file."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def discard_spill_dir(path: Any, keep: Sequence[str] = ()) -> None:
+    """
+    Delete the segment files a previous process left under ``path``, except ``keep``
+    (those reattached by ``from_checkpoint``). An emptied temporary dir is removed.
+    """
+    path = Path(path)
+    kept = {Path(p) for p in keep}
+    for kind in ("history", "trades"):
+        for seg in path.glob(f"{kind}-*.seg"):
+            if seg not in kept:
+                seg.unlink(missing_ok=True)
+    if path.name.startswith(SPILL_DIR_PREFIX):
+        try:
+            path.rmdir()
+        except OSError:
+            pass  # still holds reattached segments, or already gone
+
 @dataclass
 class TradingSimulator:
     initial_cash: float = 100.0
@@ -50,9 +713,13 @@ class TradingSimulator:
     position_scale: float = 1.0
     max_leverage: float = 1.0
     max_debug_entries: int = 400
-    history: List[EquityPoint] = field(default_factory=list)
-    trades: List[TradeEvent] = field(default_factory=list)
-    debug_logs: Deque[Dict[str, Any]] = field(init=False, repr=False)
+    # rows kept in memory (None: unbounded); older rows are spilled under spill_dir
+    history_retention: Optional[int] = None
+    trade_retention: Optional[int] = None
+    spill_dir: Optional[str] = None
+    history: ColumnStore = field(init=False, repr=False)
+    trades: ColumnStore = field(init=False, repr=False)
+    debug_logs: Deque[Any] = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
         try:
@@ -60,14 +727,28 @@ class TradingSimulator:
         except (TypeError, ValueError):
             self.max_leverage = 1.0
         self.debug_logs = deque(maxlen=max(1, int(self.max_debug_entries)))
+        self._owns_spill_dir = False
         self.reset()
 
     def reset(self) -> None:
         self.cash = float(self.initial_cash)
         self.position = 0.0  # BTC quantity (positive long, negative short)
         self.avg_entry_price: Optional[float] = None
-        self.history = []
-        self.trades = []
+        for store in (getattr(self, "history", None), getattr(self, "trades", None)):
+            if isinstance(store, ColumnStore):
+                store.discard()
+        if (self.history_retention or self.trade_retention) and not self.spill_dir:
+            self.spill_dir = tempfile.mkdtemp(prefix=SPILL_DIR_PREFIX)
+            self._owns_spill_dir = True
+        tag = uuid.uuid4().hex[:12]
+        self.history = ColumnStore(
+            EquityPoint, HISTORY_DTYPES, retain=self.history_retention,
+            spill_path=self._spill_path("history", tag),
+        )
+        self.trades = ColumnStore(
+            TradeEvent, TRADE_DTYPES, lazy={"context": _context_text, "meta": _context_meta},
+            retain=self.trade_retention, spill_path=self._spill_path("trades", tag),
+        )
         self._last_price: Optional[float] = None
         self.position_age = 0
         self._equity_peak = self.initial_cash
@@ -75,14 +756,76 @@ class TradingSimulator:
         self._entry_high: Optional[float] = None
         self._entry_low: Optional[float] = None
         self._open_trade_equity: Optional[float] = None
+        self._tick_exit: Optional[Tuple[str, str]] = None  # (action, risk label) taken by on_tick
+        self.trade_stats = TradeStats(20)
         if hasattr(self, "debug_logs"):
             self.debug_logs.clear()
 
+    def close(self) -> None:
+        """Delete the spill segments (and the temporary spill dir) of a simulator that is being replaced."""
+        self.history.discard()
+        self.trades.discard()
+        if self._owns_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        Picklable copy of the simulator: config, account and risk-tracking state, trade
+        statistics, debug logs and the in-memory history/trade rows (all of them when
+        unbounded). Rows already spilled to disk are referenced by their segment file
+        and chunk index, which ``from_checkpoint`` reattaches while the file exists.
+        """
+        return {
+            "version": CHECKPOINT_VERSION,
+            "config": {name: getattr(self, name) for name in CHECKPOINT_CONFIG},
+            "state": {name: getattr(self, name) for name in CHECKPOINT_STATE},
+            "trade_stats": copy.deepcopy(self.trade_stats),
+            "logs": self.logs(),
+            "history": self.history.rows(len(self.history) - self.history.spilled),
+            "trades": self.trades.rows(len(self.trades) - self.trades.spilled),
+            "segments": {"history": self.history.segments(), "trades": self.trades.segments()},
+        }
+
+    @classmethod
+    def from_checkpoint(cls, state: Dict[str, Any], **options: Any) -> "TradingSimulator":
+        """
+        Rebuild a simulator from ``checkpoint()`` output, open position included; ``options``
+        are the storage arguments (retention, spill_dir). Spilled rows stay readable when
+        their segment files still exist; without spill_dir the simulator keeps spilling
+        next to them. Raises ValueError on a checkpoint written by another version
+        instead of starting flat.
+        """
+        version = state.get("version") if isinstance(state, dict) else None
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported simulator checkpoint version: {version!r}")
+        segments = state.get("segments") or {}
+        old_dirs = {str(Path(seg[0]).parent) for seg in segments.values() if seg}
+        adopt = not options.get("spill_dir") and len(old_dirs) == 1 and Path(next(iter(old_dirs))).is_dir()
+        if adopt:
+            options["spill_dir"] = old_dirs.pop()
+        sim = cls(**state["config"], **options)
+        if adopt:
+            sim._owns_spill_dir = Path(sim.spill_dir).name.startswith(SPILL_DIR_PREFIX)
+        for name, value in state["state"].items():
+            setattr(sim, name, value)
+        sim.trade_stats = state["trade_stats"]
+        sim.debug_logs.extend(state["logs"])
+        sim.history.load(*state["history"], segments=segments.get("history"))
+        sim.trades.load(*state["trades"], segments=segments.get("trades"))
+        return sim
+
+    def spill_paths(self) -> List[str]:
+        """Segment files the history and trade stores read from and spill to."""
+        return [str(store.spill_path) for store in (self.history, self.trades) if store.spill_path]
+
+    def _spill_path(self, kind: str, tag: str) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        return str(Path(self.spill_dir) / f"{kind}-{tag}.seg")
+
     @property
     def last_equity(self) -> Optional[float]:
-        if not self.history:
-            return None
-        return self.history[-1].equity
+        return self.history.last("equity")
 
     def current_equity(self, price: Optional[float] = None) -> float:
         px = price if price is not None else (self._last_price or 0.0)
@@ -160,101 +903,39 @@ class TradingSimulator:
         position_after: float,
         risk_event: Optional[str],
         forced_signal: Optional[int],
-    ) -> Tuple[str, Dict[str, Any]]:
-        parts = [f"reason={reason}", f"signal={signal}"]
-        if forced_signal is not None:
-            parts.append(f"forced={forced_signal}")
-        if risk_event:
-            parts.append(f"risk={risk_event}")
-        parts.append(f"qty={self._fmt_qty(qty)}")
-        parts.append(f"pos={self._fmt_qty(position_after)}")
-
-        meta: Dict[str, Any] = {
-            "reason": reason,
-            "signal": signal,
-            "forced_signal": forced_signal,
-            "risk_event": risk_event,
-            "qty": qty,
-            "position_before": position_before,
-            "position_after": position_after,
-            "price": price,
-            "equity_after": self.current_equity(price),
-            "cash_after": self.cash,
-        }
-
-        micro_score = self._safe_number(row.get("micro_score"))
-        if micro_score is not None:
-            parts.append(f"micro={micro_score:+.3f}")
-            meta["micro_score"] = micro_score
-
-        micro_signal_value = row.get("signal_micro_live")
-        if micro_signal_value is None or pd.isna(micro_signal_value):
-            micro_signal_value = row.get("signal_micro")
-        micro_signal = self._safe_int(micro_signal_value)
-        if micro_signal is not None:
-            parts.append(f"micro_sig={micro_signal}")
-            meta["signal_micro"] = micro_signal
-
-        candle_signal = self._safe_int(row.get("signal_candle"))
-        if candle_signal is not None:
-            meta["signal_candle"] = candle_signal
-
-        mom_signal = self._safe_int(row.get("mom_signal"))
-        if mom_signal is not None:
-            parts.append(f"mom={mom_signal}")
-            meta["mom_signal"] = mom_signal
-
-        depth_value = row.get("depth_imb_live")
-        if depth_value is None or pd.isna(depth_value):
-            depth_value = row.get("depth_imbalance")
-        depth = self._safe_number(depth_value)
-        if depth is not None:
-            parts.append(f"depth={depth:+.3f}")
-            meta["depth_imbalance"] = depth
-
-        spread_value = row.get("spread_bp_live")
-        if spread_value is None or pd.isna(spread_value):
-            spread_value = row.get("spread_bp")
-        spread = self._safe_number(spread_value)
-        if spread is not None:
-            parts.append(f"spread_bp={spread:.2f}")
-            meta["spread_bp"] = spread
-
-        volatility = self._safe_number(row.get("volatility"))
-        if volatility is not None:
-            meta["volatility"] = volatility
-
-        ret_pct = self._safe_number(row.get("ret_pct"))
-        if ret_pct is not None:
-            meta["ret_pct"] = ret_pct
-
-        score_micro = self._safe_number(row.get("score_micro"))
-        if score_micro is not None:
-            meta["score_micro"] = score_micro
-
-        return " | ".join(parts), meta
+    ) -> "TradeContext":
+        if isinstance(row, pd.Series):
+            lookup = dict(zip(row.index, row.to_numpy()))
+        else:
+            lookup = row
+        return TradeContext(
+            reason=reason,
+            signal=signal,
+            forced_signal=forced_signal,
+            risk_event=risk_event,
+            qty=qty,
+            position_before=position_before,
+            position_after=position_after,
+            price=price,
+            equity_after=self.current_equity(price),
+            cash_after=self.cash,
+            values=tuple(lookup.get(key) for key in CONTEXT_KEYS),
+        )
 
-    def _log_trade(self, trade: TradeEvent) -> None:
+    def _log_trade(self, entry: "TradeLogEntry") -> None:
         if not hasattr(self, "debug_logs"):
             return
-        entry: Dict[str, Any] = {
-            "kind": "trade",
-            "t0": trade.t0,
-            "price": trade.price,
-            "action": trade.action,
-            "qty": trade.qty,
-            "pnl": trade.pnl,
-            "reason": trade.reason,
-        }
-        if trade.meta:
-            entry.update(trade.meta)
         self.debug_logs.append(entry)
 
     def logs(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        entries = list(self.debug_logs)
-        if limit is not None:
-            return entries[-limit:]
-        return entries
+        if limit is not None and limit > 0:
+            entries = list(islice(reversed(self.debug_logs), limit))
+            entries.reverse()
+        else:
+            entries = list(self.debug_logs)
+            if limit is not None:
+                entries = entries[-limit:]
+        return [e.as_dict() if isinstance(e, TradeLogEntry) else e for e in entries]
 
     def on_candle(self, row: pd.Series, signal: int) -> None:
         price = float(row["close"])
@@ -340,7 +1021,7 @@ class TradingSimulator:
                     trade_pnl = self.current_equity(price) - (self._open_trade_equity or self.current_equity(price))
                     reason_label = risk_event or "signal_flip"
                     exit_reason = f"exit_short_{reason_label}"
-                    context_str, context_meta = self._build_trade_context(
+                    context = self._build_trade_context(
                         reason=exit_reason,
                         signal=signal,
                         row=row,
@@ -351,16 +1032,15 @@ class TradingSimulator:
                         risk_event=reason_label,
                         forced_signal=forced_signal,
                     )
-                    context_meta["pnl"] = trade_pnl
+                    context.pnl = trade_pnl
                     self._record_trade(
                         t0,
                         price,
                         action,
                         qty,
                         pnl=trade_pnl,
-                        context=context_str,
+                        context=context,
                         reason=exit_reason,
-                        meta=context_meta,
                     )
                     risk_event_trigger = reason_label
                     risk_event = None
@@ -378,7 +1058,7 @@ class TradingSimulator:
                     self.avg_entry_price = price
                     action = "buy"
                     entry_reason = "enter_long_forced" if forced_signal is not None else "enter_long_signal"
-                    context_str, context_meta = self._build_trade_context(
+                    context = self._build_trade_context(
                         reason=entry_reason,
                         signal=signal,
                         row=row,
@@ -389,16 +1069,15 @@ class TradingSimulator:
                         risk_event=None,
                         forced_signal=forced_signal,
                     )
-                    context_meta["pnl"] = 0.0
+                    context.pnl = 0.0
                     self._record_trade(
                         t0,
                         price,
                         action,
                         qty,
                         pnl=0.0,
-                        context=context_str,
+                        context=context,
                         reason=entry_reason,
-                        meta=context_meta,
                     )
                     if risk_event_trigger is None:
                         risk_event_trigger = entry_reason
@@ -419,7 +1098,7 @@ class TradingSimulator:
                 trade_pnl = self.current_equity(price) - (self._open_trade_equity or self.current_equity(price))
                 reason_label = risk_event or "signal_flip"
                 exit_reason = f"exit_long_{reason_label}"
-                context_str, context_meta = self._build_trade_context(
+                context = self._build_trade_context(
                     reason=exit_reason,
                     signal=signal,
                     row=row,
@@ -430,16 +1109,15 @@ class TradingSimulator:
                     risk_event=reason_label,
                     forced_signal=forced_signal,
                 )
-                context_meta["pnl"] = trade_pnl
+                context.pnl = trade_pnl
                 self._record_trade(
                     t0,
                     price,
                     action,
                     qty,
                     pnl=trade_pnl,
-                    context=context_str,
+                    context=context,
                     reason=exit_reason,
-                    meta=context_meta,
                 )
                 risk_event_trigger = reason_label
                 risk_event = None
@@ -456,7 +1134,7 @@ class TradingSimulator:
                     self.avg_entry_price = price
                     action = "short"
                     entry_reason = "enter_short_forced" if forced_signal is not None else "enter_short_signal"
-                    context_str, context_meta = self._build_trade_context(
+                    context = self._build_trade_context(
                         reason=entry_reason,
                         signal=signal,
                         row=row,
@@ -467,16 +1145,15 @@ class TradingSimulator:
                         risk_event=None,
                         forced_signal=forced_signal,
                     )
-                    context_meta["pnl"] = 0.0
+                    context.pnl = 0.0
                     self._record_trade(
                         t0,
                         price,
                         action,
                         qty,
                         pnl=0.0,
-                        context=context_str,
+                        context=context,
                         reason=entry_reason,
-                        meta=context_meta,
                     )
                     if risk_event_trigger is None:
                         risk_event_trigger = entry_reason
@@ -496,8 +1173,13 @@ class TradingSimulator:
             drawdown = (self._equity_peak - equity) / self._equity_peak
         if drawdown > self._max_drawdown:
             self._max_drawdown = drawdown
+        if self._tick_exit is not None:
+            # an exit taken between candles by on_tick shows on this candle's history row
+            if action == "hold":
+                action, risk_event_trigger = self._tick_exit
+            self._tick_exit = None
 
-        self.history.append(EquityPoint(
+        self.history.append(
             t0=str(t0),
             price=price,
             signal=int(signal),
@@ -510,8 +1192,336 @@ class TradingSimulator:
             drawdown=drawdown,
             risk_event=risk_event_trigger,
             position_age=self.position_age,
-        ))
+        )
+        self._last_price = price
+
+    def on_tick(self, price: float, t0: Any = None) -> Optional[str]:
+        """
+        Check take profit, stop loss and trailing stop against one live trade and exit at
+        its price as soon as one is hit; returns the risk label of the exit, if any.
+
+        O(1) and flat-position calls return at once. Tick prices extend the trailing
+        high/low used by on_candle. No history row is written here: the exit appears in
+        the trades and logs immediately and on the next candle's history row (action and
+        risk_event), which then carries the account state. max_holding_period stays
+        candle-based.
+        """
+        if self.position == 0 or self.avg_entry_price in (None, 0.0) or not price > 0:
+            return None
+        entry = self.avg_entry_price
+        label: Optional[str] = None
+        if self.position > 0:
+            self._entry_high = price if self._entry_high is None else max(self._entry_high, price)
+            ret = (price - entry) / entry
+            if self.take_profit_pct and ret >= self.take_profit_pct:
+                label = "take_profit"
+            elif self.stop_loss_pct and self.stop_loss_pct > 0 and ret <= -self.stop_loss_pct:
+                label = "stop_loss"
+            elif self.trailing_stop_pct and self._entry_high and price <= self._entry_high * (1 - self.trailing_stop_pct):
+                label = "trailing_stop"
+        else:
+            self._entry_low = price if self._entry_low is None else min(self._entry_low, price)
+            ret = (entry - price) / entry
+            if self.take_profit_pct and ret >= self.take_profit_pct:
+                label = "take_profit"
+            elif self.stop_loss_pct and self.stop_loss_pct > 0 and ret <= -self.stop_loss_pct:
+                label = "stop_loss"
+            elif self.trailing_stop_pct and self._entry_low and price >= self._entry_low * (1 + self.trailing_stop_pct):
+                label = "trailing_stop"
+        if label is None:
+            return None
+
+        # same cash/fee sequence as the closing branches of on_candle
+        prev_position = self.position
+        qty = abs(prev_position)
+        if prev_position > 0:
+            self.cash += qty * price
+            self._apply_fees(qty, price)
+            action, side, signal = "sell", "long", -1
+        else:
+            self._apply_fees(qty, price)
+            self.cash -= qty * price
+            action, side, signal = "buy_to_cover", "short", 1
+        self.position = 0.0
+        self.avg_entry_price = None
+        trade_pnl = self.current_equity(price) - (self._open_trade_equity or self.current_equity(price))
+        exit_reason = f"exit_{side}_{label}_tick"
+        context = self._build_trade_context(
+            reason=exit_reason,
+            signal=signal,
+            row={"close": price, "t0": t0},
+            price=price,
+            qty=qty,
+            position_before=prev_position,
+            position_after=self.position,
+            risk_event=label,
+            forced_signal=signal,
+        )
+        context.pnl = trade_pnl
+        self._record_trade(t0, price, action, qty, pnl=trade_pnl, context=context, reason=exit_reason)
+        self.position_age = 0
+        self._entry_high = None
+        self._entry_low = None
+        self._open_trade_equity = None
         self._last_price = price
+        self._tick_exit = (action, label)
+        return label
+
+    def run_batch(
+        self,
+        close: Any,
+        signal: Any,
+        micro_score: Any = None,
+        mom_signal: Any = None,
+        t0: Any = None,
+        record_history: bool = True,
+    ) -> Tuple[Optional[pd.DataFrame], pd.DataFrame]:
+        """
+        Replay whole arrays through the same logic as on_candle, without pd.Series rows.
+
+        Produces the same numbers as calling on_candle row by row (same float operations
+        in the same order) and leaves the simulator in the same final state, trade_stats
+        included. Trades are appended to self.trades like on_candle does (t0 as str, no
+        context/meta), so summary() counts them; both history and trades are also
+        returned as DataFrames with t0 values kept as given. Per-candle history is not
+        appended to self.history and nothing is written to debug_logs. With
+        record_history=False no per-candle history is kept and None is returned in its place.
+        """
+        closes = np.asarray(close, dtype=float).tolist()
+        n = len(closes)
+        sigs = np.asarray(signal).astype(int).tolist()
+        micros = np.asarray(micro_score, dtype=float).tolist() if micro_score is not None else [0.0] * n
+        moms = np.asarray(mom_signal, dtype=float).tolist() if mom_signal is not None else [0.0] * n
+        assert len(sigs) == len(micros) == len(moms) == n, "arrays must have the same length"
+
+        initial_cash = self.initial_cash
+        allow_short = self.allow_short
+        fee_on = self.fee_bps > 0
+        fee_rate = self.fee_bps * 1e-4
+        fee_factor = 1 + (self.fee_bps * 1e-4) if self.fee_bps > 0 else 1.0
+        leverage = max(1.0, float(self.max_leverage) if self.max_leverage is not None else 1.0)
+        take_profit = self.take_profit_pct
+        stop_loss = self.stop_loss_pct if self.stop_loss_pct and self.stop_loss_pct > 0 else None
+        trailing = self.trailing_stop_pct
+        max_hold = self.max_holding_period
+        base = max(0.1, min(1.0, self.position_scale))
+
+        cash = self.cash
+        pos = self.position
+        avg = self.avg_entry_price
+        age = self.position_age
+        peak = self._equity_peak
+        max_dd = self._max_drawdown
+        high = self._entry_high
+        low = self._entry_low
+        open_eq = self._open_trade_equity
+        last_price = self._last_price
+
+        h_idx: List[int] = []
+        h_sig: List[int] = []
+        h_pos: List[float] = []
+        h_cash: List[float] = []
+        h_eq: List[float] = []
+        h_unreal: List[float] = []
+        h_real: List[float] = []
+        h_action: List[str] = []
+        h_dd: List[float] = []
+        h_risk: List[Optional[str]] = []
+        h_age: List[int] = []
+        trades: List[tuple] = []
+
+        for i in range(n):
+            price = closes[i]
+            if price != price or price <= 0:
+                continue
+            sig = sigs[i]
+            action = "hold"
+            risk_event: Optional[str] = None
+            trigger: Optional[str] = None
+            forced: Optional[int] = None
+
+            if pos != 0:
+                age += 1
+            else:
+                age = 0
+
+            if pos > 0:
+                high = price if high is None else max(high, price)
+            elif pos < 0:
+                low = price if low is None else min(low, price)
+            else:
+                high = None
+                low = None
+
+            if pos != 0 and avg not in (None, 0.0):
+                if pos > 0:
+                    ret = (price - avg) / avg
+                    if take_profit and ret >= take_profit:
+                        forced, risk_event = -1, "take_profit"
+                    elif stop_loss and ret <= -stop_loss:
+                        forced, risk_event = -1, "stop_loss"
+                    elif trailing and high and price <= high * (1 - trailing):
+                        forced, risk_event = -1, "trailing_stop"
+                else:
+                    ret = (avg - price) / avg
+                    if take_profit and ret >= take_profit:
+                        forced, risk_event = 1, "take_profit"
+                    elif stop_loss and ret <= -stop_loss:
+                        forced, risk_event = 1, "stop_loss"
+                    elif trailing and low and price >= low * (1 + trailing):
+                        forced, risk_event = 1, "trailing_stop"
+            if forced is None and max_hold and pos != 0 and age >= max_hold:
+                forced = -1 if pos > 0 else 1
+                risk_event = "max_hold"
+            if forced is not None:
+                sig = forced
+
+            if sig > 0:
+                if pos < 0:
+                    qty = abs(pos)
+                    if qty > 0:
+                        if fee_on:
+                            cash -= qty * price * fee_rate
+                        cash -= qty * price
+                        pos = 0.0
+                        action = "buy_to_cover"
+                        avg = None
+                        equity = cash + pos * price
+                        label = risk_event or "signal_flip"
+                        trades.append((i, price, action, qty, cash, equity,
+                                       equity - (open_eq or equity), f"exit_short_{label}"))
+                        trigger = label
+                        risk_event = None
+                        age = 0
+                        low = None
+                        open_eq = None
+                if pos == 0 and cash > 0:
+                    qty = self._batch_qty(cash, pos, price, leverage, fee_factor, base, micros[i], moms[i])
+                    if qty > 0:
+                        if fee_on:
+                            cash -= qty * price * fee_rate
+                        cash -= qty * price
+                        pos += qty
+                        avg = price
+                        action = "buy"
+                        reason = "enter_long_forced" if forced is not None else "enter_long_signal"
+                        trades.append((i, price, action, qty, cash, cash + pos * price, 0.0, reason))
+                        if trigger is None:
+                            trigger = reason
+                        age = 0
+                        high = price
+                        open_eq = cash + pos * price
+            elif sig < 0:
+                if pos > 0:
+                    qty = pos
+                    cash += qty * price
+                    if fee_on:
+                        cash -= qty * price * fee_rate
+                    pos = 0.0
+                    avg = None
+                    action = "sell"
+                    equity = cash + pos * price
+                    label = risk_event or "signal_flip"
+                    trades.append((i, price, action, qty, cash, equity,
+                                   equity - (open_eq or equity), f"exit_long_{label}"))
+                    trigger = label
+                    risk_event = None
+                    age = 0
+                    high = None
+                    open_eq = None
+                elif allow_short and cash > 0:
+                    qty = self._batch_qty(cash, pos, price, leverage, fee_factor, base, micros[i], moms[i])
+                    if qty > 0:
+                        if fee_on:
+                            cash -= qty * price * fee_rate
+                        pos -= qty
+                        cash += qty * price
+                        avg = price
+                        action = "short"
+                        reason = "enter_short_forced" if forced is not None else "enter_short_signal"
+                        trades.append((i, price, action, qty, cash, cash + pos * price, 0.0, reason))
+                        if trigger is None:
+                            trigger = reason
+                        age = 0
+                        low = price
+                        open_eq = cash + pos * price
+
+            equity = cash + pos * price
+            unrealized = (price - avg) * pos if pos != 0 and avg is not None else 0.0
+            if equity > peak:
+                peak = equity
+            drawdown = (peak - equity) / peak if peak > 0 else 0.0
+            if drawdown > max_dd:
+                max_dd = drawdown
+            last_price = price
+            if not record_history:
+                continue
+            h_idx.append(i)
+            h_sig.append(int(sig))
+            h_pos.append(pos)
+            h_cash.append(cash)
+            h_eq.append(equity)
+            h_unreal.append(unrealized)
+            h_real.append(equity - unrealized - initial_cash)
+            h_action.append(action)
+            h_dd.append(drawdown)
+            h_risk.append(trigger)
+            h_age.append(age)
+
+        self.cash = cash
+        self.position = pos
+        self.avg_entry_price = avg
+        self.position_age = age
+        self._equity_peak = peak
+        self._max_drawdown = max_dd
+        self._entry_high = high
+        self._entry_low = low
+        self._open_trade_equity = open_eq
+        self._last_price = last_price
+
+        times = np.asarray(t0, dtype=object) if t0 is not None else np.arange(n)
+        for i, price, action, qty, cash_after, equity, pnl, reason in trades:
+            self.trades.append(t0=str(times[i]), price=price, action=action, qty=qty, cash=cash_after,
+                               equity=equity, pnl=pnl, context=None, reason=reason, meta=None)
+            if action in CLOSING_ACTIONS:
+                self.trade_stats.add(pnl)
+        history = None if not record_history else pd.DataFrame({
+            "t0": times[h_idx] if h_idx else times[:0],
+            "price": np.asarray(closes, dtype=float)[h_idx] if h_idx else np.zeros(0),
+            "signal": h_sig,
+            "position": h_pos,
+            "cash": h_cash,
+            "equity": h_eq,
+            "unrealized": h_unreal,
+            "realized": h_real,
+            "action": h_action,
+            "drawdown": h_dd,
+            "risk_event": h_risk,
+            "position_age": h_age,
+        })
+        trades_df = pd.DataFrame(trades, columns=["t0", "price", "action", "qty", "cash", "equity", "pnl", "reason"])
+        trades_df["t0"] = times[trades_df["t0"].to_numpy(dtype=int)]
+        return history, trades_df
+
+    @staticmethod
+    def _batch_qty(
+        cash: float,
+        position: float,
+        price: float,
+        leverage: float,
+        fee_factor: float,
+        base: float,
+        micro_score: float,
+        mom_signal: float,
+    ) -> float:
+        """_trade_capacity * _position_scale_from_row on plain floats (run_batch)."""
+        max_notional = max(cash + position * price, 0.0) * leverage
+        remaining = max(0.0, max_notional - abs(position) * price)
+        if remaining <= 0.0:
+            return 0.0
+        raw = abs(micro_score) * 0.7 + abs(mom_signal) * 0.3
+        scale = max(base * 0.5, min(1.0, base * (0.4 + raw)))
+        return remaining / (price * fee_factor) * scale
 
     def _record_trade(
         self,
@@ -520,12 +1530,13 @@ class TradingSimulator:
         action: str,
         qty: float,
         pnl: float,
-        context: Optional[str] = None,
+        context: Optional[TradeContext] = None,
         reason: Optional[str] = None,
-        meta: Optional[Dict[str, Any]] = None,
     ) -> None:
-        trade = TradeEvent(
-            t0=str(t0),
+        t0 = str(t0)
+        # context and meta hold the raw TradeContext until a reader renders them
+        self.trades.append(
+            t0=t0,
             price=price,
             action=action,
             qty=qty,
@@ -534,25 +1545,22 @@ class TradingSimulator:
             pnl=pnl,
             context=context,
             reason=reason,
-            meta=meta,
+            meta=context,
         )
-        self.trades.append(trade)
-        self._log_trade(trade)
-
-    def history_df(self) -> pd.DataFrame:
-        if not self.history:
-            return pd.DataFrame(columns=[
-                "t0", "price", "signal", "position", "cash", "equity",
-                "unrealized", "realized", "action", "drawdown", "risk_event", "position_age"
-            ])
-        return pd.DataFrame([h.__dict__ for h in self.history])
-
-    def trades_df(self) -> pd.DataFrame:
-        if not self.trades:
-            return pd.DataFrame(columns=[
-                "t0", "price", "action", "qty", "cash", "equity", "pnl", "context", "reason", "meta"
-            ])
-        return pd.DataFrame([t.__dict__ for t in self.trades])
+        if action in CLOSING_ACTIONS:
+            self.trade_stats.add(pnl)
+        self._log_trade(TradeLogEntry(t0, price, action, qty, pnl, reason, context))
+
+    def history_df(self, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        Equity history (the newest ``limit`` points if given). In-memory rows are
+        read-only views cached until the next candle; spilled rows are read from disk.
+        """
+        return self.history.frame(limit)
+
+    def trades_df(self, limit: Optional[int] = None) -> pd.DataFrame:
+        """Trades (the newest ``limit`` if given), read through memory and disk like history_df."""
+        return self.trades.frame(limit)
 
     def summary(self) -> dict:
         price = self._last_price
@@ -568,16 +1576,6 @@ class TradingSimulator:
         pct_realized = (realized / self.initial_cash) * 100 if self.initial_cash else 0.0
         pct_unrealized = (unrealized / self.initial_cash) * 100 if self.initial_cash else 0.0
         max_drawdown_pct = self._max_drawdown * 100.0
-        trades_df = self.trades_df()
-        closing_trades = trades_df[trades_df["action"].isin(["sell", "buy_to_cover"])] if not trades_df.empty else pd.DataFrame()
-        hit_last_20 = None
-        pnl_last_20 = None
-        avg_trade_pnl = None
-        if not closing_trades.empty:
-            recent = closing_trades.tail(20)
-            hit_last_20 = float((recent["pnl"] > 0).mean()) if len(recent) else None
-            pnl_last_20 = float(recent["pnl"].sum())
-            avg_trade_pnl = float(closing_trades["pnl"].mean())
         recent_logs = self.logs(20)
         return {
             "initial_cash": self.initial_cash,
@@ -597,9 +1595,7 @@ class TradingSimulator:
             "trailing_stop_pct": self.trailing_stop_pct,
             "max_holding_period": self.max_holding_period,
             "max_leverage": self.max_leverage,
-            "hit_rate_last_20": hit_last_20,
-            "pnl_last_20": pnl_last_20,
-            "avg_trade_pnl": avg_trade_pnl,
-            "last_trade_reason": self.trades[-1].reason if self.trades else None,
+            **self.trade_stats.as_dict(),
+            "last_trade_reason": self.trades.last("reason"),
             "recent_logs": recent_logs,
         }
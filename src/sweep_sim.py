@@ -0,0 +1,183 @@
+# src/sweep_sim.py
+"""
+Balayage des réglages de risque du TradingSimulator.
+Le jeu de données (close, signal, micro_score, mom_signal) est copié une seule fois
+en mémoire partagée; les workers s'y attachent sans copie et rejouent chaque
+configuration avec TradingSimulator.run_batch (sans historique par bougie). Sortie:
+une table classée, une ligne par configuration, avec les métriques de summary().
+
+Espace de recherche (--space, répétable):
+  stop_loss_pct=0.005,0.01,0.02    valeurs discrètes (grille ou tirage)
+  take_profit_pct=0.005:0.05       intervalle continu (tirage aléatoire uniquement)
+  trailing_stop_pct=none,0.01      'none' désactive le réglage
+Sans --n_random: produit cartésien des valeurs discrètes; avec --n_random N: N tirages.
+
+Exécution:
+  python src/sweep_sim.py --candles data/btc_usd_60s_sig_candle.csv --micro data/btc_usd_60s_sig_micro.csv \
+      --space stop_loss_pct=0.005,0.01,0.02 --space take_profit_pct=0.01,0.02,0.04 \
+      --space max_holding_period=30,120,none --out data/btc_usd_60s_sweep.csv --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from colcache import read_csv_cached, write_csv
+from shared_arrays import SHARED, attach, share
+from simulator import TradingSimulator
+
+PARAMS = ("stop_loss_pct", "take_profit_pct", "trailing_stop_pct", "max_holding_period",
+          "position_scale", "max_leverage")
+INT_PARAMS = ("max_holding_period",)
+ARRAYS = ("close", "signal", "micro_score", "mom_signal")
+METRICS = ("equity", "pnl", "pnl_pct", "max_drawdown_pct", "n_trades", "n_closed_trades", "win_rate",
+           "avg_trade_pnl", "profit_factor", "max_loss_streak", "position")
+
+def combine_signals(sig_candle: np.ndarray, sig_micro: np.ndarray) -> np.ndarray:
+    """Même règle que le serveur: le micro complète le signal bougie, l'emporte si le bougie est nul."""
+    mix = sig_candle + sig_micro
+    mixed = np.where(mix > 0, 1, np.where(mix < 0, -1, sig_candle))
+    return np.where(sig_micro == 0, sig_candle, np.where(sig_candle == 0, sig_micro, mixed))
+
+def load_dataset(candles_csv: str, micro_csv: Optional[str] = None,
+                 signal_col: str = "signal_candle") -> Dict[str, np.ndarray]:
+    """Bougies + signaux (sortie de patterns_candles) et, si fourni, signaux micro fusionnés sur t0."""
+    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
+    df = read_csv_cached(p)
+    for c in ("t0", "close", signal_col):
+        assert c in df.columns, f"Colonne manquante: {c}"
+    sig = pd.to_numeric(df[signal_col], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+    mom = (pd.to_numeric(df["mom_signal"], errors="coerce").to_numpy(dtype=float)
+           if "mom_signal" in df.columns else np.zeros(len(df)))
+    micro_score = np.zeros(len(df))
+    if micro_csv:
+        assert Path(micro_csv).exists(), f"Introuvable: {micro_csv}"
+        m = read_csv_cached(micro_csv)
+        m = df[["t0"]].merge(m[["t0"] + [c for c in ("signal_micro", "score_micro") if c in m.columns]],
+                             on="t0", how="left")
+        sig_micro = pd.to_numeric(m["signal_micro"], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+        sig = combine_signals(sig, sig_micro)
+        if "score_micro" in m.columns:
+            micro_score = pd.to_numeric(m["score_micro"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    return {
+        "close": pd.to_numeric(df["close"], errors="coerce").to_numpy(dtype=float),
+        "signal": sig.astype(np.int64),
+        "micro_score": micro_score,
+        "mom_signal": mom,
+    }
+
+def grid_space(space: Dict[str, list]) -> List[dict]:
+    for name, values in space.items():
+        assert isinstance(values, (list, tuple)) and not _is_range(values), \
+            f"{name}: intervalle continu interdit en grille (utiliser n_random)"
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in product(*(space[n] for n in names))]
+
+def random_space(space: Dict[str, object], n: int, seed: Optional[int] = 0) -> List[dict]:
+    """n tirages: choix uniforme parmi les valeurs discrètes, uniforme dans les intervalles (lo, hi)."""
+    rng = np.random.default_rng(seed)
+    cols = {}
+    for name, values in space.items():
+        if _is_range(values):
+            lo, hi = values
+            cols[name] = (rng.integers(int(lo), int(hi) + 1, n).tolist() if name in INT_PARAMS
+                          else rng.uniform(lo, hi, n).tolist())
+        else:
+            cols[name] = [values[j] for j in rng.integers(0, len(values), n)]
+    return [{name: cols[name][i] for name in space} for i in range(n)]
+
+def _is_range(values) -> bool:
+    return isinstance(values, tuple) and len(values) == 2
+
+def _run_one(data: Dict[str, np.ndarray], cfg: dict, base: dict) -> dict:
+    sim = TradingSimulator(**{**base, **cfg})
+    sim.run_batch(data["close"], data["signal"], data["micro_score"], data["mom_signal"],
+                   record_history=False)
+    summary = sim.summary()
+    row = {name: getattr(sim, name) for name in PARAMS}
+    row.update({m: summary.get(m) for m in METRICS})
+    return row
+
+def _run_chunk(configs: List[dict], base: dict, data: Optional[Dict[str, np.ndarray]] = None) -> List[dict]:
+    data = SHARED if data is None else data
+    return [_run_one(data, cfg, base) for cfg in configs]
+
+def sweep(data: Dict[str, np.ndarray], configs: List[dict], base: Optional[dict] = None,
+          workers: int = 1, rank_by: str = "pnl_pct", chunk: int = 8) -> pd.DataFrame:
+    """
+    Rejoue chaque configuration (réglages de PARAMS, le reste vient de base) et retourne
+    la table classée par rank_by décroissant (colonne rank, 1 = meilleur).
+    """
+    assert configs, "Aucune configuration"
+    assert rank_by in METRICS, f"rank_by inconnu: {rank_by}"
+    for cfg in configs:
+        unknown = set(cfg).difference(PARAMS)
+        assert not unknown, f"Réglages inconnus: {unknown}"
+    base = dict(base or {})
+    batches = [configs[i:i + chunk] for i in range(0, len(configs), max(1, chunk))]
+    if workers <= 1 or len(batches) == 1:
+        rows = [r for b in batches for r in _run_chunk(b, base, data)]
+    else:
+        with share(data, ARRAYS) as spec, \
+                ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(spec,)) as pool:
+            rows = [r for part in pool.map(_run_chunk, batches, [base] * len(batches)) for r in part]
+    res = pd.DataFrame(rows)
+    res = res.sort_values(rank_by, ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+    res.insert(0, "rank", np.arange(1, len(res) + 1))
+    return res
+
+def _parse_value(name: str, text: str):
+    if text.strip().lower() == "none":
+        return None
+    return int(text) if name in INT_PARAMS else float(text)
+
+def parse_space(specs: List[str]) -> Dict[str, object]:
+    """['stop_loss_pct=0.01,0.02', 'take_profit_pct=0.01:0.05'] -> {nom: [valeurs] | (lo, hi)}."""
+    space: Dict[str, object] = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        assert name in PARAMS, f"Réglage inconnu: {name}"
+        if ":" in values:
+            lo, hi = values.split(":")
+            space[name] = (_parse_value(name, lo), _parse_value(name, hi))
+        else:
+            space[name] = [_parse_value(name, v) for v in values.split(",") if v.strip()]
+    return space
+
+def _args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--candles", required=True, help="CSV bougies + signaux (sortie de patterns_candles)")
+    ap.add_argument("--micro", default=None, help="CSV signaux micro (optionnel, combiné comme le serveur)")
+    ap.add_argument("--signal_col", default="signal_candle")
+    ap.add_argument("--space", action="append", required=True, help="nom=v1,v2,... ou nom=lo:hi")
+    ap.add_argument("--n_random", type=int, default=0, help="Nombre de tirages (0: grille)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--initial_cash", type=float, default=100.0)
+    ap.add_argument("--allow_short", type=int, default=0)
+    ap.add_argument("--fee_bps", type=float, default=5.0)
+    ap.add_argument("--rank_by", default="pnl_pct", choices=METRICS)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--out", required=True)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    space = parse_space(a.space)
+    configs = random_space(space, a.n_random, a.seed) if a.n_random > 0 else grid_space(space)
+    data = load_dataset(a.candles, a.micro, a.signal_col)
+    base = {"initial_cash": a.initial_cash, "allow_short": bool(a.allow_short), "fee_bps": a.fee_bps}
+    res = sweep(data, configs, base, a.workers, a.rank_by)
+    write_csv(res, a.out)
+    print(f"[sweep_sim] {len(configs)} configurations x {len(data['close'])} bougies -> {a.out}")
+    print(res.head(20).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -11,19 +11,22 @@ import argparse
 import pandas as pd
 import numpy as np
 
-def make_labels(candles_csv: str, out_csv: str, horizon: int, eps: float) -> None:
+from colcache import read_csv_cached, write_csv
+
+def labels_df(df: pd.DataFrame, horizon: int, eps: float) -> pd.DataFrame:
     assert horizon >= 1
     assert eps >= 0.0
-    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
-    df = pd.read_csv(p)
     for c in ("t0","open","high","low","close"):
         assert c in df.columns, f"Colonne manquante: {c}"
-    df["fwd_close"] = df["close"].shift(-horizon)
-    ret = (df["fwd_close"] - df["close"]) / df["close"]
-    y = np.where(ret > eps, 1, np.where(ret < -eps, -1, 0))
-    df["y"] = y
-    df.drop(columns=["fwd_close"], inplace=True)
-    df.to_csv(out_csv, index=False)
+    out = df.copy()
+    fwd_close = out["close"].shift(-horizon)
+    ret = (fwd_close - out["close"]) / out["close"]
+    out["y"] = np.where(ret > eps, 1, np.where(ret < -eps, -1, 0))
+    return out
+
+def make_labels(candles_csv: str, out_csv: str, horizon: int, eps: float) -> None:
+    p = Path(candles_csv); assert p.exists(), f"Introuvable: {p}"
+    write_csv(labels_df(read_csv_cached(p), horizon, eps), out_csv)
 
 def _args():
     ap = argparse.ArgumentParser()
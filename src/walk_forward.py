@@ -0,0 +1,222 @@
+# src/walk_forward.py
+"""
+Walk-forward des signaux micro.
+La chronologie est découpée en fenêtres glissantes train/test. Sur chaque train, on
+choisit (tau, max_spread_bp) dans une grille en maximisant une métrique du backtest;
+ces paramètres sont ensuite évalués sur la fenêtre test qui suit.
+Les bougies et les composantes du score micro (signals_micro.micro_parts) sont alignées
+une seule fois. Un fold ne fait que remplacer les depth_vol manquants par leur médiane
+sur son train (pas de fuite du test vers le train), seuiller le score et backtester des
+tranches de tableaux. Les folds tournent en parallèle sur un pool de processus qui reçoit
+bougies et composantes en lecture seule une fois par processus.
+
+Exécution:
+  python src/walk_forward.py --candles data/btc_usd_5s_lbl.csv --micro data/btc_usd_micro_5s.csv \
+      --out data/btc_usd_5s_wf.csv --train 6h --test 2h --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest import AlignedBars, _load_csv, align_bars, bt_grid
+from colcache import write_csv
+from signals_micro import combine_parts, micro_parts, vol_median
+
+METRICS = ("sharpe_like", "avg_ret", "hit_rate")
+
+@dataclass
+class MicroGrid:
+    # composantes de micro_parts et spread_bp alignés sur les bougies (NaN sans micro)
+    parts: dict
+    spread_bp: np.ndarray
+    # depth_vol des lignes micro triées par t0 (ns), pour les médianes de train; None hors mode enrichi
+    vol_t: Optional[np.ndarray] = None
+    vol: Optional[np.ndarray] = None
+
+_SHARED: Optional[AlignedBars] = None  # bougies du processus worker
+_MICRO: Optional[MicroGrid] = None
+
+def _init_worker(shared: AlignedBars, micro: MicroGrid) -> None:
+    global _SHARED, _MICRO
+    _SHARED, _MICRO = shared, micro
+
+def align_micro(bars: AlignedBars, df_m: pd.DataFrame, use_ofi: int = 0) -> MicroGrid:
+    """Composantes du score micro calculées une fois et alignées sur la grille des bougies."""
+    parts, spread_bp, enriched = micro_parts(df_m, use_ofi)
+    s = pd.DataFrame({"t0": df_m["t0"], "spread_bp": spread_bp, **parts})
+    s = pd.DataFrame({"t0": bars.t0}).merge(s, on="t0", how="left")
+    grid = MicroGrid({k: s[k].to_numpy(dtype=float) for k in parts}, s["spread_bp"].to_numpy(dtype=float))
+    if enriched:
+        t = df_m["t0"].dt.as_unit("ns").astype("int64").to_numpy()
+        order = np.argsort(t, kind="stable")
+        grid.vol_t, grid.vol = t[order], parts["depth_vol"][order]
+    return grid
+
+def fold_score(bars: AlignedBars, micro: MicroGrid, bounds: tuple) -> tuple:
+    """
+    (score, spread_bp) des lignes [a, c) du fold. Les depth_vol manquants sont remplacés
+    par leur médiane sur le train du fold (la médiane globale ferait voir au train des
+    statistiques de sa période de test).
+    """
+    a, b, c = bounds
+    vol_fill = None
+    if micro.vol is not None:
+        lo = np.searchsorted(micro.vol_t, bars.t0.iloc[a].value, side="left")
+        hi = np.searchsorted(micro.vol_t, bars.t0.iloc[b - 1].value, side="right")
+        vol_fill = vol_median(micro.vol[lo:hi])
+    parts = {k: v[a:c] for k, v in micro.parts.items()}
+    return combine_parts(parts, vol_fill), micro.spread_bp[a:c]
+
+def threshold(score: np.ndarray, spread_bp: np.ndarray, tau: float, max_spread_bp: float,
+              invert: int = 0) -> np.ndarray:
+    """Mêmes règles que signals_micro.build_df, sur des tableaux."""
+    ok = spread_bp < max_spread_bp
+    sig = np.where(ok & (score > tau), 1, np.where(ok & (score < -tau), -1, 0))
+    return -sig if invert else sig
+
+def fold_bounds(t0: pd.Series, train, test, step=None) -> list:
+    """[(a, b, c)]: lignes [a, b) pour le train et [b, c) pour le test de chaque fold."""
+    train, test = pd.Timedelta(train), pd.Timedelta(test)
+    step = pd.Timedelta(step) if step is not None else test
+    assert train > pd.Timedelta(0) and test > pd.Timedelta(0) and step > pd.Timedelta(0), \
+        "train, test et step doivent etre > 0"
+    t = t0.dt.as_unit("ns").astype("int64").to_numpy()
+    if not len(t):
+        return []
+    out = []
+    start = int(t[0])
+    while start + train.value <= t[-1]:
+        a, b, c = np.searchsorted(t, [start, start + train.value, start + train.value + test.value])
+        if b > a and c > b:
+            out.append((int(a), int(b), int(c)))
+        start += step.value
+    return out
+
+def fold_scores(bars: AlignedBars, df_m: pd.DataFrame, bounds: list, use_ofi: int = 0) -> list:
+    """[(score, spread_bp)] alignés sur les lignes [a, c) de chaque fold (voir fold_score)."""
+    micro = align_micro(bars, df_m, use_ofi)
+    return [fold_score(bars, micro, bd) for bd in bounds]
+
+def _slice(bars: AlignedBars, a: int, b: int) -> AlignedBars:
+    return AlignedBars(t0=bars.t0.iloc[a:b].reset_index(drop=True), open=bars.open[a:b],
+                       close=bars.close[a:b], half_spread=bars.half_spread[a:b])
+
+def _eval(bars, sig, horizon, signal_lag, fees_bp) -> dict:
+    st = bt_grid(bars, sig, [horizon], [signal_lag], fees_bp).iloc[0].to_dict()
+    st["n_trades"] = int(st["n_trades"])
+    return st
+
+def _fold(k: int, bounds: tuple, grid: list, horizon: int, signal_lag: int, fees_bp: float,
+          metric: str, min_trades: int, invert: int, shared: Optional[AlignedBars] = None,
+          micro: Optional[MicroGrid] = None) -> tuple:
+    # (ligne du fold, signal sur le test)
+    bars = _SHARED if shared is None else shared
+    score, spread_bp = fold_score(bars, _MICRO if micro is None else micro, bounds)
+    a, b, c = bounds
+    n_train = b - a
+    train = _slice(bars, a, b)
+    best, best_val, best_n = None, -np.inf, 0
+    for tau, msb in grid:
+        st = _eval(train, threshold(score[:n_train], spread_bp[:n_train], tau, msb, invert),
+                   horizon, signal_lag, fees_bp)
+        val = st[metric]
+        if st["n_trades"] >= min_trades and val == val and val > best_val:
+            best, best_val, best_n = (tau, msb), val, int(st["n_trades"])
+
+    row = {"fold": k, "train_start": bars.t0.iloc[a], "train_end": bars.t0.iloc[b - 1],
+           "test_start": bars.t0.iloc[b], "test_end": bars.t0.iloc[c - 1],
+           "tau": np.nan, "max_spread_bp": np.nan,
+           f"train_{metric}": best_val if best else np.nan, "train_n_trades": best_n}
+    if best:
+        row["tau"], row["max_spread_bp"] = best
+        sig = threshold(score[n_train:], spread_bp[n_train:], best[0], best[1], invert)
+    else:
+        sig = np.zeros(c - b, dtype=np.int64)  # aucun paramètre retenu: pas de position
+    test = _eval(_slice(bars, b, c), sig, horizon, signal_lag, fees_bp)
+    row.update({k_: test[k_] for k_ in ("n_trades", "hit_rate", "avg_ret", "sharpe_like", "dir_hit_rate")})
+    return row, sig
+
+def walk_forward(bars: AlignedBars, df_m: pd.DataFrame, train, test, step=None,
+                 taus=(0.2,), max_spreads=(5.0,), horizon: int = 3, signal_lag: int = 1,
+                 fees_bp: float = 0.5, metric: str = "sharpe_like", min_trades: int = 20,
+                 invert: int = 0, use_ofi: int = 0, workers: int = 1) -> tuple:
+    """
+    Retourne (une ligne par fold, stats hors échantillon). Les stats globales backtestent
+    le signal recollé des fenêtres test (0 hors test) sur toute la série.
+    """
+    assert metric in METRICS, f"metric inconnue: {metric}"
+    bounds = fold_bounds(bars.t0, train, test, step)
+    assert bounds, "Aucun fold: série plus courte que la fenêtre train"
+    micro = align_micro(bars, df_m, use_ofi)
+    grid = list(product(taus, max_spreads))
+    args = (grid, horizon, signal_lag, fees_bp, metric, min_trades, invert)
+    if workers <= 1 or len(bounds) == 1:
+        res = [_fold(k, bd, *args, shared=bars, micro=micro) for k, bd in enumerate(bounds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(bars, micro)) as pool:
+            res = list(pool.map(_fold, range(len(bounds)), bounds, *([x] * len(bounds) for x in args)))
+    folds = pd.DataFrame([row for row, _ in res])
+
+    oos = np.zeros(len(bars.close), dtype=np.int64)
+    for (_, b, c), (_, sig) in zip(bounds, res):
+        oos[b:c] = sig
+    return folds, _eval(bars, oos, horizon, signal_lag, fees_bp)
+
+def run_walk_forward(candles_csv: str, micro_csv: str, out_csv: str, train, test, step=None,
+                     taus=(0.2,), max_spreads=(5.0,), horizon: int = 3, signal_lag: int = 1,
+                     fees_bp: float = 0.5, metric: str = "sharpe_like", min_trades: int = 20,
+                     invert: int = 0, use_ofi: int = 0, workers: int = 1) -> tuple:
+    assert Path(micro_csv).exists(), f"Introuvable: {micro_csv}"
+    df_m = _load_csv(micro_csv)
+    bars = align_bars(_load_csv(candles_csv), df_m)
+    folds, stats = walk_forward(bars, df_m, train, test, step, taus, max_spreads, horizon,
+                                signal_lag, fees_bp, metric, min_trades, invert, use_ofi, workers)
+    write_csv(folds, out_csv)
+    return folds, stats
+
+def _float_list(spec: str) -> list:
+    return [float(x) for x in spec.split(",") if x.strip()]
+
+def _args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--candles", required=True)
+    ap.add_argument("--micro", required=True)
+    ap.add_argument("--out", required=True, help="CSV des folds")
+    ap.add_argument("--train", default="6h", help="Durée train (Timedelta pandas)")
+    ap.add_argument("--test", default="2h", help="Durée test")
+    ap.add_argument("--step", default=None, help="Pas entre folds (défaut: --test)")
+    ap.add_argument("--taus", default="0.2,0.5,1,1.5,2,3")
+    ap.add_argument("--max_spreads", default="2,5,10")
+    ap.add_argument("--h", type=int, default=3)
+    ap.add_argument("--signal_lag", type=int, default=1)
+    ap.add_argument("--fees_bp", type=float, default=0.5)
+    ap.add_argument("--metric", default="sharpe_like", choices=METRICS)
+    ap.add_argument("--min_trades", type=int, default=20)
+    ap.add_argument("--invert", type=int, default=0)
+    ap.add_argument("--use_ofi", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=1)
+    return ap.parse_args()
+
+def main():
+    a = _args()
+    folds, stats = run_walk_forward(
+        a.candles, a.micro, a.out, a.train, a.test, a.step,
+        _float_list(a.taus), _float_list(a.max_spreads), a.h, a.signal_lag, a.fees_bp,
+        a.metric, a.min_trades, a.invert, a.use_ofi, a.workers,
+    )
+    print(folds.to_string(index=False))
+    print(f"[walk_forward] {len(folds)} folds -> {a.out}")
+    print({k: stats[k] for k in ("n_trades", "hit_rate", "avg_ret", "sharpe_like", "dir_hit_rate")})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# src/windows.py
+"""
+Fenêtres glissantes calculées fenêtre par fenêtre.
+Les rolling().mean()/.std() de pandas mettent à jour des accumulateurs depuis le début
+de la série: la valeur à t dépend (à l'ulp près) de tout l'historique. Ici chaque
+valeur ne dépend que des `window` points de sa fenêtre, ce qui permet de recalculer
+une fin de série avec `window - 1` lignes de contexte et d'obtenir les mêmes octets
+qu'un calcul complet (mode incrémental de run_all).
+Sémantique identique à pandas: NaN ignorés, min_periods, fenêtre constante -> moyenne
+exacte / écart-type nul, std avec ddof=1.
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+_BLOCK = 1 << 16  # lignes traitées par bloc (mémoire bornée à _BLOCK * window)
+
+def _windows(x: pd.Series, window: int):
+    assert window >= 1, "window doit etre >= 1"
+    v = pd.to_numeric(x, errors="coerce").to_numpy(dtype=np.float64)
+    padded = np.concatenate([np.full(window - 1, np.nan), v])
+    view = sliding_window_view(padded, window)
+    for i in range(0, len(v), _BLOCK):
+        w = view[i:i + _BLOCK]
+        valid = ~np.isnan(w)
+        n = valid.sum(axis=1)
+        filled = np.where(valid, w, 0.0)
+        hi = np.where(valid, w, -np.inf).max(axis=1)
+        lo = np.where(valid, w, np.inf).min(axis=1)
+        yield i, filled, valid, n, hi, lo
+
+def rolling_mean(x: pd.Series, window: int, min_periods: int = 1) -> pd.Series:
+    out = np.full(len(x), np.nan)
+    for i, filled, valid, n, hi, lo in _windows(x, window):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = filled.sum(axis=1) / n
+        mean = np.where(hi == lo, hi, mean)
+        out[i:i + len(n)] = np.where(n >= max(min_periods, 1), mean, np.nan)
+    return pd.Series(out, index=x.index)
+
+def rolling_std(x: pd.Series, window: int, min_periods: int = 1) -> pd.Series:
+    out = np.full(len(x), np.nan)
+    for i, filled, valid, n, hi, lo in _windows(x, window):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = filled.sum(axis=1) / n
+            dev = np.where(valid, filled - mean[:, None], 0.0)
+            var = (dev * dev).sum(axis=1) / (n - 1)
+        var = np.where(hi == lo, 0.0, var)
+        out[i:i + len(n)] = np.where((n >= max(min_periods, 1)) & (n > 1), np.sqrt(var), np.nan)
+    return pd.Series(out, index=x.index)
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# les modules du pipeline s'importent à plat (python src/<module>.py)
+sys.path.insert(0, str(ROOT / "src"))
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import align_bars, align_signal, bt_grid, run_bt_df
+
+HORIZONS = (1, 3, 10)
+
+@pytest.fixture(scope="module")
+def gappy():
+    rng = np.random.default_rng(1)
+    n = 2000
+    t0 = pd.date_range("2025-01-01", periods=n, freq="5s", tz="UTC")
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 5e-4, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    open_[rng.random(n) < 0.05] = np.nan
+    close[rng.random(n) < 0.02] = np.nan
+    df_c = pd.DataFrame({"t0": t0, "open": open_, "close": close})
+    df_s = pd.DataFrame({"t0": t0, "signal_candle": rng.choice([-1, 0, 1], n)})
+    mid = np.nan_to_num(close, nan=60000.0)
+    df_m = pd.DataFrame({"t0": t0, "mid": mid, "spread": mid * rng.uniform(0, 2e-4, n)})
+    return df_c, df_s, df_m
+
+@pytest.mark.parametrize("signal_lag", (0, 1))
+def test_bt_grid_matches_run_bt_with_nan_opens(gappy, signal_lag):
+    df_c, df_s, df_m = gappy
+    bars = align_bars(df_c, df_m)
+    grid = bt_grid(bars, align_signal(bars, df_s), HORIZONS, [signal_lag], fees_bp=0.5)
+    for h in HORIZONS:
+        row = grid[(grid["horizon"] == h) & (grid["signal_lag"] == signal_lag)].iloc[0]
+        _, st = run_bt_df(df_c, df_s, df_m, h, 0.5, signal_lag, n_boot=0)
+        assert row["n_trades"] == st["n_trades"]
+        for key in ("hit_rate", "avg_ret", "sharpe_like", "dir_hit_rate"):
+            assert row[key] == pytest.approx(st[key], rel=1e-9), (h, key)
+        assert {k: row[k] for k in ("tp", "tn", "fp", "fn")} == st["confusion"]
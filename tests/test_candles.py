@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from candles import build_candles
+
+@pytest.fixture(scope="module")
+def trades_csv(tmp_path_factory):
+    rng = np.random.default_rng(3)
+    n = 2000
+    # ~2 jours de trades avec des trous, horodatages à la microseconde
+    gaps = rng.exponential(40.0, n) * (1 + 200 * (rng.random(n) < 0.01))
+    ts = pd.Timestamp("2025-01-01T00:00:03Z") + pd.to_timedelta(np.cumsum(gaps), unit="s").round("us")
+    df = pd.DataFrame({
+        "timestamp": ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "price": np.round(60000 * np.exp(np.cumsum(rng.normal(0, 5e-4, n))), 1),
+        "volume": np.round(rng.exponential(0.05, n), 8),
+        "side": rng.choice(["buy", "sell"], n),
+    })
+    path = tmp_path_factory.mktemp("trades") / "trades.csv"
+    df.to_csv(path, index=False)
+    return path
+
+@pytest.mark.parametrize("dt", [1, 5, 7, 60, 3600, 18000])
+@pytest.mark.parametrize("flow", [False, True])
+def test_chunked_matches_in_memory(trades_csv, tmp_path, dt, flow):
+    full = tmp_path / "full.csv"
+    build_candles(str(trades_csv), str(full), dt, flow=flow)
+    ref = full.read_bytes()
+    assert not pd.read_csv(full)["t0"].duplicated().any()
+    for chunksize in (64, 333, 10_000):
+        out = tmp_path / f"chunk{chunksize}.csv"
+        build_candles(str(trades_csv), str(out), dt, chunksize=chunksize, flow=flow)
+        assert out.read_bytes() == ref, f"dt={dt} chunksize={chunksize}"
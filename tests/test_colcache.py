@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from colcache import CACHE_DIRNAME, read_csv_cached
+
+def _sample(n: int = 2000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t0 = pd.date_range("2024-01-01", periods=n, freq="5s", tz="UTC").strftime("%Y-%m-%dT%H:%M:%SZ")
+    return pd.DataFrame({"t0": t0, "close": rng.normal(100, 1, n).round(2),
+                         "n": rng.integers(0, 9, n), "side": rng.choice(["buy", "sell"], n)})
+
+def _read(path: str) -> float:
+    return float(read_csv_cached(path)["close"].sum())
+
+def test_read_csv_cached_matches_read_csv(tmp_path):
+    p = tmp_path / "bars.csv"
+    _sample().to_csv(p, index=False)
+    ref = pd.read_csv(p)
+    for _ in range(2):  # construction puis relecture du cache
+        df = read_csv_cached(p)
+        assert list(df.columns) == list(ref.columns)
+        pd.testing.assert_series_equal(df["t0"], pd.to_datetime(ref["t0"], utc=True).dt.as_unit("ns"))
+        np.testing.assert_array_equal(df["close"], ref["close"])
+        np.testing.assert_array_equal(df["n"], ref["n"])
+        assert list(df["side"].astype(str)) == list(ref["side"])
+
+def test_concurrent_builds_of_the_same_cache(tmp_path):
+    with ProcessPoolExecutor(max_workers=8) as pool:
+        for r in range(6):
+            p = tmp_path / f"bars{r}.csv"
+            df = _sample(seed=r)
+            df.to_csv(p, index=False)
+            sums = list(pool.map(_read, [str(p)] * 40))
+            assert sums == [float(pd.read_csv(p)["close"].sum())] * 40
+    leftovers = [d.name for d in (tmp_path / CACHE_DIRNAME).iterdir() if ".tmp" in d.name]
+    assert not leftovers
@@ -0,0 +1,28 @@
+"""Le serveur importe ses dépendances en paquet (uvicorn src.server:app): pas d'import à plat."""
+
+import importlib.util
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+SERVER_DEPS = ("src.candles", "src.patterns_candles", "src.simulator")
+
+def _import_as_package(*modules):
+    # sous-processus lancé depuis la racine, sans src/ dans sys.path
+    code = "import " + ", ".join(modules)
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+
+@pytest.mark.parametrize("module", SERVER_DEPS)
+def test_server_dependency_imports_as_package(module):
+    res = _import_as_package(module)
+    assert res.returncode == 0, res.stderr
+
+def test_server_imports_as_package():
+    for dep in ("fastapi", "pydantic", "websockets"):
+        if importlib.util.find_spec(dep) is None:
+            pytest.skip(f"{dep} non installé")
+    res = _import_as_package("src.server")
+    assert res.returncode == 0, res.stderr
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from l2_recorder import L2Recorder, OffTickPrice, load_book, read_l2, ts_to_ns
+
+def _lv(*pairs):
+    return [{"price": p, "qty": q} for p, q in pairs]
+
+def _record(path, tick_size, messages, checkpoint_every=3):
+    rec = L2Recorder(str(path), "BTC/USD", depth=10, tick_size=tick_size,
+                     checkpoint_every=checkpoint_every)
+    for typ, ts, bids, asks in messages:
+        rec.record(typ, ts, bids, asks)
+    rec.close()
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "book.l2"
+    messages = [
+        ("snapshot", "2025-01-01T00:00:00Z",
+         _lv((60000.5, 0.12345678), (60000.1, 1.5), (59999.9, 2.0)),
+         _lv((60000.6, 0.5), (60001.0, 3.25))),
+        ("update", "2025-01-01T00:00:01Z", _lv((60000.3, 0.75)), []),
+        ("update", "2025-01-01T00:00:02Z", _lv((60000.1, 0.0)), _lv((60000.7, 1.1))),
+        ("update", "2025-01-01T00:00:03Z", [], _lv((60000.6, 0.0))),
+        ("update", "2025-01-01T00:00:04Z", _lv((59999.8, 4.0)), []),
+    ]
+    _record(path, 0.1, messages)
+
+    hdr, blocks = read_l2(str(path))
+    assert hdr.tick_size == 0.1 and hdr.symbol == "BTC/USD"
+    assert len(list(blocks)) >= 2
+
+    book = load_book(str(path))
+    assert book.bids == {60000.5: 0.12345678, 60000.3: 0.75, 59999.9: 2.0, 59999.8: 4.0}
+    assert book.asks == {60000.7: 1.1, 60001.0: 3.25}
+
+    # état intermédiaire: avant le 3e message
+    mid = load_book(str(path), until_ns=1735689601 * 10**9)
+    assert mid.bids == {60000.5: 0.12345678, 60000.3: 0.75, 60000.1: 1.5, 59999.9: 2.0}
+    assert mid.asks == {60000.6: 0.5, 60001.0: 3.25}
+
+def test_off_tick_price_raises(tmp_path):
+    snap = ("snapshot", "2025-01-01T00:00:00Z", _lv((1.2345, 10.0)), _lv((1.2346, 5.0)))
+    with pytest.raises(OffTickPrice, match="tick_size"):
+        _record(tmp_path / "bad.l2", 0.1, [snap])
+    # même carnet avec le bon pas de prix
+    _record(tmp_path / "ok.l2", 0.0001, [snap])
+    book = load_book(str(tmp_path / "ok.l2"))
+    assert book.best() == ((1.2345, 10.0), (1.2346, 5.0))
+
+def test_off_tick_update_leaves_block_intact(tmp_path):
+    rec = L2Recorder(str(tmp_path / "book.l2"), "BTC/USD", depth=10, tick_size=0.5)
+    rec.record("snapshot", "2025-01-01T00:00:00Z", _lv((100.0, 1.0)), _lv((100.5, 1.0)))
+    with pytest.raises(OffTickPrice):
+        rec.record("update", "2025-01-01T00:00:01Z", _lv((99.5, 2.0)), _lv((100.25, 1.0)))
+    assert len(rec._px) == len(rec._qty) == sum(rec._nb) + sum(rec._na)
+    rec.close()
+
+@pytest.mark.parametrize("base", ["2025-01-01T00:00:00Z", "2261-01-01T00:00:00Z"])
+def test_ts_to_ns_is_exact(base):
+    # au-delà de 2**53 µs (2255) un passage par float perd des microsecondes
+    rng = np.random.default_rng(0)
+    stamps = pd.Timestamp(base) + pd.to_timedelta(rng.integers(0, 86400 * 10**6, 2000), unit="us")
+    for ts in stamps:
+        iso = ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        assert ts_to_ns(iso) == ts.value, iso
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from l2_recorder import L2Recorder
+from orderbook_l2 import L2Book
+from orderbook_replay import L2Replay
+
+DEPTH = 10
+TICK = 0.5
+
+def _levels(rng, mid, side, n, delete=0.0):
+    sign = -1 if side == "bids" else 1
+    ticks = rng.choice(np.arange(1, 30), size=n, replace=False)
+    qty = np.round(rng.exponential(0.5, n), 8)
+    qty[rng.random(n) < delete] = 0.0
+    return [{"price": mid + sign * t * TICK, "qty": float(q)} for t, q in zip(ticks, qty)]
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    """Fichier L2 de deltas aléatoires et, pour chaque message, le carnet de référence après lui."""
+    rng = np.random.default_rng(11)
+    path = tmp_path_factory.mktemp("l2") / "book.l2"
+    rec = L2Recorder(str(path), "BTC/USD", depth=DEPTH, tick_size=TICK, checkpoint_every=17)
+    ref = L2Book(depth=DEPTH)
+    t = pd.Timestamp("2025-01-01T00:00:00Z")
+    states = []
+    for k in range(600):
+        t += pd.Timedelta(microseconds=int(rng.choice([0, 1, 250, 100_000, 3_000_000])))
+        iso = t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        mid = 60000.0 + TICK * int(rng.integers(-4, 5))
+        if k == 0 or rng.random() < 0.01:
+            bids, asks = _levels(rng, mid, "bids", 15), _levels(rng, mid, "asks", 15)
+            rec.record("snapshot", iso, bids, asks)
+            ref.reset_snapshot(bids, asks)
+        else:
+            bids = _levels(rng, mid, "bids", int(rng.integers(0, 4)), delete=0.4)
+            asks = _levels(rng, mid, "asks", int(rng.integers(0, 4)), delete=0.4)
+            rec.record("update", iso, bids, asks)
+            ref.apply_update(bids, asks)
+        states.append((t.value, dict(ref.bids), dict(ref.asks)))
+    rec.close()
+    return path, states
+
+def _expected(states, ts_ns):
+    """Carnet après le dernier message de date <= ts_ns (vide avant le premier)."""
+    times = np.array([s[0] for s in states])
+    k = int(np.searchsorted(times, ts_ns, side="right")) - 1
+    return ({}, {}) if k < 0 else states[k][1:]
+
+def _query_times(states, rng):
+    times = np.array([s[0] for s in states])
+    between = times[:-1] + (np.diff(times) // 2)
+    return np.unique(np.concatenate([
+        times, between, times - 1,
+        rng.integers(times[0] - 10**9, times[-1] + 10**9, 300),
+    ]))
+
+def test_book_at_matches_reference(recorded):
+    path, states = recorded
+    rng = np.random.default_rng(1)
+    with L2Replay(str(path)) as rp:
+        assert len(rp.offsets) > 20  # plusieurs blocs: on traverse des checkpoints
+        for ts in rng.permutation(_query_times(states, rng)):
+            book = rp.book_at(int(ts))
+            assert (book.bids, book.asks) == _expected(states, int(ts)), ts
+
+def test_iter_times_matches_reference(recorded):
+    path, states = recorded
+    times = _query_times(states, np.random.default_rng(2))
+    with L2Replay(str(path)) as rp:
+        for ts, book in rp.iter_times(times):
+            assert (book.bids, book.asks) == _expected(states, ts), ts
+
+def test_iter_grid_matches_reference(recorded):
+    path, states = recorded
+    step = 700_000_000
+    with L2Replay(str(path)) as rp:
+        out = list(rp.iter_grid(step))
+        assert out[0][0] <= rp.start_ns and out[-1][0] <= rp.end_ns < out[-1][0] + step
+        assert np.all(np.diff([ts for ts, _ in out]) == step)
+        for ts, book in rp.iter_grid(step):
+            assert (book.bids, book.asks) == _expected(states, ts), ts
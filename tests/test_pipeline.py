@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from colcache import CACHE_DIRNAME, read_csv_cached
+from pipeline import Stage, run_stages
+
+def _produce(out: str) -> int:
+    n = 5000
+    pd.DataFrame({"t0": pd.date_range("2024-01-01", periods=n, freq="5s", tz="UTC")
+                  .strftime("%Y-%m-%dT%H:%M:%SZ"), "close": np.arange(n, dtype=float)}).to_csv(out, index=False)
+    return n
+
+def _consume(src: str, out: str) -> float:
+    total = float(read_csv_cached(src)["close"].sum())
+    pd.DataFrame({"total": [total]}).to_csv(out, index=False)
+    return total
+
+def _fail(src: str, out: str) -> None:
+    raise ValueError("boom")
+
+def _stages(tmp_path, n_consumers: int, consumer=_consume):
+    src = str(tmp_path / "bars.csv")
+    stages = [Stage("produce", _produce, outputs=[src], params={"out": src})]
+    for i in range(n_consumers):
+        out = str(tmp_path / f"out{i}.csv")
+        stages.append(Stage(f"consume_{i}", consumer, inputs=[src], outputs=[out],
+                            params={"src": src, "out": out}))
+    return stages
+
+def test_parallel_consumers_share_one_cache_build(tmp_path):
+    res = run_stages(_stages(tmp_path, 8), str(tmp_path / "manifest.json"), workers=4)
+    assert {res[f"consume_{i}"] for i in range(8)} == {float(sum(range(5000)))}
+    assert [d.name for d in (tmp_path / CACHE_DIRNAME).iterdir()] == ["bars.csv"]
+    assert run_stages(_stages(tmp_path, 8), str(tmp_path / "manifest.json"), workers=4) == res
+
+def test_parallel_failure_names_the_stage(tmp_path):
+    with pytest.raises(RuntimeError, match="consume_0"):
+        run_stages(_stages(tmp_path, 1, _fail), str(tmp_path / "manifest.json"), workers=2)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from portfolio import PairRisk, PortfolioSimulator
+from simulator import TradingSimulator
+
+RISK = dict(stop_loss_pct=0.01, take_profit_pct=0.02, trailing_stop_pct=0.01, max_holding_period=30,
+            position_scale=0.6)
+
+@pytest.fixture(scope="module")
+def pair_data():
+    rng = np.random.default_rng(5)
+    n = 3000
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    close[rng.integers(0, n, 10)] = np.nan
+    signal = rng.choice([-1, 0, 0, 0, 1], n)
+    micro = rng.normal(0, 0.5, n)
+    micro[rng.random(n) < 0.1] = np.nan
+    mom = rng.normal(0, 0.5, n)
+    mom[rng.random(n) < 0.05] = np.nan
+    return close, signal, micro, mom
+
+def test_one_pair_matches_run_batch(pair_data):
+    close, signal, micro, mom = pair_data
+    sim = TradingSimulator(fee_bps=5.0, max_leverage=2, **RISK)
+    _, ref = sim.run_batch(close, signal, micro, mom, record_history=False)
+    pf = PortfolioSimulator(["BTC/USD"], fee_bps=5.0, max_leverage=2, default_risk=PairRisk(**RISK))
+    _, trades = pf.run(close[:, None], signal[:, None], micro[:, None], mom[:, None])
+
+    assert len(trades) == len(ref) > 20
+    assert trades["action"].tolist() == ref["action"].tolist()
+    assert trades["reason"].tolist() == ref["reason"].tolist()
+    assert trades["t0"].tolist() == ref["t0"].tolist()
+    for col in ("price", "qty", "cash", "equity", "pnl"):
+        np.testing.assert_allclose(trades[col].to_numpy(float), ref[col].to_numpy(float), rtol=1e-9, atol=1e-9)
+    stats, expected = pf.summary(), sim.summary()
+    for k in ("win_rate", "profit_factor", "max_win_streak", "max_loss_streak"):
+        assert stats[k] == pytest.approx(expected[k], rel=1e-9), k
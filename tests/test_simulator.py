@@ -0,0 +1,182 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from simulator import TickRiskGuard, TradingSimulator, discard_spill_dir
+
+CONFIGS = [
+    dict(),
+    dict(allow_short=True, fee_bps=5.0, stop_loss_pct=0.01, take_profit_pct=0.02, trailing_stop_pct=0.01,
+         max_holding_period=30, position_scale=0.6, max_leverage=3),
+    dict(allow_short=True, fee_bps=1.0, stop_loss_pct=0.0, take_profit_pct=0.0, trailing_stop_pct=None,
+         max_holding_period=5, position_scale=1.5, max_leverage=1),
+]
+STATE = ("cash", "position", "avg_entry_price", "position_age", "_equity_peak", "_max_drawdown",
+         "_entry_high", "_entry_low", "_open_trade_equity", "_last_price")
+
+@pytest.fixture(scope="module")
+def candles():
+    rng = np.random.default_rng(3)
+    n = 3000
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    close[rng.integers(0, n, 10)] = np.nan
+    micro = rng.normal(0, 0.3, n)
+    micro[rng.integers(0, n, 10)] = np.nan
+    return pd.DataFrame({
+        "t0": pd.date_range("2025-01-01", periods=n, freq="5s", tz="UTC"),
+        "close": close,
+        "micro_score": micro,
+        "mom_signal": rng.choice([-1, 0, 1], n).astype(float),
+        "signal": rng.choice([-1, 0, 0, 0, 1], n),
+    })
+
+def _replay(cfg: dict, candles: pd.DataFrame) -> TradingSimulator:
+    sim = TradingSimulator(**cfg)
+    for (_, row), sig in zip(candles.iterrows(), candles["signal"]):
+        sim.on_candle(row, int(sig))
+    return sim
+
+def _batch(cfg: dict, candles: pd.DataFrame, **kwargs):
+    sim = TradingSimulator(**cfg)
+    res = sim.run_batch(candles["close"], candles["signal"], candles["micro_score"], candles["mom_signal"],
+                        candles["t0"], **kwargs)
+    return sim, res
+
+def _str_t0(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(t0=df["t0"].astype(str)).reset_index(drop=True)
+
+@pytest.mark.parametrize("cfg", CONFIGS)
+def test_run_batch_matches_on_candle(cfg, candles):
+    ref = _replay(cfg, candles)
+    sim, (history, trades) = _batch(cfg, candles)
+    assert len(trades) > 0
+    pd.testing.assert_frame_equal(_str_t0(history), _str_t0(ref.history_df()), check_dtype=False)
+    cols = list(trades.columns)
+    pd.testing.assert_frame_equal(_str_t0(trades), _str_t0(ref.trades_df()[cols]), check_dtype=False)
+    pd.testing.assert_frame_equal(sim.trades_df()[cols], ref.trades_df()[cols])
+    for name in STATE:
+        assert getattr(sim, name) == getattr(ref, name), name
+
+@pytest.mark.parametrize("cfg", CONFIGS)
+def test_run_batch_summary_matches_on_candle(cfg, candles):
+    expected = _replay(cfg, candles).summary()
+    for record_history in (True, False):
+        sim, (history, trades) = _batch(cfg, candles, record_history=record_history)
+        got = sim.summary()
+        assert (history is None) == (not record_history)
+        assert got["n_trades"] == len(trades) == expected["n_trades"]
+        assert got["last_trade_reason"] == expected["last_trade_reason"]
+        skip = {"recent_logs"}  # run_batch writes nothing to debug_logs
+        assert {k: v for k, v in got.items() if k not in skip} == {k: v for k, v in expected.items() if k not in skip}
+
+def test_run_batch_trades_spill_like_on_candle(candles, tmp_path):
+    cfg = dict(CONFIGS[1], trade_retention=50, spill_dir=str(tmp_path))
+    ref = _replay(cfg, candles)
+    sim, (_, trades) = _batch(cfg, candles, record_history=False)
+    assert sim.trades.spilled > 0
+    cols = list(trades.columns)
+    pd.testing.assert_frame_equal(sim.trades_df()[cols], ref.trades_df()[cols])
+
+def test_reader_sees_rows_as_of_its_creation(candles, tmp_path):
+    sim = TradingSimulator(**CONFIGS[1], history_retention=50, spill_dir=str(tmp_path))
+    rows = list(candles.iterrows())
+    for (_, row), sig in zip(rows[:700], candles["signal"][:700]):
+        sim.on_candle(row, int(sig))
+    expected = sim.history_df(500).copy()
+    read = sim.history.reader(500)
+    for (_, row), sig in zip(rows[700:], candles["signal"][700:]):  # spills again before the read
+        sim.on_candle(row, int(sig))
+    assert sim.history.spilled > 700
+    pd.testing.assert_frame_equal(read(), expected)
+
+@pytest.mark.parametrize("spill_dir", [None, "explicit"])
+def test_checkpoint_reattaches_spilled_rows(candles, tmp_path, spill_dir):
+    cfg = dict(CONFIGS[1], history_retention=40, trade_retention=10)
+    if spill_dir:
+        cfg["spill_dir"] = str(tmp_path)
+    sim = _replay(cfg, candles.iloc[:900])
+    assert sim.history.spilled and sim.trades.spilled
+    state = pickle.loads(pickle.dumps(sim.checkpoint()))
+    restored = TradingSimulator.from_checkpoint(state, history_retention=40, trade_retention=10,
+                                                spill_dir=cfg.get("spill_dir"))
+    pd.testing.assert_frame_equal(restored.history_df(), sim.history_df())
+    pd.testing.assert_frame_equal(restored.trades_df(), sim.trades_df())
+
+    # both keep going from the same state, the restored one spilling after the reattached chunks
+    for (_, row), sig in zip(candles.iloc[900:].iterrows(), candles["signal"].iloc[900:]):
+        sim.on_candle(row, int(sig))
+        restored.on_candle(row, int(sig))
+    pd.testing.assert_frame_equal(restored.history_df(), sim.history_df())
+    pd.testing.assert_frame_equal(restored.trades_df(), sim.trades_df())
+
+def test_checkpoint_without_segments_is_truncated(candles, tmp_path):
+    cfg = dict(CONFIGS[1], history_retention=40, spill_dir=str(tmp_path))
+    sim = _replay(cfg, candles.iloc[:900])
+    state = sim.checkpoint()
+    sim.close()  # segments gone: only the checkpointed rows can be read back
+    restored = TradingSimulator.from_checkpoint(state, history_retention=40, spill_dir=str(tmp_path))
+    assert len(restored.history) == len(sim.history)
+    assert len(restored.history_df()) == 40
+
+def test_spill_dirs_are_cleaned(candles, tmp_path):
+    cfg = dict(CONFIGS[1], history_retention=20, trade_retention=20)
+    tmp = _replay(cfg, candles)
+    assert Path(tmp.spill_dir).name.startswith("simulator_spill_") and any(Path(tmp.spill_dir).iterdir())
+    tmp.close()
+    assert not Path(tmp.spill_dir).exists()
+
+    shared = _replay(dict(cfg, spill_dir=str(tmp_path)), candles)
+    (tmp_path / "keep.txt").write_text("x")
+    discard_spill_dir(shared.spill_dir)
+    assert [p.name for p in tmp_path.iterdir()] == ["keep.txt"]
+
+def test_tick_guard_matches_on_tick_on_every_trade():
+    rng = np.random.default_rng(7)
+    n_candles, per = 300, 40
+    ticks = 60000 * np.exp(np.cumsum(rng.normal(0, 0.0004, n_candles * per)))
+    signals = rng.choice([-1, 0, 0, 1], n_candles)
+    cfg = dict(allow_short=True, fee_bps=5.0, stop_loss_pct=0.004, take_profit_pct=0.006,
+               trailing_stop_pct=0.003, max_holding_period=20)
+    direct, guarded, guard = TradingSimulator(**cfg), TradingSimulator(**cfg), TickRiskGuard()
+    for c in range(n_candles):
+        block = ticks[c * per:(c + 1) * per]
+        row = pd.Series({"t0": f"c{c:05d}", "close": block[0]})
+        direct.on_candle(row, int(signals[c]))
+        guard.on_candle(guarded, row, int(signals[c]))
+        for j, price in enumerate(block[1:].tolist()):
+            direct.on_tick(price, f"c{c:05d}.{j}")
+            if guard.check(price):
+                guard.exit(guarded, price, f"c{c:05d}.{j}")
+    assert guarded.trades_df()["reason"].str.endswith("_tick").any()
+    pd.testing.assert_frame_equal(direct.trades_df(), guarded.trades_df())
+    pd.testing.assert_frame_equal(direct.history_df(), guarded.history_df())
+
+class _RearmingPrice(float):
+    """Tick price that re-arms the guard in the middle of check(), like a candle on another thread."""
+
+    def __new__(cls, value, guard, sim):
+        obj = super().__new__(cls, value)
+        obj.guard, obj.sim, obj.calls = guard, sim, 0
+        return obj
+
+    def __gt__(self, other):
+        self.calls += 1
+        if self.calls == 2:  # after check() has read the armed state
+            self.guard.arm(self.sim)
+        return float(self) > other
+
+def test_tick_guard_check_racing_arm_keeps_new_extreme():
+    old = TradingSimulator(trailing_stop_pct=0.01)
+    old.on_candle(pd.Series({"t0": "a", "close": 100.0}), 1)
+    new = TradingSimulator(trailing_stop_pct=0.01)
+    new.on_candle(pd.Series({"t0": "a", "close": 150.0}), 1)
+    guard = TickRiskGuard()
+    guard.arm(old)
+    assert not guard.check(_RearmingPrice(120.0, guard, new))
+    # the tick was checked against the old position: the new trailing high stays 150,
+    # so 125 breaches the new 1% trailing stop instead of becoming the high
+    assert guard.check(125.0)
+    assert guard.exit(new, 125.0) == "trailing_stop"
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from backtest import align_bars
+from walk_forward import fold_bounds, fold_scores, walk_forward
+
+def _data(n: int = 1200, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    t0 = pd.Series(pd.date_range("2025-01-01", periods=n, freq="5s", tz="UTC"))
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 5e-4, n)))
+    df_c = pd.DataFrame({"t0": t0, "open": np.r_[close[0], close[:-1]], "close": close})
+    depth_vol = rng.uniform(0.5, 2.0, n)
+    depth_vol[rng.random(n) < 0.2] = np.nan
+    depth_vol[rng.random(n) < 0.05] = 0.0
+    df_m = pd.DataFrame({
+        "t0": t0, "mid": close, "spread": close * 1e-4, "depth_imb": rng.normal(0, 0.3, n),
+        "depth_trend": rng.normal(0, 1, n), "depth_vol": depth_vol, "ofi_z": rng.normal(0, 1, n),
+        "mid_ret_3": rng.normal(0, 1e-3, n), "depth_ema_fast": rng.normal(0, 0.5, n),
+    })
+    return align_bars(df_c, df_m), df_m
+
+def test_fold_scores_do_not_see_the_test_period():
+    bars, df_m = _data()
+    bounds = fold_bounds(bars.t0, "30min", "10min")
+    a, b, c = bounds[0]
+    before = fold_scores(bars, df_m, bounds)[0][0]
+
+    shifted = df_m.copy()
+    later = shifted["t0"] >= bars.t0.iloc[b]
+    shifted.loc[later, "depth_vol"] = shifted.loc[later, "depth_vol"] * 100  # médiane globale changée
+    after = fold_scores(bars, shifted, bounds)[0][0]
+    np.testing.assert_array_equal(before[:b - a], after[:b - a])
+
+def test_walk_forward_is_identical_across_workers():
+    bars, df_m = _data()
+    kwargs = dict(taus=(0.2, 1.0), max_spreads=(5.0,), min_trades=1)
+    f1, s1 = walk_forward(bars, df_m, "30min", "10min", **kwargs)
+    f2, s2 = walk_forward(bars, df_m, "30min", "10min", workers=2, **kwargs)
+    pd.testing.assert_frame_equal(f1, f2)
+    assert s1 == s2